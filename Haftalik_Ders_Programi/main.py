@@ -1,29 +1,514 @@
-import pyodbc
-import openpyxl
-import pandas as pd
+import os
+import sys
+import math
+import time
+import random
+import bisect
+import queue
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
+# pandas, openpyxl ve veritabanı sürücüleri yalnızca ihtiyaç duyan fonksiyonların içinde yüklenir,
+# böylece menü gibi komutlar ağır kütüphaneleri yüklemeden açılır
 
-def get_connection(database=None):
-    connection_string = (
-        'DRIVER={ODBC Driver 17 for SQL Server};'
-        'SERVER=DESKTOP-5QE6TBQ\SQLEXPRESS;'
-        + (f'DATABASE={database};' if database else '') +
-        'Trusted_Connection=yes;'
+DATABASE_NAME = 'DersProgramiDB'
+
+# Tablo tanımları iki motorda ortaktır; {identity} otomatik artan birincil anahtar, {references} sütun
+# düzeyindeki yabancı anahtar yazımıdır ve motorun SQL_DIALECTS kaydıyla doldurulur
+TABLES = {
+    "Fakulte": """
+    CREATE TABLE Fakulte (
+        id {identity},
+        fakulte_adi NVARCHAR(255) NOT NULL UNIQUE
+    )
+    """,
+    "Bolumler": """
+    CREATE TABLE Bolumler (
+        id {identity},
+        fakulte_id INT {references} Fakulte(id),
+        fakulte_adi NVARCHAR(255) NOT NULL {references} Fakulte(fakulte_adi),
+        bolum_adi NVARCHAR(255) NOT NULL UNIQUE
+    )
+    """,
+    "OgretimGorevlileri": """
+    CREATE TABLE OgretimGorevlileri (
+        id {identity},
+        fakulte_id INT {references} Fakulte(id),
+        ogretim_gorevlisi NVARCHAR(255) NOT NULL UNIQUE,
+        pazartesi NVARCHAR(255),
+        sali NVARCHAR(255),
+        carsamba NVARCHAR(255),
+        persembe NVARCHAR(255),
+        cuma NVARCHAR(255)
+    )
+    """,
+    "Ogrenciler": """
+    CREATE TABLE Ogrenciler (
+        id {identity},
+        fakulte_id INT {references} Fakulte(id),
+        bolum_id INT {references} Bolumler(id),
+        bolum_adi NVARCHAR(255) NOT NULL {references} Bolumler(bolum_adi),
+        sinif INT NOT NULL,
+        numara NVARCHAR(50) UNIQUE NOT NULL
+    )
+    """,
+    "Dersler": """
+    CREATE TABLE Dersler (
+        id {identity},
+        fakulte_id INT,
+        bolum_id INT,
+        sinif INT NOT NULL,
+        ders_kodu NVARCHAR(50) NOT NULL,
+        ders_adi NVARCHAR(255) NOT NULL,
+        ogretim_uyesi_id INT,
+        haftalik_saat INT NOT NULL,
+        online NVARCHAR(255),
+        zorunlu_saat NVARCHAR(255),
+        statu NVARCHAR(10) CHECK (statu IN ('LAB', 'NORMAL')),
+        FOREIGN KEY (fakulte_id) REFERENCES Fakulte(id) ON DELETE SET NULL,
+        FOREIGN KEY (bolum_id) REFERENCES Bolumler(id) ON DELETE SET NULL,
+        FOREIGN KEY (ogretim_uyesi_id) REFERENCES OgretimGorevlileri(id) ON DELETE SET NULL
+    )
+    """,
+    "OgrenciDers": """
+    CREATE TABLE OgrenciDers (
+        id {identity},
+        ogrenci_id INT,
+        ogrenci_num NVARCHAR(50),
+        ders_id INT,
+        FOREIGN KEY (ogrenci_id) REFERENCES Ogrenciler(id) ON DELETE CASCADE,
+        FOREIGN KEY (ogrenci_num) REFERENCES Ogrenciler(numara) ON DELETE NO ACTION,
+        FOREIGN KEY (ders_id) REFERENCES Dersler(id) ON DELETE CASCADE
+    )
+    """,
+    "Derslikler": """
+    CREATE TABLE Derslikler (
+        id {identity},
+        derslik_id NVARCHAR(50) UNIQUE NOT NULL,
+        kapasite INT NOT NULL,
+        statu NVARCHAR(10) CHECK (statu IN ('LAB', 'NORMAL'))
     )
-    conn = pyodbc.connect(connection_string)
-    conn.autocommit = True  
-    return conn
+    """,
+    "AktarimManifest": """
+    CREATE TABLE AktarimManifest (
+        asama NVARCHAR(100) PRIMARY KEY,
+        dosya NVARCHAR(400) NOT NULL,
+        dosya_hash CHAR(64) NOT NULL
+    )
+    """,
+    "AktarimSatirHash": """
+    CREATE TABLE AktarimSatirHash (
+        asama NVARCHAR(100) NOT NULL,
+        satir_anahtari NVARCHAR(300) NOT NULL,
+        satir_hash CHAR(64) NOT NULL,
+        PRIMARY KEY (asama, satir_anahtari)
+    )
+    """
+}
+
+SQL_DIALECTS = {
+    "mssql": {"identity": "INT IDENTITY(1,1) PRIMARY KEY", "references": "FOREIGN KEY REFERENCES"},
+    "sqlite": {"identity": "INTEGER PRIMARY KEY AUTOINCREMENT", "references": "REFERENCES"},
+}
+
+
+def build_tables(dialect):
+    return {table_name: table_query.format(**SQL_DIALECTS[dialect]) for table_name, table_query in TABLES.items()}
+
+
+SQLSERVER_TABLES = build_tables("mssql")
+SQLITE_TABLES = build_tables("sqlite")
+
+
+# İki motorda da aynı yazılan indeksler; tablolar oluşturulduktan sonra eksik olanlar eklenir
+INDEXES = {
+    # Öğrenci bazlı öz-birleştirme (ders çakışma grafiği) ve öğrenci-ders varlık kontrolleri için
+    "IX_OgrenciDers_ogrenci": "CREATE INDEX IX_OgrenciDers_ogrenci ON OgrenciDers (ogrenci_id, ders_id)",
+    "IX_OgrenciDers_ders": "CREATE INDEX IX_OgrenciDers_ders ON OgrenciDers (ders_id, ogrenci_id)",
+}
+
+# Veritabanı motoruna özgü işlemleri (bağlantı, şema, id döndüren INSERT, geçici tablo) toplayan arayüz
+# Geri kalan sorgular iki motorda da çalışan ortak SQL ve ? parametreleriyle yazılmıştır
+class Storage(ABC):
+    name = None
+    tables = {}
+    IntegrityError = Exception
+    Error = Exception
+
+    @abstractmethod
+    def connect(self, database=None):
+        pass
+
+    @abstractmethod
+    def database_exists(self):
+        pass
+
+    @abstractmethod
+    def create_database(self):
+        pass
+
+    @abstractmethod
+    def table_exists(self, table_name, conn):
+        pass
+
+    @abstractmethod
+    def index_exists(self, index_name, conn):
+        pass
+
+    # INSERT sorgusunu çalıştırıp eklenen satırın id'sini döndürür
+    @abstractmethod
+    def insert_and_get_id(self, cursor, table, columns, values):
+        pass
+
+    # Bağlantıya özel geçici tablo oluşturur ve sorgularda kullanılacak adını döndürür
+    @abstractmethod
+    def create_temp_table(self, cursor, name, columns):
+        pass
+
+    # executemany ile toplu ekleme yapılacak imleci hazırlar
+    def prepare_bulk_cursor(self, cursor):
+        return cursor
+
+    # Otomatik commit'i kapatıp açık bir işlem başlatır
+    @abstractmethod
+    def begin_transaction(self, conn):
+        pass
+
+    # İşlem commit veya rollback edildikten sonra bağlantıyı otomatik commit'e döndürür
+    def end_transaction(self, conn):
+        pass
+
+    def create_tables(self):
+        conn = self.connect(database=DATABASE_NAME)
+        cursor = conn.cursor()
+
+        for table_name, table_query in self.tables.items():
+            if self.table_exists(table_name, conn):
+                print(f"{table_name} tablosu zaten mevcut.")
+            else:
+                cursor.execute(table_query)
+
+        for index_name, index_query in INDEXES.items():
+            if not self.index_exists(index_name, conn):
+                cursor.execute(index_query)
+
+        conn.commit()
+        conn.close()
+
+
+# Windows sunucusundaki SQL Server veritabanı (ODBC Driver 17)
+class SqlServerStorage(Storage):
+    name = "mssql"
+    tables = SQLSERVER_TABLES
+
+    def __init__(self, server=None):
+        import pyodbc
+
+        self.pyodbc = pyodbc
+        self.IntegrityError = pyodbc.IntegrityError
+        self.Error = pyodbc.Error
+        self.server = server or os.environ.get("DERS_PROGRAMI_SERVER", r"DESKTOP-5QE6TBQ\SQLEXPRESS")
+
+    def connect(self, database=None):
+        connection_string = (
+            'DRIVER={ODBC Driver 17 for SQL Server};'
+            f'SERVER={self.server};'
+            + (f'DATABASE={database};' if database else '') +
+            'Trusted_Connection=yes;'
+        )
+        conn = self.pyodbc.connect(connection_string)
+        conn.autocommit = True
+        return conn
+
+    def database_exists(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT name FROM sys.databases WHERE name = ?", (DATABASE_NAME,))
+        exists = cursor.fetchone()
+        conn.close()
+        return exists is not None
+
+    def create_database(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f"CREATE DATABASE {DATABASE_NAME}")
+        conn.commit()
+        conn.close()
+
+    def table_exists(self, table_name, conn):
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES 
+            WHERE TABLE_NAME = ?
+        """, (table_name,))
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, index_name, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM sys.indexes WHERE name = ?", (index_name,))
+        return cursor.fetchone()[0] > 0
+
+    def insert_and_get_id(self, cursor, table, columns, values):
+        placeholders = ", ".join("?" * len(columns))
+        cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) OUTPUT INSERTED.id VALUES ({placeholders})",
+                       values)
+        return cursor.fetchone()[0]
+
+    def create_temp_table(self, cursor, name, columns):
+        cursor.execute(f"CREATE TABLE #{name} ({columns})")
+        return f"#{name}"
+
+    def prepare_bulk_cursor(self, cursor):
+        cursor.fast_executemany = True
+        return cursor
+
+    # autocommit kapalıyken pyodbc ilk sorguyla birlikte işlemi kendisi başlatır
+    def begin_transaction(self, conn):
+        conn.autocommit = False
+
+    def end_transaction(self, conn):
+        conn.autocommit = True
+
+
+# Süreç içinde çalışan tek dosyalık SQLite veritabanı; Linux toplu iş makinelerinde ve CI'da
+# sunucu gerektirmeden aynı şema ile çalışır
+class SQLiteStorage(Storage):
+    name = "sqlite"
+    tables = SQLITE_TABLES
+
+    def __init__(self, path=None):
+        import sqlite3
+
+        self.sqlite3 = sqlite3
+        self.IntegrityError = sqlite3.IntegrityError
+        self.Error = sqlite3.Error
+        self.path = path or os.environ.get("DERS_PROGRAMI_SQLITE", f"{DATABASE_NAME}.sqlite3")
+
+    # Dosya tabanlı veritabanında sunucu/veritabanı ayrımı olmadığı için database parametresi yok sayılır
+    def connect(self, database=None):
+        # isolation_level=None SQL Server tarafındaki autocommit davranışıyla aynıdır,
+        # cached_statements ise aynı sorgunun hazırlanmış halini bağlantı boyunca yeniden kullanır.
+        # Havuzdaki bağlantılar farklı iş parçacıklarına verilebildiği için check_same_thread kapatılır
+        conn = self.sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=256,
+                                    check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def database_exists(self):
+        return os.path.exists(self.path)
+
+    def create_database(self):
+        self.connect().close()
+
+    def table_exists(self, table_name, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+        return cursor.fetchone()[0] > 0
+
+    def index_exists(self, index_name, conn):
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,))
+        return cursor.fetchone()[0] > 0
+
+    def insert_and_get_id(self, cursor, table, columns, values):
+        placeholders = ", ".join("?" * len(columns))
+        cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})", values)
+        return cursor.lastrowid
+
+    def create_temp_table(self, cursor, name, columns):
+        cursor.execute(f"CREATE TEMP TABLE {name} ({columns})")
+        return name
+
+    # isolation_level=None ile açılan bağlantıda işlem açıkça başlatılır. IMMEDIATE yazma kilidini baştan
+    # alır; paralel aşamalar kilit yükseltmede hata almak yerine timeout süresince sırasını bekler
+    def begin_transaction(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+
+
+_storage = None
+
+
+# Havuzdan alınan tek bir bağlantı üzerinde yapılan işlemler
+# Aynı SQL metni için imleç saklanır; pyodbc aynı imleçte tekrarlanan sorgunun hazırlanmış halini,
+# SQLite ise bağlantının ifade önbelleğini kullandığı için sorgu yeniden derlenmez
+class Session:
+    MAX_CACHED_STATEMENTS = 128
+
+    def __init__(self, pool, connection):
+        self.pool = pool
+        self.connection = connection
+        self.last_used = time.monotonic()
+        self._cursors = {}
+
+    def execute(self, sql, params=()):
+        cursor = self._cursors.get(sql)
+        if cursor is None:
+            if len(self._cursors) >= self.MAX_CACHED_STATEMENTS:
+                self._cursors.clear()
+            cursor = self._cursors[sql] = self.connection.cursor()
+        cursor.execute(sql, params)
+        self.last_used = time.monotonic()
+        return cursor
+
+    def cursor(self):
+        self.last_used = time.monotonic()
+        return self.connection.cursor()
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    # Uzun süre boşta kalan bağlantı havuzdan verilmeden önce basit bir sorguyla sınanır
+    def is_healthy(self, health_check_interval):
+        if time.monotonic() - self.last_used < health_check_interval:
+            return True
+        try:
+            self.connection.cursor().execute("SELECT 1").fetchall()
+            self.last_used = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    def discard(self):
+        self._cursors.clear()
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+    # Bağlantıyı kapatmak yerine havuza geri verir
+    def close(self):
+        self.pool.release(self)
+
+
+# Sınırlı sayıda bağlantıyı açık tutup işlemler arasında yeniden kullanan havuz
+class ConnectionPool:
+    def __init__(self, storage, database=DATABASE_NAME, size=4, health_check_interval=30.0, timeout=60.0):
+        self.storage = storage
+        self.database = database
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"{self.timeout} saniye içinde havuzdan bağlantı alınamadı (havuz boyutu: {self.size}).")
+
+        try:
+            while True:
+                try:
+                    session = self._idle.get_nowait()
+                except queue.Empty:
+                    return Session(self, self.storage.connect(database=self.database))
+
+                if session.is_healthy(self.health_check_interval):
+                    return session
+                session.discard()
+        except Exception:
+            self._slots.release()
+            raise
+
+    # Hatalı bağlantılar havuza geri konmaz, yerine ihtiyaç olduğunda yenisi açılır
+    def release(self, session, broken=False):
+        if broken:
+            session.discard()
+        else:
+            self._idle.put(session)
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().discard()
+            except queue.Empty:
+                break
+
+
+POOL_SIZE = int(os.environ.get("DERS_PROGRAMI_POOL_SIZE", "4"))
+POOL_HEALTH_CHECK_INTERVAL = 30.0
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def configure_pool(size=None, health_check_interval=None):
+    global POOL_SIZE, POOL_HEALTH_CHECK_INTERVAL
+    if size is not None:
+        POOL_SIZE = size
+    if health_check_interval is not None:
+        POOL_HEALTH_CHECK_INTERVAL = health_check_interval
+    close_pools()
+
+
+def get_pool(database=DATABASE_NAME):
+    with _pools_lock:
+        if database not in _pools:
+            _pools[database] = ConnectionPool(get_storage(), database, POOL_SIZE, POOL_HEALTH_CHECK_INTERVAL)
+        return _pools[database]
+
+
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+# Verilen oturumu kullanır, verilmemişse havuzdan bir oturum alıp işlem bitince geri verir
+# Böylece bir işlem boyunca çağrılan tüm yardımcı fonksiyonlar aynı bağlantıyı paylaşabilir
+@contextmanager
+def db_session(session=None, database=DATABASE_NAME):
+    if session is not None:
+        yield session
+        return
+
+    session = get_pool(database).acquire()
+    broken = False
+    try:
+        yield session
+    except BaseException:
+        try:
+            session.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        session.pool.release(session, broken)
+
+
+# Kullanılacak veritabanı motorunu seçer; varsayılan DERS_PROGRAMI_DB ortam değişkeni, o da yoksa SQL Server'dır
+def configure_storage(backend=None, sqlite_path=None, server=None):
+    global _storage
+    backend = backend or os.environ.get("DERS_PROGRAMI_DB", "mssql")
+
+    close_pools()
+    if backend == "sqlite":
+        _storage = SQLiteStorage(sqlite_path)
+    elif backend == "mssql":
+        _storage = SqlServerStorage(server)
+    else:
+        raise ValueError(f"Bilinmeyen veritabanı motoru: {backend}")
+    return _storage
+
+
+def get_storage():
+    return _storage or configure_storage()
+
+
+def get_connection(database=None):
+    return get_storage().connect(database)
 
 
 def database_exists():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sys.databases WHERE name = 'DersProgramiDB'")
-    exists = cursor.fetchone()
-    conn.close()
-    return exists is not None
+    return get_storage().database_exists()
 
 
 def create_database():
@@ -31,1120 +516,1802 @@ def create_database():
         print("DersProgramiDB zaten mevcut.")
         return
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("CREATE DATABASE DersProgramiDB")
-    conn.commit()
-    conn.close()
+    get_storage().create_database()
     print("DersProgramiDB oluşturuldu.")
 
 
 def table_exists(table_name, conn):
-    cursor = conn.cursor()
-    cursor.execute(f"""
-        SELECT COUNT(*) FROM INFORMATION_SCHEMA.TABLES 
-        WHERE TABLE_NAME = '{table_name}'
-    """)
-    return cursor.fetchone()[0] > 0
+    return get_storage().table_exists(table_name, conn)
 
 
 def create_tables():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-
-    tables = {
-        "Fakulte": """
-        CREATE TABLE Fakulte (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            fakulte_adi NVARCHAR(255) NOT NULL UNIQUE
-        )
-        """,
-        "Bolumler": """
-        CREATE TABLE Bolumler (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            fakulte_id INT FOREIGN KEY REFERENCES Fakulte(id),
-            fakulte_adi NVARCHAR(255) NOT NULL FOREIGN KEY REFERENCES Fakulte(fakulte_adi),
-            bolum_adi NVARCHAR(255) NOT NULL UNIQUE
-        )
-        """,
-        "OgretimGorevlileri": """
-        CREATE TABLE OgretimGorevlileri (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            fakulte_id INT FOREIGN KEY REFERENCES Fakulte(id),
-            ogretim_gorevlisi NVARCHAR(255) NOT NULL UNIQUE,
-            pazartesi NVARCHAR(255),
-            sali NVARCHAR(255),
-            carsamba NVARCHAR(255),
-            persembe NVARCHAR(255),
-            cuma NVARCHAR(255)
-        )
-        """,
-        "Ogrenciler": """
-        CREATE TABLE Ogrenciler (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            fakulte_id INT FOREIGN KEY REFERENCES Fakulte(id),
-            bolum_id INT FOREIGN KEY REFERENCES Bolumler(id),
-            bolum_adi NVARCHAR(255) NOT NULL FOREIGN KEY REFERENCES Bolumler(bolum_adi),
-            sinif INT NOT NULL,
-            numara NVARCHAR(50) UNIQUE NOT NULL
-        )
-        """,
-        "Dersler": """
-        CREATE TABLE Dersler (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            fakulte_id INT,
-            bolum_id INT,
-            sinif INT NOT NULL,
-            ders_kodu NVARCHAR(50) NOT NULL,
-            ders_adi NVARCHAR(255) NOT NULL,
-            ogretim_uyesi_id INT,
-            haftalik_saat INT NOT NULL,
-            online NVARCHAR(255),
-            zorunlu_saat NVARCHAR(255),
-            statu NVARCHAR(10) CHECK (statu IN ('LAB', 'NORMAL')),
-            FOREIGN KEY (fakulte_id) REFERENCES Fakulte(id) ON DELETE SET NULL,
-            FOREIGN KEY (bolum_id) REFERENCES Bolumler(id) ON DELETE SET NULL,
-            FOREIGN KEY (ogretim_uyesi_id) REFERENCES OgretimGorevlileri(id) ON DELETE SET NULL
-        )
-        """,
-        "OgrenciDers": """
-        CREATE TABLE OgrenciDers (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            ogrenci_id INT,
-            ogrenci_num NVARCHAR(50),
-            ders_id INT,
-            FOREIGN KEY (ogrenci_id) REFERENCES Ogrenciler(id) ON DELETE CASCADE,
-            FOREIGN KEY (ogrenci_num) REFERENCES Ogrenciler(numara) ON DELETE NO ACTION,
-            FOREIGN KEY (ders_id) REFERENCES Dersler(id) ON DELETE CASCADE
-        )
-        """,
-        "Derslikler": """
-        CREATE TABLE Derslikler (
-            id INT IDENTITY(1,1) PRIMARY KEY,
-            derslik_id NVARCHAR(50) UNIQUE NOT NULL,
-            kapasite INT NOT NULL,
-            statu NVARCHAR(10) CHECK (statu IN ('LAB', 'NORMAL'))
-        )
-        """
-    }
-
-    for table_name, table_query in tables.items():
-        if table_exists(table_name, conn):
-            print(f"{table_name} tablosu zaten mevcut.")
-        else:
-            cursor.execute(table_query)
-
-    conn.commit()
-    conn.close()
+    get_storage().create_tables()
     print("Tablo oluşturma işlemi tamamlandı.")
 
-create_database()
-create_tables()
 
+def insert_and_get_id(cursor, table, columns, values):
+    return get_storage().insert_and_get_id(cursor, table, columns, values)
+
+
+IMPORT_BATCH_SIZE = int(os.environ.get("DERS_PROGRAMI_IMPORT_BATCH_SIZE", "5000"))
+IMPORT_ATOMIC = False
+
+
+def configure_import(batch_size=None, atomic=None):
+    global IMPORT_BATCH_SIZE, IMPORT_ATOMIC
+    if batch_size is not None:
+        IMPORT_BATCH_SIZE = batch_size
+    if atomic is not None:
+        IMPORT_ATOMIC = atomic
+
+
+# İçe aktarma aşamalarında her satırın ayrı işlem olması yerine satırları toplu işlemlerde commit eder
+# batch_size satırda bir commit edilir, hata olursa yalnızca açık olan parti geri alınır.
+# atomic açıksa aşamanın tamamı tek işlemdir; hata durumunda aşama hiç çalışmamış gibi geri alınır.
+# Açık partide IngestContext eşlemelerine eklenen anahtarlar track ile kaydedilir ve geri almada silinir; böylece
+# paralel aşamalar geri alınmış kayıtların id'lerini kullanmaz
+class ImportTransaction:
+    def __init__(self, conn, batch_size=None, atomic=None):
+        self.conn = conn
+        self.storage = get_storage()
+        self.batch_size = IMPORT_BATCH_SIZE if batch_size is None else batch_size
+        self.atomic = IMPORT_ATOMIC if atomic is None else atomic
+        self.pending = 0
+        self.committed = 0
+        self.added = []  # açık partide eşlemelere eklenen (eşleme, anahtar) çiftleri
+
+    def __enter__(self):
+        self.storage.begin_transaction(self.conn)
+        return self
+
+    # Satırları sırayla verir; satır, döngü gövdesi (yazma dahil) bittikten sonra partiye sayılır
+    def rows(self, rows):
+        for row in rows:
+            yield row
+            self.row_done()
+
+    def track(self, mapping, key):
+        self.added.append((mapping, key))
+
+    def _commit(self):
+        self.conn.commit()
+        self.committed += self.pending
+        self.pending = 0
+        self.added = []
+
+    def row_done(self, count=1):
+        self.pending += count
+        if not self.atomic and self.batch_size and self.pending >= self.batch_size:
+            self._commit()
+            self.storage.begin_transaction(self.conn)
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self._commit()
+            else:
+                self.conn.rollback()
+                for mapping, key in reversed(self.added):
+                    if isinstance(mapping, set):
+                        mapping.discard(key)
+                    else:
+                        mapping.pop(key, None)
+                self.added = []
+                kept = "aşamadaki hiçbir değişiklik kaydedilmedi" if self.atomic else \
+                    f"önceki partilerdeki {self.committed} satır kaydedildi"
+                print(f"Hata: son işlem geri alındı ({self.pending} satır), {kept}.")
+        finally:
+            self.storage.end_transaction(self.conn)
+        return False
 
-students_file = 'Ogrenciler.xlsx'
-# Fakülteler tablosuna veri eklemek için fonksiyon
-def insert_faculties_from_excel(students_file):
-    df = pd.read_excel(students_file)
-    faculties = df['Fakülte'].unique()
 
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+# Excel'den gelen değeri veritabanındaki metin anahtar biçimine çevirir (240502001.0 -> '240502001')
+def excel_text(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
 
-    for faculty in faculties:
-        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", faculty)
-        if cursor.fetchone() is None:
-            cursor.execute("INSERT INTO Fakulte (fakulte_adi) VALUES (?)", faculty)
-        else:
-            print(f"{faculty} fakültesi zaten mevcut.")
 
-    conn.commit()
-    conn.close()
-    print("Fakülte ekleme işlemleri tamamlandı.")
+# Boş hücre kontrolü; pandas NaN ve openpyxl/csv'den gelen None değerlerini birlikte kapsar
+def is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
 
 
-# Bölümler tablosuna veri eklemek için fonksiyon
-def insert_departments_from_excel(students_file):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-
-    df = pd.read_excel(students_file)
-    departments = df[['Fakülte', 'Bölüm']].drop_duplicates()
-
-    for index, row in departments.iterrows():
-        faculty = row['Fakülte']
-        department = row['Bölüm']
-
-        # Fakülte ID'sini al
-        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", faculty)
-        faculty_id = cursor.fetchone()
-
-        if faculty_id:
-            faculty_id = faculty_id[0]
-            cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", department, faculty_id)
-            if cursor.fetchone() is None:
-                cursor.execute("INSERT INTO Bolumler (fakulte_id, fakulte_adi, bolum_adi) VALUES (?, ?, ?)",
-                               faculty_id, faculty, department)
-            else:
-                print(f"{department} bölümü zaten mevcut.")
-        else:
-            print(f"{faculty} fakültesi bulunamadı.")
+EXCEL_CACHE_DIR = ".excel_cache"
+_workbook_cache = {}  # dosya yolu -> ((mtime, boyut), DataFrame)
 
-    conn.commit()
-    conn.close()
-    print("Fakülte ekleme işlemleri tamamlandı.")
 
+# Excel dosyasını çalıştırma başına bir kez ayrıştırır, sonraki aşamalar bellekteki kopyayı kullanır
+# save_columnar açıksa ayrıştırılmış tablo .excel_cache altına yazılır, dosya değişmedikçe sonraki
+# çalıştırmalar openpyxl ile ayrıştırmak yerine bu kopyayı okur
+def read_excel_cached(path, save_columnar=True):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
 
-# Öğrencileri Excel'den okuyup veritabanına ekleyen fonksiyon
-def insert_students_from_excel(students_file):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-
-    df = pd.read_excel(students_file)
-
-    for index, row in df.iterrows():
-        faculty_name = row['Fakülte']
-        department_name = row['Bölüm']
-        student_class = row['Sınıf']
-        student_number = row['Numara']
-
-        # Fakülte ID'sini al
-        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", faculty_name)
-        faculty_id = cursor.fetchone()
-
-        # Bölüm ID'sini al
-        cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", department_name,
-                       faculty_id[0] if faculty_id else None)
-        department_id = cursor.fetchone()
-
-        if faculty_id and department_id:
-            faculty_id = faculty_id[0]
-            department_id = department_id[0]
-
-            # Öğrenci zaten var mı kontrol et
-            cursor.execute("SELECT id FROM Ogrenciler WHERE numara = ?", student_number)
-            if cursor.fetchone() is None:
-                cursor.execute("""
-                    INSERT INTO Ogrenciler (fakulte_id, bolum_id, bolum_adi, sinif, numara) 
-                    VALUES (?, ?, ?, ?, ?)
-                """, faculty_id, department_id, department_name, student_class, student_number)
-            else:
-                print(f"{student_number} numaralı öğrenci zaten mevcut.")
-        else:
-            print(f"{faculty_name} fakültesi veya {department_name} bölümü bulunamadı.")
-    conn.commit()
-    conn.close()
-    print("Öğrenci ekleme işlemleri tamamlandı.")
+    cached = _workbook_cache.get(path)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, _load_excel_frame(path, stamp, save_columnar))
+        _workbook_cache[path] = cached
 
-insert_faculties_from_excel(students_file)  # Fakülteleri eklemek için
-insert_departments_from_excel(students_file)  # Bölümleri eklemek için
-insert_students_from_excel(students_file)  # Öğrencileri eklemek için
+    # Aşamalar DataFrame'i değiştirebildiği için her çağrıya kopya verilir
+    return cached[1].copy()
 
 
-faculty_members_file = 'OgretimUyeleri.xlsx'
-# Öğretim üyelerini Excel'den okuyup veritabanına ekleyen fonksiyon
-def insert_faculty_members_from_excel(faculty_members_file):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-
-    df = pd.read_excel(faculty_members_file)
-    df.columns = df.columns.str.strip()
-
-    for column in ['Pazartesi', 'Salı', 'Çarşamba', 'Perşembe', 'Cuma']:
-        df[column] = df[column].fillna('')
-
-        # Fakülteleri veritabanına ekle
-    for _, row in df.iterrows():
-        faculty_name = row['Fakülte']
-        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (faculty_name,))
-        faculty_id = cursor.fetchone()
-
-        # Eğer fakülte veritabanında yoksa ekle
-        if faculty_id is None:
-            cursor.execute("INSERT INTO Fakulte (fakulte_adi) VALUES (?)", (faculty_name,))
-            faculty_id = cursor.lastrowid
-            print(f"{faculty_name} fakültesi veritabanına eklendi.")
-        else:
-            faculty_id = faculty_id[0]
+def _load_excel_frame(path, stamp, save_columnar):
+    import pandas as pd
 
-        teacher_name = row['Öğretim Görevlisi']
+    try:
+        import pyarrow  # noqa: F401  Feather için gerekli, yoksa pickle kullanılır
+        extension = "feather"
+    except ImportError:
+        extension = "pkl"
+
+    cache_dir = os.path.join(os.path.dirname(path), EXCEL_CACHE_DIR)
+    base_name = os.path.basename(path)
+    cache_file = os.path.join(cache_dir, f"{base_name}.{stamp[0]}-{stamp[1]}.{extension}")
+
+    if save_columnar and os.path.exists(cache_file):
+        try:
+            return pd.read_feather(cache_file) if extension == "feather" else pd.read_pickle(cache_file)
+        except Exception as e:
+            print(f"Uyarı: {cache_file} önbelleği okunamadı, Excel yeniden ayrıştırılıyor: {e}")
+
+    df = pd.read_excel(path)
+
+    if save_columnar:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Aynı dosyanın eski önbellek kopyalarını temizle
+            for name in os.listdir(cache_dir):
+                if name.startswith(base_name + "."):
+                    os.remove(os.path.join(cache_dir, name))
+            if extension == "feather":
+                df.to_feather(cache_file)
+            else:
+                df.to_pickle(cache_file)
+        except Exception as e:
+            print(f"Uyarı: {base_name} için önbellek yazılamadı: {e}")
 
-        # Aynı öğretim görevlisinin zaten veritabanında olup olmadığını kontrol et
-        cursor.execute("""
-            SELECT COUNT(*) FROM OgretimGorevlileri 
-            WHERE fakulte_id = ? AND ogretim_gorevlisi = ?
-        """, (faculty_id, teacher_name))
-        existing_record_count = cursor.fetchone()[0]
-
-        if existing_record_count == 0:
-            monday = str(row['Pazartesi'])
-            tuesday = str(row['Salı'])
-            wednesday = str(row['Çarşamba'])
-            thursday = str(row['Perşembe'])
-            friday = str(row['Cuma'])
+    return df
 
-            cursor.execute("""
-                INSERT INTO OgretimGorevlileri (fakulte_id, ogretim_gorevlisi, pazartesi, sali, carsamba, persembe, cuma)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (faculty_id, teacher_name, monday, tuesday, wednesday, thursday, friday))
 
-        else:
-            print(f"{teacher_name} öğretim görevlisi zaten mevcut.")
+STREAM_CHUNK_SIZE = 5000
 
-    conn.commit()
-    conn.close()
-    print("Öğretim görevlileri başarıyla eklendi.")
 
-insert_faculty_members_from_excel(faculty_members_file)  # Öğretim üyelerini eklemek için
+# Büyük tabloları belleğe almadan okur; istenen sütunların değerlerini chunk_size satırlık listeler halinde verir
+# .csv dosyaları csv modülüyle, Excel dosyaları openpyxl'in salt okunur moduyla satır satır ayrıştırılır
+def iter_table_chunks(path, columns, chunk_size=None):
+    chunk_size = chunk_size or STREAM_CHUNK_SIZE
+    if path.lower().endswith(".csv"):
+        rows = _iter_csv_rows(path)
+    else:
+        rows = _iter_xlsx_rows(path)
 
+    header = [str(name).strip() if name is not None else "" for name in next(rows, [])]
+    missing = [name for name in columns if name not in header]
+    if missing:
+        rows.close()
+        raise KeyError(f"{path} dosyasında sütun bulunamadı: {', '.join(missing)}")
+    positions = [header.index(name) for name in columns]
 
-classroom_file = 'Derslikler.xlsx'
-# Derslikleri Excel'den okuyup veritabanına ekleyen fonksiyon
-def insert_classrooms_from_excel(clasroom_file):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    chunk = []
+    for row in rows:
+        if not any(value not in (None, "") for value in row):
+            continue
+        chunk.append(tuple(row[i] if i < len(row) else None for i in positions))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
 
-    df = pd.read_excel(clasroom_file)
-    df.columns = df.columns.str.strip()
 
-    # Derslikleri veritabanına ekle
-    for _, row in df.iterrows():
-        classroom_id = row['Derslik_ID']
-        capacity = row['Kapasite']
-        status = row['Statü']
+def _iter_csv_rows(path):
+    import csv
 
-        # Aynı derslik ID'sinin zaten veritabanında olup olmadığını kontrol et
-        cursor.execute("SELECT COUNT(*) FROM Derslikler WHERE derslik_id = ?", (classroom_id,))
-        existing_record_count = cursor.fetchone()[0]
+    # Excel'in CSV çıktısı BOM ile başlayabilir
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            yield [value if value != "" else None for value in row]
 
-        # Eğer mevcut değilse ekle
-        if existing_record_count == 0:
-            cursor.execute("""
-                INSERT INTO Derslikler (derslik_id, kapasite, statu)
-                VALUES (?, ?, ?)
-            """, (classroom_id, capacity, status))
-        else:
-            print(f"{classroom_id} dersliği zaten mevcut.")
 
-    conn.commit()
-    conn.close()
-    print("Derslik ekleme işlemleri tamamlandı.")
+def _iter_xlsx_rows(path):
+    from openpyxl import load_workbook
 
-insert_classrooms_from_excel(classroom_file)  # Derslikleri eklemek için
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+# İçe aktarma boyunca boyut tablolarının ad -> id eşlemelerini bellekte tutar
+# Her tablo bir kez okunur, yeni eklenen kayıtların id'leri de eşlemelere yazılır
+class IngestContext:
+    def __init__(self):
+        self.faculties = {}  # fakulte_adi -> id
+        self.departments = {}  # bolum_adi -> id
+        self.department_faculties = {}  # bolum id -> fakulte_id
+        self.instructors = {}  # ogretim_gorevlisi -> id
+        self.students = {}  # numara -> id
+        self.classrooms = set()  # derslik_id
+        self.courses = {}  # (bolum_id, sinif, ders_kodu, ders_adi) -> id
+        self.course_names = {}  # ders_adi -> aynı isimli derslerin ilk id'si
+        self.enrollments = None  # (ogrenci_id, ders_id) çiftleri, gerektiğinde yüklenir
+
+    def load(self, cursor):
+        cursor.execute("SELECT id, fakulte_adi FROM Fakulte")
+        self.faculties = {name: row_id for row_id, name in cursor.fetchall()}
+
+        cursor.execute("SELECT id, fakulte_id, bolum_adi FROM Bolumler")
+        for row_id, faculty_id, name in cursor.fetchall():
+            self.departments[name] = row_id
+            self.department_faculties[row_id] = faculty_id
+
+        # Adlar Excel'deki baştaki/sondaki boşluklardan arındırılarak eşlenir; aynı adın ilk kaydı kullanılır
+        cursor.execute("SELECT id, ogretim_gorevlisi FROM OgretimGorevlileri ORDER BY id")
+        for row_id, name in cursor.fetchall():
+            self.instructors.setdefault(name.strip(), row_id)
+
+        cursor.execute("SELECT id, numara FROM Ogrenciler")
+        self.students = {numara: row_id for row_id, numara in cursor.fetchall()}
+
+        cursor.execute("SELECT derslik_id FROM Derslikler")
+        self.classrooms = {row[0] for row in cursor.fetchall()}
+
+        cursor.execute("SELECT id, bolum_id, sinif, ders_kodu, ders_adi FROM Dersler")
+        self.courses = {(bolum_id, sinif, code, name): row_id
+                        for row_id, bolum_id, sinif, code, name in cursor.fetchall()}
+        for (_, _, _, name), row_id in sorted(self.courses.items(), key=lambda item: item[1], reverse=True):
+            self.course_names[name] = row_id
+        return self
+
+    def load_enrollments(self, cursor):
+        if self.enrollments is None:
+            cursor.execute("SELECT ogrenci_id, ders_id FROM OgrenciDers")
+            self.enrollments = {tuple(row) for row in cursor.fetchall()}
+        return self.enrollments
+
+    # Öğretim üyesi yoksa yalnızca adıyla ekler ve id'sini döndürür
+    def instructor_id(self, cursor, instructor_name, faculty_id=None, transaction=None):
+        instructor_name = instructor_name.strip()
+        if instructor_name not in self.instructors:
+            self.instructors[instructor_name] = insert_and_get_id(
+                cursor, "OgretimGorevlileri", ["fakulte_id", "ogretim_gorevlisi"], (faculty_id, instructor_name))
+            if transaction is not None:
+                transaction.track(self.instructors, instructor_name)
+        return self.instructors[instructor_name]
+
+
+def load_ingest_context(session=None):
+    with db_session(session) as session:
+        return IngestContext().load(session.cursor())
 
 
-courses_file = "Dersler.xlsx"
-def insert_courses_from_excel(courses_file):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+students_file = 'Ogrenciler.xlsx'
+# Fakülteler tablosuna veri eklemek için fonksiyon
+# Fakültenin adından başka alanı olmadığı için upsert var olan fakülteyi olduğu gibi bırakır
+def insert_faculties_from_excel(students_file, context=None, rows=None, upsert=False, session=None):
+    df = read_excel_cached(students_file) if rows is None else rows
+    faculties = df['Fakülte'].unique()
 
-    df = pd.read_excel(courses_file)
+    with db_session(session) as session:
+        cursor = session.cursor()
+        context = context or IngestContext().load(cursor)
 
-    # Online ve Statü sütunlarını kontrol et eğer boşsa varsayılan değerler ata
-    if 'Online' in df.columns:
-        df['Online'].fillna('Hayır', inplace=True)
-    else:
-        df['Online'] = 'Hayır'
+        with ImportTransaction(session.connection) as transaction:
+            for faculty in transaction.rows(faculties):
+                if faculty not in context.faculties:
+                    context.faculties[faculty] = insert_and_get_id(cursor, "Fakulte", ["fakulte_adi"], (faculty,))
+                    transaction.track(context.faculties, faculty)
+                elif not upsert:
+                    print(f"{faculty} fakültesi zaten mevcut.")
 
-    if 'Statü' in df.columns:
-        df['Statü'].fillna('NORMAL', inplace=True)
-        # Eğer statü LAB ya da NORMAL değilse, 'NORMAL' olarak değiştir
-        df['Statü'] = df['Statü'].apply(lambda x: x if x in ['LAB', 'NORMAL'] else 'NORMAL')
-    else:
-        df['Statü'] = 'NORMAL'
-
-    df['Haftalık Saat'] = pd.to_numeric(df['Haftalık Saat'], errors='coerce').fillna(0).astype(int)
-    df['Zorunlu Saat'] = df['Zorunlu Saat'].fillna('0').astype(str)
-    for index, row in df.iterrows():
-        # Fakülte ID'sini bul
-        cursor.execute("SELECT id FROM fakulte WHERE fakulte_adi = ?", (row['Fakülte'],))
-        fakulte_id = cursor.fetchone()
-        fakulte_id = fakulte_id[0] if fakulte_id else None
-
-        # Bölüm ID'sini bul
-        cursor.execute("SELECT id FROM bolumler WHERE bolum_adi = ?", (row['Bölüm'],))
-        bolum_id = cursor.fetchone()
-        bolum_id = bolum_id[0] if bolum_id else None
-
-        # Öğretim Üyesi ID ve adı al
-        cursor.execute("SELECT id FROM ogretimgorevlileri WHERE ogretim_gorevlisi = ?", (row['Öğretim Üyesi'],))
-        ogretim_uyesi = cursor.fetchone()
+    print("Fakülte ekleme işlemleri tamamlandı.")
 
-        # Eğer öğretim üyesi yoksa yeni öğretim üyesini ekle
-        if ogretim_uyesi is None:
-            cursor.execute("""
-                INSERT INTO ogretimgorevlileri (ogretim_gorevlisi) 
-                VALUES (?)
-            """, (row['Öğretim Üyesi'],))
-            conn.commit()
-            cursor.execute("SELECT id FROM ogretimgorevlileri WHERE ogretim_gorevlisi = ?", (row['Öğretim Üyesi'],))
-            ogretim_uyesi = cursor.fetchone()
 
-        ogretim_uyesi_id = ogretim_uyesi[0]
-        online = True if str(row['Online']).strip().lower() == "evet" else False
+# Bölümler tablosuna veri eklemek için fonksiyon
+# Fakültesi bulunamadığı için eklenemeyen satırların indekslerini döndürür
+def insert_departments_from_excel(students_file, context=None, rows=None, upsert=False, session=None):
+    failed = []
+    with db_session(session) as session:
+        cursor = session.cursor()
+        context = context or IngestContext().load(cursor)
+
+        df = read_excel_cached(students_file) if rows is None else rows
+        departments = df[['Fakülte', 'Bölüm']].drop_duplicates()
+
+        with ImportTransaction(session.connection) as transaction:
+            for index, row in transaction.rows(departments.iterrows()):
+                faculty = row['Fakülte']
+                department = row['Bölüm']
+
+                # Fakülte ID'sini al
+                faculty_id = context.faculties.get(faculty)
+
+                if faculty_id:
+                    if department not in context.departments:
+                        department_id = insert_and_get_id(
+                            cursor, "Bolumler", ["fakulte_id", "fakulte_adi", "bolum_adi"],
+                            (faculty_id, faculty, department))
+                        context.departments[department] = department_id
+                        context.department_faculties[department_id] = faculty_id
+                        transaction.track(context.departments, department)
+                        transaction.track(context.department_faculties, department_id)
+                    elif upsert:
+                        department_id = context.departments[department]
+                        cursor.execute("UPDATE Bolumler SET fakulte_id = ?, fakulte_adi = ? WHERE id = ?",
+                                       (faculty_id, faculty, department_id))
+                        context.department_faculties[department_id] = faculty_id
+                    else:
+                        print(f"{department} bölümü zaten mevcut.")
+                else:
+                    print(f"{faculty} fakültesi bulunamadı.")
+                    failed.append(index)
 
-        # Dersin var olup olmadığını kontrol et
-        cursor.execute("""
-            SELECT id FROM Dersler 
-            WHERE bolum_id = ? AND sinif = ? AND ders_kodu = ? AND ders_adi = ?
-        """, (bolum_id, row['Sınıf'], row['Ders Kodu'], row['Ders Adı']))
-        existing_course = cursor.fetchone()
+    print("Fakülte ekleme işlemleri tamamlandı.")
+    return failed
 
-        if existing_course:
-            print(f"Ders '{row['Ders Adı']}' ({row['Ders Kodu']}) zaten var, işlem atlandı.")
-            continue
 
-        # Dersler tablosuna ekleme
-        cursor.execute("""
-            INSERT INTO Dersler (fakulte_id, bolum_id, sinif, ders_kodu, ders_adi, ogretim_uyesi_id, haftalik_saat, online, zorunlu_saat, statu)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (fakulte_id, bolum_id, row['Sınıf'], row['Ders Kodu'], row['Ders Adı'],
-              ogretim_uyesi_id, row['Haftalık Saat'], online, row['Zorunlu Saat'], row['Statü']))
-
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print("Ders ekleme işlemleri tamamlandı.")
+# Öğrencileri Excel'den okuyup veritabanına ekleyen fonksiyon
+# Fakültesi veya bölümü bulunamadığı için eklenemeyen satırların indekslerini döndürür
+def insert_students_from_excel(students_file, context=None, rows=None, upsert=False, session=None):
+    failed = []
+    with db_session(session) as session:
+        cursor = session.cursor()
+        context = context or IngestContext().load(cursor)
+
+        df = read_excel_cached(students_file) if rows is None else rows
+
+        with ImportTransaction(session.connection) as transaction:
+            for index, row in transaction.rows(df.iterrows()):
+                faculty_name = row['Fakülte']
+                department_name = row['Bölüm']
+                student_class = row['Sınıf']
+                student_number = excel_text(row['Numara'])
+
+                # Fakülte ve bölüm ID'lerini al
+                faculty_id = context.faculties.get(faculty_name)
+                department_id = context.departments.get(department_name)
+
+                if faculty_id and department_id and context.department_faculties.get(department_id) == faculty_id:
+                    # Öğrenci zaten var mı kontrol et
+                    if student_number not in context.students:
+                        context.students[student_number] = insert_and_get_id(
+                            cursor, "Ogrenciler", ["fakulte_id", "bolum_id", "bolum_adi", "sinif", "numara"],
+                            (faculty_id, department_id, department_name, student_class, student_number))
+                        transaction.track(context.students, student_number)
+                    elif upsert:
+                        cursor.execute("""
+                            UPDATE Ogrenciler SET fakulte_id = ?, bolum_id = ?, bolum_adi = ?, sinif = ?
+                            WHERE id = ?
+                        """, (faculty_id, department_id, department_name, student_class,
+                              context.students[student_number]))
+                    else:
+                        print(f"{student_number} numaralı öğrenci zaten mevcut.")
+                else:
+                    print(f"{faculty_name} fakültesi veya {department_name} bölümü bulunamadı.")
+                    failed.append(index)
 
-insert_courses_from_excel(courses_file)  # Dersleri eklemek için
+    print("Öğrenci ekleme işlemleri tamamlandı.")
+    return failed
 
 
-students_file = "Ogrenci_Ders.xlsx"
-def insert_students_from_excel(students_file):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+faculty_members_file = 'OgretimUyeleri.xlsx'
+# Öğretim üyelerini Excel'den okuyup veritabanına ekleyen fonksiyon
+def insert_faculty_members_from_excel(faculty_members_file, context=None, rows=None, upsert=False, session=None):
+    with db_session(session) as session:
+        cursor = session.cursor()
+        context = context or IngestContext().load(cursor)
+
+        df = read_excel_cached(faculty_members_file) if rows is None else rows
+        df.columns = df.columns.str.strip()
+
+        for column in ['Pazartesi', 'Salı', 'Çarşamba', 'Perşembe', 'Cuma']:
+            df[column] = df[column].fillna('')
+
+            # Fakülteleri veritabanına ekle
+        with ImportTransaction(session.connection) as transaction:
+            for _, row in transaction.rows(df.iterrows()):
+                faculty_name = row['Fakülte']
+                faculty_id = context.faculties.get(faculty_name)
+
+                # Eğer fakülte veritabanında yoksa ekle
+                if faculty_id is None:
+                    faculty_id = insert_and_get_id(cursor, "Fakulte", ["fakulte_adi"], (faculty_name,))
+                    context.faculties[faculty_name] = faculty_id
+                    transaction.track(context.faculties, faculty_name)
+                    print(f"{faculty_name} fakültesi veritabanına eklendi.")
+
+                teacher_name = row['Öğretim Görevlisi'].strip()
+
+                monday = str(row['Pazartesi'])
+                tuesday = str(row['Salı'])
+                wednesday = str(row['Çarşamba'])
+                thursday = str(row['Perşembe'])
+                friday = str(row['Cuma'])
+
+                # Aynı öğretim görevlisinin zaten veritabanında olup olmadığını kontrol et
+                if teacher_name not in context.instructors:
+                    context.instructors[teacher_name] = insert_and_get_id(
+                        cursor, "OgretimGorevlileri",
+                        ["fakulte_id", "ogretim_gorevlisi", "pazartesi", "sali", "carsamba", "persembe", "cuma"],
+                        (faculty_id, teacher_name, monday, tuesday, wednesday, thursday, friday))
+                    transaction.track(context.instructors, teacher_name)
+
+                elif upsert:
+                    cursor.execute("""
+                        UPDATE OgretimGorevlileri
+                        SET fakulte_id = ?, pazartesi = ?, sali = ?, carsamba = ?, persembe = ?, cuma = ?
+                        WHERE id = ?
+                    """, (faculty_id, monday, tuesday, wednesday, thursday, friday, context.instructors[teacher_name]))
+
+                else:
+                    print(f"{teacher_name} öğretim görevlisi zaten mevcut.")
 
-    df = pd.read_excel(students_file)
+    print("Öğretim görevlileri başarıyla eklendi.")
 
-    for index, row in df.iterrows():
-        numara = row['Numara']
-        ders_adi = row['Ders Adı']
 
-        # Ogrenci tablosundan ogrenci_id ve ogrenci_num al
-        cursor.execute("SELECT id, numara FROM Ogrenciler WHERE numara = ?", (numara,))
-        ogrenci = cursor.fetchone()
+classroom_file = 'Derslikler.xlsx'
+# Derslikleri Excel'den okuyup veritabanına ekleyen fonksiyon
+def insert_classrooms_from_excel(clasroom_file, context=None, rows=None, upsert=False, session=None):
+    with db_session(session) as session:
+        cursor = session.cursor()
+        context = context or IngestContext().load(cursor)
+
+        df = read_excel_cached(clasroom_file) if rows is None else rows
+        df.columns = df.columns.str.strip()
+
+        # Derslikleri veritabanına ekle
+        with ImportTransaction(session.connection) as transaction:
+            for _, row in transaction.rows(df.iterrows()):
+                classroom_id = excel_text(row['Derslik_ID'])
+                capacity = row['Kapasite']
+                status = row['Statü']
+
+                # Aynı derslik ID'sinin zaten veritabanında olup olmadığını kontrol et
+                if classroom_id not in context.classrooms:
+                    cursor.execute("""
+                        INSERT INTO Derslikler (derslik_id, kapasite, statu)
+                        VALUES (?, ?, ?)
+                    """, (classroom_id, capacity, status))
+                    context.classrooms.add(classroom_id)
+                    transaction.track(context.classrooms, classroom_id)
+                elif upsert:
+                    cursor.execute("UPDATE Derslikler SET kapasite = ?, statu = ? WHERE derslik_id = ?",
+                                   (capacity, status, classroom_id))
+                else:
+                    print(f"{classroom_id} dersliği zaten mevcut.")
 
-        if ogrenci:
-            ogrenci_id = ogrenci[0]
-            ogrenci_num = ogrenci[1]
-        else:
-            print(f"Hata: {numara} numaralı öğrenci bulunamadı.")
-            continue
+    print("Derslik ekleme işlemleri tamamlandı.")
 
-            # Dersler tablosundan ders_id al
-        cursor.execute("SELECT id FROM Dersler WHERE ders_adi = ?", (ders_adi,))
-        ders = cursor.fetchone()
 
-        if ders:
-            ders_id = ders[0]
-        else:
-            print(f"Hata: {ders_adi} adlı ders bulunamadı.")
-            continue
+courses_file = "Dersler.xlsx"
+# Fakültesi veya bölümü bulunamadığı için eklenemeyen satırların indekslerini döndürür
+def insert_courses_from_excel(courses_file, context=None, rows=None, upsert=False, session=None):
+    import pandas as pd
 
-            # Eğer öğrenci-ders ilişkisi zaten varsa işlemi atla
-        cursor.execute("""
-            SELECT id FROM OgrenciDers 
-            WHERE ogrenci_id = ? AND ogrenci_num = ? AND ders_id = ?
-        """, (ogrenci_id, ogrenci_num, ders_id))
-        existing_record = cursor.fetchone()
+    failed = []
+    with db_session(session) as session:
+        cursor = session.cursor()
+        context = context or IngestContext().load(cursor)
 
-        if existing_record:
-            continue
+        df = read_excel_cached(courses_file) if rows is None else rows
 
-        # OgrenciDers tablosuna ekleme yap
-        cursor.execute("""
-            INSERT INTO OgrenciDers (ogrenci_id, ogrenci_num, ders_id) 
-            VALUES (?, ?, ?)
-        """, (ogrenci_id, ogrenci_num, ders_id))
+        # Online ve Statü sütunlarını kontrol et eğer boşsa varsayılan değerler ata
+        if 'Online' in df.columns:
+            df['Online'] = df['Online'].fillna('Hayır')
+        else:
+            df['Online'] = 'Hayır'
 
-    conn.commit()
-    cursor.close()
-    conn.close()
-    print("OgrenciDers ekleme işlemleri tamamlandı.")
+        if 'Statü' in df.columns:
+            df['Statü'] = df['Statü'].fillna('NORMAL')
+            # Eğer statü LAB ya da NORMAL değilse, 'NORMAL' olarak değiştir
+            df['Statü'] = df['Statü'].apply(lambda x: x if x in ['LAB', 'NORMAL'] else 'NORMAL')
+        else:
+            df['Statü'] = 'NORMAL'
+
+        df['Haftalık Saat'] = pd.to_numeric(df['Haftalık Saat'], errors='coerce').fillna(0).astype(int)
+        df['Zorunlu Saat'] = df['Zorunlu Saat'].fillna('0').astype(str)
+        with ImportTransaction(session.connection) as transaction:
+            for index, row in transaction.rows(df.iterrows()):
+                # Fakülte ve bölüm ID'lerini bul
+                fakulte_id = context.faculties.get(row['Fakülte'])
+                bolum_id = context.departments.get(row['Bölüm'])
+                if fakulte_id is None or bolum_id is None:
+                    print(f"Ders '{row['Ders Adı']}' için {row['Fakülte']} fakültesi veya {row['Bölüm']} bölümü "
+                          f"bulunamadı.")
+                    failed.append(index)
+                    continue
+
+                # Öğretim Üyesi ID'sini al, yoksa yeni öğretim üyesini ekle
+                ogretim_uyesi_id = context.instructor_id(cursor, row['Öğretim Üyesi'], transaction=transaction)
+                online = True if str(row['Online']).strip().lower() == "evet" else False
+
+                # Dersin var olup olmadığını kontrol et
+                course_key = (bolum_id, int(row['Sınıf']), row['Ders Kodu'], row['Ders Adı'])
+                if course_key in context.courses:
+                    if upsert:
+                        cursor.execute("""
+                            UPDATE Dersler
+                            SET fakulte_id = ?, ogretim_uyesi_id = ?, haftalik_saat = ?, online = ?, zorunlu_saat = ?, statu = ?
+                            WHERE id = ?
+                        """, (fakulte_id, ogretim_uyesi_id, row['Haftalık Saat'], online, row['Zorunlu Saat'],
+                              row['Statü'], context.courses[course_key]))
+                    else:
+                        print(f"Ders '{row['Ders Adı']}' ({row['Ders Kodu']}) zaten var, işlem atlandı.")
+                    continue
+
+                # Dersler tablosuna ekleme
+                context.courses[course_key] = insert_and_get_id(
+                    cursor, "Dersler",
+                    ["fakulte_id", "bolum_id", "sinif", "ders_kodu", "ders_adi", "ogretim_uyesi_id", "haftalik_saat",
+                     "online", "zorunlu_saat", "statu"],
+                    (fakulte_id, bolum_id, row['Sınıf'], row['Ders Kodu'], row['Ders Adı'],
+                     ogretim_uyesi_id, row['Haftalık Saat'], online, row['Zorunlu Saat'], row['Statü']))
+                transaction.track(context.courses, course_key)
+                if row['Ders Adı'] not in context.course_names:
+                    context.course_names[row['Ders Adı']] = context.courses[course_key]
+                    transaction.track(context.course_names, row['Ders Adı'])
+
+        cursor.close()
+    print("Ders ekleme işlemleri tamamlandı.")
+    return failed
+
+
+student_courses_file = "Ogrenci_Ders.xlsx"
+# Öğrenci-ders kayıtlarını küme tabanlı olarak toplu ekleyen fonksiyon
+# Tüm sayfa tek seferde geçici tabloya yazılır, eşleştirme ve ekleme tek sorguda yapılır
+# Öğrenci-ders çiftinde güncellenecek başka alan olmadığı için upsert yalnızca eklemedir
+def insert_student_courses_bulk_from_excel(student_courses_file, context=None, rows=None, upsert=False,
+                                           session=None):
+    storage = get_storage()
+    with db_session(session) as session:
+        cursor = storage.prepare_bulk_cursor(session.cursor())
+
+        columns = ['Numara', 'Ders Adı']
+        if rows is None:
+            # Dosya tamamen belleğe alınmaz, okunan her parça hemen ara tabloya yazılır
+            chunks = iter_table_chunks(student_courses_file, columns)
+        else:
+            values = list(rows[columns].itertuples(index=False, name=None))
+            chunks = (values[start:start + STREAM_CHUNK_SIZE] for start in range(0, len(values), STREAM_CHUNK_SIZE))
+
+        staging = storage.create_temp_table(cursor, "OgrenciDersAktarim", "numara NVARCHAR(50), ders_adi NVARCHAR(255)")
+
+        # Aynı isimli birden fazla ders varsa satır satır eklemedeki gibi ilk kayıt kullanılır
+        course_lookup = "(SELECT ders_adi, MIN(id) AS id FROM Dersler GROUP BY ders_adi)"
+
+        total_rows = 0
+        try:
+            with ImportTransaction(session.connection) as transaction:
+                # Boş hücreler NULL olarak yazılır ve eşleşmeyen satırlar arasında sayılır
+                for chunk in chunks:
+                    # Excel'de sayı olarak okunan numaraları veritabanındaki metin biçimine çevir
+                    staged_rows = [(None if is_missing(numara) else excel_text(numara),
+                                    None if is_missing(ders_adi) else str(ders_adi)) for numara, ders_adi in chunk]
+                    cursor.executemany(f"INSERT INTO {staging} (numara, ders_adi) VALUES (?, ?)", staged_rows)
+                    total_rows += len(staged_rows)
+                    transaction.row_done(len(staged_rows))
+
+                cursor.execute(f"""
+                    SELECT COUNT(*) FROM {staging} a
+                    LEFT JOIN Ogrenciler o ON o.numara = a.numara
+                    LEFT JOIN {course_lookup} d ON d.ders_adi = a.ders_adi
+                    WHERE o.id IS NULL OR d.id IS NULL
+                """)
+                unresolved = cursor.fetchone()[0]
+
+                # Yalnızca olmayan öğrenci-ders çiftlerini ekle
+                cursor.execute(f"""
+                    INSERT INTO OgrenciDers (ogrenci_id, ogrenci_num, ders_id)
+                    SELECT DISTINCT o.id, o.numara, d.id
+                    FROM {staging} a
+                    JOIN Ogrenciler o ON o.numara = a.numara
+                    JOIN {course_lookup} d ON d.ders_adi = a.ders_adi
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM OgrenciDers od
+                        WHERE od.ogrenci_id = o.id AND od.ders_id = d.id
+                    )
+                """)
+                inserted = cursor.rowcount
+                duplicates = total_rows - unresolved - inserted
+        finally:
+            # Havuza geri verilen bağlantıda geçici tablo kalmasın diye işlem geri alınsa da silinir
+            cursor.execute(f"DROP TABLE {staging}")
+        cursor.close()
+
+    # Bellekteki öğrenci-ders çiftleri artık eski, gerektiğinde yeniden yüklenir
+    if context is not None:
+        context.enrollments = None
+
+    print(f"OgrenciDers toplu ekleme tamamlandı: {inserted} eklendi, {duplicates} zaten mevcut/tekrarlı, "
+          f"{unresolved} eşleşmeyen satır.")
+    return {"inserted": inserted, "duplicates": duplicates, "unresolved": unresolved}
+
+
+# İçe aktarma aşamaları; her aşama okuduğu dosyayı, satır anahtarını oluşturan sütunları ve
+# satır hash'ine giren sütunları (None ise tüm sütunlar) tanımlar. Yükleyiciler yazamadıkları satırların
+# indekslerini döndürür, bu satırların hash'i kaydedilmez.
+# stream açık aşamalar satır hash'i tutmaz, değişen dosyayı belleğe almadan parça parça aktarır.
+# depends, aşamanın başlamadan önce tamamlanması gereken aşamalardır
+IMPORT_STAGES = [
+    {"name": "Fakulte", "file": "Ogrenciler.xlsx", "loader": insert_faculties_from_excel,
+     "key_columns": ["Fakülte"], "columns": ["Fakülte"], "depends": []},
+    {"name": "Bolumler", "file": "Ogrenciler.xlsx", "loader": insert_departments_from_excel,
+     "key_columns": ["Bölüm"], "columns": ["Fakülte", "Bölüm"], "depends": ["Fakulte"]},
+    {"name": "Ogrenciler", "file": "Ogrenciler.xlsx", "loader": insert_students_from_excel,
+     "key_columns": ["Numara"], "columns": None, "depends": ["Bolumler"]},
+    {"name": "OgretimGorevlileri", "file": "OgretimUyeleri.xlsx", "loader": insert_faculty_members_from_excel,
+     "key_columns": ["Öğretim Görevlisi"], "columns": None, "depends": ["Bolumler"]},
+    {"name": "Derslikler", "file": "Derslikler.xlsx", "loader": insert_classrooms_from_excel,
+     "key_columns": ["Derslik_ID"], "columns": None, "depends": []},
+    {"name": "Dersler", "file": "Dersler.xlsx", "loader": insert_courses_from_excel,
+     "key_columns": ["Bölüm", "Sınıf", "Ders Kodu", "Ders Adı"], "columns": None,
+     "depends": ["Ogrenciler", "OgretimGorevlileri"]},
+    {"name": "OgrenciDers", "file": "Ogrenci_Ders.xlsx", "loader": insert_student_courses_bulk_from_excel,
+     "key_columns": ["Numara", "Ders Adı"], "columns": None, "stream": True, "depends": ["Dersler"]},
+]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Her satır için anahtar -> (satır indeksi, içerik hash'i) sözlüğü oluşturur
+def compute_row_hashes(df, key_columns, columns=None):
+    columns = columns or list(df.columns)
+    df = df.drop_duplicates(subset=columns, keep="last")
+
+    hashes = {}
+    for index, key_values, values in zip(df.index, df[key_columns].itertuples(index=False),
+                                         df[columns].itertuples(index=False)):
+        key = "\x1f".join(excel_text(value) for value in key_values)
+        content = "\x1f".join(excel_text(value) for value in values)
+        hashes[key] = (index, hashlib.sha256(content.encode("utf-8")).hexdigest())
+    return hashes
+
+
+# Bir içe aktarma aşamasını manifest ile karşılaştırarak çalıştırır
+# Dosya değişmemişse aşama atlanır, değişmişse yalnızca hash'i değişen satırlar upsert edilir.
+# Dosyadan çıkarılan satırlar veritabanından silinmez; silme menüden yapılır.
+# file_hash verilmezse dosyanın hash'i burada hesaplanır
+def run_import_stage(stage, context, force=False, file_hash=None, session=None):
+    stage_name = stage["name"]
+    path = stage["file"]
+    file_hash = file_hash or file_sha256(path)
+
+    # Aşama boyunca yükleyici dahil tüm sorgular havuzdan alınan tek oturumu kullanır
+    with db_session(session) as session:
+        cursor = session.cursor()
+        cursor.execute("SELECT dosya_hash FROM AktarimManifest WHERE asama = ?", (stage_name,))
+        manifest = cursor.fetchone()
+        cursor.close()
+
+        if manifest and manifest[0] == file_hash and not force:
+            print(f"{stage_name}: {path} değişmemiş, aşama atlandı.")
+            return
 
-insert_students_from_excel(students_file)  # Öğrencileri eklemek için
+        streaming = stage.get("stream", False)
+        if streaming:
+            # Satır özetleri için dosyanın tamamı belleğe alınmaz; değişen dosya akış halinde baştan aktarılır,
+            # yükleyici var olan kayıtları atladığından bu güvenlidir
+            result = stage["loader"](path, context=context, session=session)
+            current, previous, changed, removed = {}, {}, [], []
+            complete = not result or not result["unresolved"]
+        else:
+            df = read_excel_cached(path)
+            df.columns = df.columns.str.strip()
+            current = compute_row_hashes(df, stage["key_columns"], stage["columns"])
+
+            cursor = session.cursor()
+            cursor.execute("SELECT satir_anahtari, satir_hash FROM AktarimSatirHash WHERE asama = ?", (stage_name,))
+            previous = {key: row_hash for key, row_hash in cursor.fetchall()}
+            cursor.close()
+
+            changed = [key for key, (_, row_hash) in current.items() if force or previous.get(key) != row_hash]
+            removed = [key for key in previous if key not in current]
+
+            failed = set()
+            if changed:
+                rows = df.loc[[current[key][0] for key in changed]].copy()
+                failed = set(stage["loader"](path, context=context, rows=rows, upsert=True, session=session) or ())
+            # Yazılamayan satırlar özetsiz kalır ve sonraki çalıştırmada yeniden denenir
+            changed = [key for key in changed if current[key][0] not in failed]
+            complete = not failed
+            if removed:
+                print(f"{stage_name}: {len(removed)} satır dosyadan çıkarılmış, veritabanındaki kayıtları silinmedi.")
+
+        # Manifest yalnızca aşamanın tüm satırları yazıldığında güncellenir; hata veya yazılamayan satır olursa
+        # dosya değişmemiş olsa da sonraki çalıştırma aşamayı yeniden dener
+        cursor = get_storage().prepare_bulk_cursor(session.cursor())
+
+        new_rows = [(stage_name, key, current[key][1]) for key in changed if key not in previous]
+        updated_rows = [(current[key][1], stage_name, key) for key in changed if key in previous]
+        # Satır özetleri ve manifest tek işlemde yazılır; yarım kalan bir güncelleme sonraki çalıştırmayı yanıltmaz
+        with ImportTransaction(session.connection, atomic=True):
+            if streaming:
+                cursor.execute("DELETE FROM AktarimSatirHash WHERE asama = ?", (stage_name,))
+            if new_rows:
+                cursor.executemany(
+                    "INSERT INTO AktarimSatirHash (asama, satir_anahtari, satir_hash) VALUES (?, ?, ?)", new_rows)
+            if updated_rows:
+                cursor.executemany(
+                    "UPDATE AktarimSatirHash SET satir_hash = ? WHERE asama = ? AND satir_anahtari = ?", updated_rows)
+            if removed:
+                cursor.executemany("DELETE FROM AktarimSatirHash WHERE asama = ? AND satir_anahtari = ?",
+                                   [(stage_name, key) for key in removed])
+
+            if complete and manifest:
+                cursor.execute("UPDATE AktarimManifest SET dosya = ?, dosya_hash = ? WHERE asama = ?",
+                               (path, file_hash, stage_name))
+            elif complete:
+                cursor.execute("INSERT INTO AktarimManifest (asama, dosya, dosya_hash) VALUES (?, ?, ?)",
+                               (stage_name, path, file_hash))
+        cursor.close()
+
+    if streaming:
+        print(f"{stage_name}: {path} akış halinde aktarıldı.")
+        return
+    print(f"{stage_name}: {len(changed)} değişen satır işlendi, {len(failed)} satır yazılamadı, "
+          f"{len(current) - len(changed) - len(failed)} satır değişmediği için atlandı.")
+
+
+IMPORT_WORKERS = int(os.environ.get("DERS_PROGRAMI_IMPORT_WORKERS", "4"))
+
+
+# Aşamaları bağımlılık grafiğine göre iş parçacığı havuzunda çalıştırır
+# Değişen dosyalar en başta paralel ayrıştırılır; bir aşama, bağımlı olduğu aşamalar bitip dosyası
+# ayrıştırıldığında başlar. Hata veren aşamaya bağlı aşamalar çalıştırılmaz, diğerleri devam eder
+def run_imports(force=False, workers=None):
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    stages = {stage["name"]: stage for stage in IMPORT_STAGES}
+    for stage in IMPORT_STAGES:
+        unknown = [name for name in stage["depends"] if name not in stages]
+        if unknown:
+            raise ValueError(f"{stage['name']} aşaması tanımsız aşamalara bağlı: {', '.join(unknown)}")
+
+    with db_session() as session:
+        context = load_ingest_context(session)
+        manifest = dict(session.execute("SELECT asama, dosya_hash FROM AktarimManifest").fetchall())
+
+    started = time.perf_counter()
+    timings = {}
+    failed = set()
+
+    def timed_stage(stage):
+        stage_started = time.perf_counter()
+        try:
+            run_import_stage(stage, context, force, file_hashes[stage["file"]])
+        finally:
+            timings[stage["name"]] = time.perf_counter() - stage_started
+
+    # Her dosyanın hash'i bir kez hesaplanır ve aşamalara aktarılır
+    file_hashes = {}
+    for stage in IMPORT_STAGES:
+        if stage["file"] not in file_hashes:
+            file_hashes[stage["file"]] = file_sha256(stage["file"])
+
+    with ThreadPoolExecutor(max_workers=workers or IMPORT_WORKERS) as executor:
+        # Yalnızca aktarılacak ve akış halinde okunmayan dosyalar önceden ayrıştırılır
+        parsing = {}
+        for stage in IMPORT_STAGES:
+            path = stage["file"]
+            if stage.get("stream") or path in parsing:
+                continue
+            if force or manifest.get(stage["name"]) != file_hashes[path]:
+                parsing[path] = executor.submit(read_excel_cached, path)
+
+        pending = dict(stages)
+        running = {}
+        completed = set()
+        skipped = set()
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(dependency in failed or dependency in skipped for dependency in stage["depends"]):
+                    print(f"{name}: bağlı olduğu aşama tamamlanamadığı için atlandı.")
+                    skipped.add(name)
+                    del pending[name]
+                    continue
+                parse = parsing.get(stage["file"])
+                if all(dependency in completed for dependency in stage["depends"]) \
+                        and (parse is None or parse.done()):
+                    running[executor.submit(timed_stage, stage)] = name
+                    del pending[name]
+
+            waiting = set(running) | {future for future in parsing.values() if not future.done()}
+            if not waiting:
+                if pending:
+                    raise ValueError(f"Aşama bağımlılıklarında döngü var: {', '.join(pending)}")
+                continue
+            done, _ = wait(waiting, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Ayrıştırma hataları dosyayı kullanan aşama çalışırken yeniden ortaya çıkar
+                name = running.pop(future, None)
+                if name is None:
+                    continue
+                if future.exception() is None:
+                    completed.add(name)
+                else:
+                    failed.add(name)
+                    print(f"{name}: aşama başarısız oldu: {future.exception()}")
+
+    print("İçe aktarma süreleri:")
+    for stage in IMPORT_STAGES:
+        name = stage["name"]
+        if name in skipped:
+            status = "atlandı"
+        else:
+            status = f"{timings[name]:.2f} sn" + (" (başarısız)" if name in failed else "")
+        print(f"  {name:<20} {status}")
+    print(f"  {'Toplam':<20} {time.perf_counter() - started:.2f} sn")
+    if failed or skipped:
+        raise RuntimeError(f"Tamamlanamayan aşamalar: {', '.join(sorted(failed | skipped))}")
 
 
 def add_faculty():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    fakulte_adi = input("Eklemek istediğiniz fakültenin adını girin: ").strip()
+        fakulte_adi = input("Eklemek istediğiniz fakültenin adını girin: ").strip()
 
-    # Fakülte zaten var mı kontrol et
-    cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
-    existing_faculty = cursor.fetchone()
+        # Fakülte zaten var mı kontrol et
+        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
+        existing_faculty = cursor.fetchone()
 
-    if existing_faculty:
-        print(f"Hata: '{fakulte_adi}' fakültesi zaten mevcut.")
-    else:
-        cursor.execute("INSERT INTO Fakulte (fakulte_adi) VALUES (?)", (fakulte_adi,))
-        conn.commit()
-        print(f"'{fakulte_adi}' fakültesi başarıyla eklendi!")
-
-    conn.close()
+        if existing_faculty:
+            print(f"Hata: '{fakulte_adi}' fakültesi zaten mevcut.")
+        else:
+            cursor.execute("INSERT INTO Fakulte (fakulte_adi) VALUES (?)", (fakulte_adi,))
+            session.commit()
+            print(f"'{fakulte_adi}' fakültesi başarıyla eklendi!")
 
 
 def delete_faculty():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    fakulte_adi = input("Silmek istediğiniz fakültenin adını girin: ").strip()
+        fakulte_adi = input("Silmek istediğiniz fakültenin adını girin: ").strip()
 
-    # Fakülte ID'yi al
-    cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
-    faculty = cursor.fetchone()
+        # Fakülte ID'yi al
+        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
+        faculty = cursor.fetchone()
 
-    if not faculty:
-        print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı.")
-        conn.close()
-        return
-
-    faculty_id = faculty[0]
-    cursor.execute("SELECT COUNT(*) FROM Bolumler WHERE fakulte_id = ?", (faculty_id,))
-    department_count = cursor.fetchone()[0]
+        if not faculty:
+            print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı.")
+            return
 
-    if department_count > 0:
-        print(f"Hata: '{fakulte_adi}' fakültesine bağlı {department_count} bölüm bulunmaktadır. "
-              "Önce bu bölümleri silmelisiniz.")
-    else:
-        cursor.execute("DELETE FROM Fakulte WHERE id = ?", (faculty_id,))
-        conn.commit()
-        print(f"'{fakulte_adi}' fakültesi başarıyla silindi.")
+        faculty_id = faculty[0]
+        cursor.execute("SELECT COUNT(*) FROM Bolumler WHERE fakulte_id = ?", (faculty_id,))
+        department_count = cursor.fetchone()[0]
 
-    conn.close()
+        if department_count > 0:
+            print(f"Hata: '{fakulte_adi}' fakültesine bağlı {department_count} bölüm bulunmaktadır. "
+                  "Önce bu bölümleri silmelisiniz.")
+        else:
+            cursor.execute("DELETE FROM Fakulte WHERE id = ?", (faculty_id,))
+            session.commit()
+            print(f"'{fakulte_adi}' fakültesi başarıyla silindi.")
 
 
 def add_department():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    fakulte_adi = input("Bölüm eklemek istediğiniz fakültenin adını girin: ").strip()
-    bolum_adi = input("Eklemek istediğiniz bölüm adını girin: ").strip()
+        fakulte_adi = input("Bölüm eklemek istediğiniz fakültenin adını girin: ").strip()
+        bolum_adi = input("Eklemek istediğiniz bölüm adını girin: ").strip()
 
-    # Fakülte ID'yi al
-    cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
-    faculty = cursor.fetchone()
+        # Fakülte ID'yi al
+        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
+        faculty = cursor.fetchone()
 
-    if not faculty:
-        print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Önce fakülte ekleyin.")
-        conn.close()
-        return
-
-    fakulte_id = faculty[0]
-    # Bölümün zaten var olup olmadığını kontrol et
-    cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", (bolum_adi, fakulte_id))
-    existing_department = cursor.fetchone()
+        if not faculty:
+            print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Önce fakülte ekleyin.")
+            return
 
-    if existing_department:
-        print(f"Hata: '{bolum_adi}' bölümü zaten '{fakulte_adi}' fakültesinde mevcut.")
-    else:
-        cursor.execute(
-            "INSERT INTO Bolumler (bolum_adi, fakulte_id, fakulte_adi) VALUES (?, ?, ?)",
-            (bolum_adi, fakulte_id, fakulte_adi)
-        )
-        conn.commit()
-        print(f"'{bolum_adi}' bölümü '{fakulte_adi}' fakültesine başarıyla eklendi!")
+        fakulte_id = faculty[0]
+        # Bölümün zaten var olup olmadığını kontrol et
+        cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", (bolum_adi, fakulte_id))
+        existing_department = cursor.fetchone()
 
-    conn.close()
+        if existing_department:
+            print(f"Hata: '{bolum_adi}' bölümü zaten '{fakulte_adi}' fakültesinde mevcut.")
+        else:
+            cursor.execute(
+                "INSERT INTO Bolumler (bolum_adi, fakulte_id, fakulte_adi) VALUES (?, ?, ?)",
+                (bolum_adi, fakulte_id, fakulte_adi)
+            )
+            session.commit()
+            print(f"'{bolum_adi}' bölümü '{fakulte_adi}' fakültesine başarıyla eklendi!")
 
 
 def delete_department():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    fakulte_adi = input("Silmek istediğiniz fakültenin adını girin: ").strip()
-    bolum_adi = input("Silmek istediğiniz bölüm adını girin: ").strip()
+        fakulte_adi = input("Silmek istediğiniz fakültenin adını girin: ").strip()
+        bolum_adi = input("Silmek istediğiniz bölüm adını girin: ").strip()
 
-    cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
-    faculty = cursor.fetchone()
+        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
+        faculty = cursor.fetchone()
 
-    if not faculty:
-        print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
-        conn.close()
-        return
+        if not faculty:
+            print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
+            return
 
-    # Silinecek bölümü kontrol et
-    fakulte_id = faculty[0]
-    cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", (bolum_adi, fakulte_id))
-    department = cursor.fetchone()
+        # Silinecek bölümü kontrol et
+        fakulte_id = faculty[0]
+        cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", (bolum_adi, fakulte_id))
+        department = cursor.fetchone()
 
-    if not department:
-        print(f"Hata: '{bolum_adi}' bölümü '{fakulte_adi}' fakültesinde bulunamadı.")
-    else:
-        cursor.execute("DELETE FROM Bolumler WHERE id = ?", (department[0],))
-        conn.commit()
-        print(f"'{bolum_adi}' bölümü '{fakulte_adi}' fakültesinden başarıyla silindi!")
-
-    conn.close()
+        if not department:
+            print(f"Hata: '{bolum_adi}' bölümü '{fakulte_adi}' fakültesinde bulunamadı.")
+        else:
+            cursor.execute("DELETE FROM Bolumler WHERE id = ?", (department[0],))
+            session.commit()
+            print(f"'{bolum_adi}' bölümü '{fakulte_adi}' fakültesinden başarıyla silindi!")
 
 
 def add_instructor():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    ogretim_gorevlisi = input("Eklemek istediğiniz öğretim görevlisinin adını girin: ").strip()
-    fakulte_adi = input("Öğretim görevlisinin bağlı olduğu fakülte adını girin: ").strip()
+        ogretim_gorevlisi = input("Eklemek istediğiniz öğretim görevlisinin adını girin: ").strip()
+        fakulte_adi = input("Öğretim görevlisinin bağlı olduğu fakülte adını girin: ").strip()
 
-    cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
-    faculty = cursor.fetchone()
+        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
+        faculty = cursor.fetchone()
 
-    if not faculty:
-        print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
-        conn.close()
-        return
-
-    fakulte_id = faculty[0]
-    # Haftalık uygunluk saatlerini al
-    pazartesi = input("Pazartesi uygunluk saatleri (örn: 10:00, 12:00, yoksa boş bırakın): ").strip() or None
-    sali = input("Salı uygunluk saatleri (örn: 14:00, 16:00, yoksa boş bırakın): ").strip() or None
-    carsamba = input("Çarşamba uygunluk saatleri (örn: 09:00, 11:00, yoksa boş bırakın): ").strip() or None
-    persembe = input("Perşembe uygunluk saatleri (örn: 13:00, 15:00, yoksa boş bırakın): ").strip() or None
-    cuma = input("Cuma uygunluk saatleri (örn: 15:00-17:00, yoksa boş bırakın): ").strip() or None
+        if not faculty:
+            print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
+            return
 
-    # Öğretim görevlisini ekle
-    try:
-        cursor.execute("""
-            INSERT INTO OgretimGorevlileri (ogretim_gorevlisi, fakulte_id, pazartesi, sali, carsamba, persembe, cuma)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (ogretim_gorevlisi, fakulte_id, pazartesi, sali, carsamba, persembe, cuma))
+        fakulte_id = faculty[0]
+        # Haftalık uygunluk saatlerini al
+        pazartesi = input("Pazartesi uygunluk saatleri (örn: 10:00, 12:00, yoksa boş bırakın): ").strip() or None
+        sali = input("Salı uygunluk saatleri (örn: 14:00, 16:00, yoksa boş bırakın): ").strip() or None
+        carsamba = input("Çarşamba uygunluk saatleri (örn: 09:00, 11:00, yoksa boş bırakın): ").strip() or None
+        persembe = input("Perşembe uygunluk saatleri (örn: 13:00, 15:00, yoksa boş bırakın): ").strip() or None
+        cuma = input("Cuma uygunluk saatleri (örn: 15:00-17:00, yoksa boş bırakın): ").strip() or None
 
-        conn.commit()
-        print(f"'{ogretim_gorevlisi}', '{fakulte_adi}' fakültesine başarıyla eklendi!")
+        # Öğretim görevlisini ekle
+        try:
+            cursor.execute("""
+                INSERT INTO OgretimGorevlileri (ogretim_gorevlisi, fakulte_id, pazartesi, sali, carsamba, persembe, cuma)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (ogretim_gorevlisi, fakulte_id, pazartesi, sali, carsamba, persembe, cuma))
 
-    except pyodbc.IntegrityError:
-        print(f"Hata: '{ogretim_gorevlisi}' zaten mevcut. Lütfen farklı bir isim girin.")
+            session.commit()
+            print(f"'{ogretim_gorevlisi}', '{fakulte_adi}' fakültesine başarıyla eklendi!")
 
-    conn.close()
+        except get_storage().IntegrityError:
+            session.rollback()
+            print(f"Hata: '{ogretim_gorevlisi}' zaten mevcut. Lütfen farklı bir isim girin.")
 
 
 def delete_instructor():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    ogretim_gorevlisi = input("Silmek istediğiniz öğretim görevlisinin adını giriniz: ").strip()
+        ogretim_gorevlisi = input("Silmek istediğiniz öğretim görevlisinin adını giriniz: ").strip()
 
-    # Öğretim görevlisini arama
-    cursor.execute("SELECT id FROM OgretimGorevlileri WHERE ogretim_gorevlisi = ?", (ogretim_gorevlisi,))
-    instructor = cursor.fetchone()
+        # Öğretim görevlisini arama
+        cursor.execute("SELECT id FROM OgretimGorevlileri WHERE ogretim_gorevlisi = ?", (ogretim_gorevlisi,))
+        instructor = cursor.fetchone()
 
-    if not instructor:
-        print(f"Hata: '{ogretim_gorevlisi}' öğretim görevlisi bulunamadı. Lütfen doğru isim girin.")
-        conn.close()
-        return
+        if not instructor:
+            print(f"Hata: '{ogretim_gorevlisi}' öğretim görevlisi bulunamadı. Lütfen doğru isim girin.")
+            return
 
-    # Öğretim görevlisini silme
-    ogretim_uyesi_id = instructor[0]
-    try:
-        cursor.execute("DELETE FROM OgretimGorevlileri WHERE id = ?", (ogretim_uyesi_id,))
-        conn.commit()
-        print(f"'{ogretim_gorevlisi}' öğretim görevlisi başarıyla silindi!")
+        # Öğretim görevlisini silme
+        ogretim_uyesi_id = instructor[0]
+        change = None
+        try:
+            cursor.execute("DELETE FROM OgretimGorevlileri WHERE id = ?", (ogretim_uyesi_id,))
+            session.commit()
+            print(f"'{ogretim_gorevlisi}' öğretim görevlisi başarıyla silindi!")
+            change = {"instructors": {ogretim_uyesi_id}}
 
-    except Exception as e:
-        print(f"Bir hata oluştu: {e}")
+        except Exception as e:
+            session.rollback()
+            print(f"Bir hata oluştu: {e}")
 
-    conn.close()
+    return change
 
 
 def add_student():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    numara = input("Öğrencinin numarasını girin: ").strip()
-    fakulte_adi = input("Öğrencinin bağlı olduğu fakülte adını girin: ").strip()
-    bolum_adi = input("Öğrencinin bağlı olduğu bölüm adını girin: ").strip()
-    sinif = input("Öğrencinin sınıfını girin: ").strip()
+        numara = input("Öğrencinin numarasını girin: ").strip()
+        fakulte_adi = input("Öğrencinin bağlı olduğu fakülte adını girin: ").strip()
+        bolum_adi = input("Öğrencinin bağlı olduğu bölüm adını girin: ").strip()
+        sinif = input("Öğrencinin sınıfını girin: ").strip()
 
-    cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
-    faculty = cursor.fetchone()
+        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
+        faculty = cursor.fetchone()
 
-    if not faculty:
-        print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
-        conn.close()
-        return
+        if not faculty:
+            print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
+            return
 
-    fakulte_id = faculty[0]
-    # Bölüm ID'yi al
-    cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", (bolum_adi, fakulte_id))
-    department = cursor.fetchone()
+        fakulte_id = faculty[0]
+        # Bölüm ID'yi al
+        cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ? AND fakulte_id = ?", (bolum_adi, fakulte_id))
+        department = cursor.fetchone()
 
-    if not department:
-        print(f"Hata: '{bolum_adi}' bölümü {fakulte_adi} fakültesinde bulunamadı. Lütfen doğru bölüm adını girin.")
-        conn.close()
-        return
-
-    bolum_id = department[0]
-    # Öğrenciyi ekle
-    try:
-        cursor.execute("""
-            INSERT INTO Ogrenciler (numara, fakulte_id, bolum_id, bolum_adi, sinif)
-            VALUES (?, ?, ?, ?, ?)
-        """, (numara, fakulte_id, bolum_id, bolum_adi, sinif))
+        if not department:
+            print(f"Hata: '{bolum_adi}' bölümü {fakulte_adi} fakültesinde bulunamadı. Lütfen doğru bölüm adını girin.")
+            return
 
-        conn.commit()
-        print(f"'{numara}' numaralı öğrenci başarıyla {fakulte_adi} fakültesi, {bolum_adi} bölümüne eklendi!")
+        bolum_id = department[0]
+        # Öğrenciyi ekle
+        try:
+            cursor.execute("""
+                INSERT INTO Ogrenciler (numara, fakulte_id, bolum_id, bolum_adi, sinif)
+                VALUES (?, ?, ?, ?, ?)
+            """, (numara, fakulte_id, bolum_id, bolum_adi, sinif))
 
-    except pyodbc.IntegrityError:
-        print(f"Hata: '{numara}' numaralı öğrenci zaten mevcut. Lütfen farklı bir numara girin.")
+            session.commit()
+            print(f"'{numara}' numaralı öğrenci başarıyla {fakulte_adi} fakültesi, {bolum_adi} bölümüne eklendi!")
 
-    conn.close()
+        except get_storage().IntegrityError:
+            session.rollback()
+            print(f"Hata: '{numara}' numaralı öğrenci zaten mevcut. Lütfen farklı bir numara girin.")
 
 
 def delete_student():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    numara = input("Silmek istediğiniz öğrencinin numarasını girin: ").strip()
+        numara = input("Silmek istediğiniz öğrencinin numarasını girin: ").strip()
 
-    # Öğrenci kaydını sil
-    try:
-        cursor.execute("DELETE FROM Ogrenciler WHERE numara = ?", (numara,))
-        rows_affected = cursor.rowcount
+        # Öğrenci kaydını sil
+        try:
+            cursor.execute("DELETE FROM Ogrenciler WHERE numara = ?", (numara,))
+            rows_affected = cursor.rowcount
 
-        if rows_affected > 0:
-            conn.commit()
-            print(f"'{numara}' numaralı öğrenci başarıyla silindi.")
-        else:
-            print(f"Hata: '{numara}' numaralı öğrenci bulunamadı.")
-
-    except pyodbc.Error as e:
-        print(f"Veritabanı hatası: {e}")
+            if rows_affected > 0:
+                session.commit()
+                print(f"'{numara}' numaralı öğrenci başarıyla silindi.")
+            else:
+                print(f"Hata: '{numara}' numaralı öğrenci bulunamadı.")
 
-    conn.close()
+        except get_storage().Error as e:
+            session.rollback()
+            print(f"Veritabanı hatası: {e}")
 
 
 def add_classroom():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    derslik_id = input("Derslik ID'sini girin: ").strip()
-    kapasite = input("Dersliğin kapasitesini girin: ").strip()
-
-    # Kapasiteyi tam sayıya çevir
-    try:
-        kapasite = int(kapasite)
-    except ValueError:
-        print("Hata: Kapasite sayısal bir değer olmalıdır.")
-        conn.close()
-        return
+        derslik_id = input("Derslik ID'sini girin: ").strip()
+        kapasite = input("Dersliğin kapasitesini girin: ").strip()
 
-    statu = input("Derslik statüsünü girin (LAB veya NORMAL): ").strip().upper()
-    if statu not in ['LAB', 'NORMAL']:
-        print("Hata: Statü 'LAB' veya 'NORMAL' olmalıdır.")
-        conn.close()
-        return
+        # Kapasiteyi tam sayıya çevir
+        try:
+            kapasite = int(kapasite)
+        except ValueError:
+            print("Hata: Kapasite sayısal bir değer olmalıdır.")
+            return
 
-    try:
-        cursor.execute("""
-            INSERT INTO Derslikler (derslik_id, kapasite, statu)
-            VALUES (?, ?, ?)
-        """, (derslik_id, kapasite, statu))
+        statu = input("Derslik statüsünü girin (LAB veya NORMAL): ").strip().upper()
+        if statu not in ['LAB', 'NORMAL']:
+            print("Hata: Statü 'LAB' veya 'NORMAL' olmalıdır.")
+            return
 
-        conn.commit()
-        print(f"'{derslik_id}' ID'li derslik başarıyla eklendi!")
+        try:
+            cursor.execute("""
+                INSERT INTO Derslikler (derslik_id, kapasite, statu)
+                VALUES (?, ?, ?)
+            """, (derslik_id, kapasite, statu))
 
-    except pyodbc.IntegrityError:
-        print(f"Hata: '{derslik_id}' ID'li derslik zaten mevcut. Lütfen farklı bir derslik ID'si girin.")
+            session.commit()
+            print(f"'{derslik_id}' ID'li derslik başarıyla eklendi!")
 
-    conn.close()
+        except get_storage().IntegrityError:
+            session.rollback()
+            print(f"Hata: '{derslik_id}' ID'li derslik zaten mevcut. Lütfen farklı bir derslik ID'si girin.")
 
 
 def delete_classroom():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    derslik_id = input("Silmek istediğiniz derslik ID'sini girin: ").strip()
+        derslik_id = input("Silmek istediğiniz derslik ID'sini girin: ").strip()
 
-    # Derslik var mı kontrolü
-    cursor.execute("SELECT id FROM Derslikler WHERE derslik_id = ?", (derslik_id,))
-    classroom = cursor.fetchone()
+        # Derslik var mı kontrolü
+        cursor.execute("SELECT id FROM Derslikler WHERE derslik_id = ?", (derslik_id,))
+        classroom = cursor.fetchone()
 
-    if not classroom:
-        print(f"Hata: '{derslik_id}' ID'li derslik bulunamadı. Lütfen doğru bir derslik ID'si girin.")
-        conn.close()
-        return
-
-    # Dersliği silme
-    try:
-        cursor.execute("DELETE FROM Derslikler WHERE derslik_id = ?", (derslik_id,))
-        conn.commit()
-        print(f"'{derslik_id}' ID'li derslik başarıyla silindi!")
+        if not classroom:
+            print(f"Hata: '{derslik_id}' ID'li derslik bulunamadı. Lütfen doğru bir derslik ID'si girin.")
+            return
 
-    except pyodbc.Error as e:
-        print(f"Hata: Derslik silinirken bir problem oluştu: {e}")
+        # Dersliği silme
+        try:
+            cursor.execute("DELETE FROM Derslikler WHERE derslik_id = ?", (derslik_id,))
+            session.commit()
+            print(f"'{derslik_id}' ID'li derslik başarıyla silindi!")
 
-    conn.close()
+        except get_storage().Error as e:
+            session.rollback()
+            print(f"Hata: Derslik silinirken bir problem oluştu: {e}")
 
 
 def add_course():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-
-    ders_kodu = input("Dersin kodunu girin: ").strip()
-    ders_adi = input("Dersin adını girin: ").strip()
-    sinif = int(input("Sınıf bilgisini girin: ").strip())
-    haftalik_saat = int(input("Haftalık saat bilgisini girin: ").strip())
-
-    # Online durumunu al ve dönüştür
-    online_input = input("Ders online mı? (Evet/Hayır): ").strip().casefold()
-    if online_input in ["evet", "e"]:
-        online = 1
-    elif online_input in ["hayır", "h", "hayir"]:
-        online = 0
-    else:
-        print("Hata: Lütfen 'Evet' veya 'Hayır' olarak cevap verin.")
-        conn.close()
-        return
+    with db_session() as session:
+        cursor = session.cursor()
+
+        ders_kodu = input("Dersin kodunu girin: ").strip()
+        ders_adi = input("Dersin adını girin: ").strip()
+        sinif = int(input("Sınıf bilgisini girin: ").strip())
+        haftalik_saat = int(input("Haftalık saat bilgisini girin: ").strip())
+
+        # Online durumunu al ve dönüştür
+        online_input = input("Ders online mı? (Evet/Hayır): ").strip().casefold()
+        if online_input in ["evet", "e"]:
+            online = 1
+        elif online_input in ["hayır", "h", "hayir"]:
+            online = 0
+        else:
+            print("Hata: Lütfen 'Evet' veya 'Hayır' olarak cevap verin.")
+            return
 
-    zorunlu_saat = input("Zorunlu saat bilgilerini girin (boş bırakabilirsiniz): ").strip()
-    if not zorunlu_saat:
-        zorunlu_saat = 0
-    else:
-        zorunlu_saat = int(zorunlu_saat)
+        zorunlu_saat = input("Zorunlu saat bilgilerini girin (boş bırakabilirsiniz): ").strip()
+        if not zorunlu_saat:
+            zorunlu_saat = 0
+        else:
+            zorunlu_saat = int(zorunlu_saat)
 
-    statu = input("Ders statüsünü girin (LAB/NORMAL): ").strip().upper()
+        statu = input("Ders statüsünü girin (LAB/NORMAL): ").strip().upper()
 
-    # Fakülte, Bölüm ve Öğretim Üyesi ID'lerini al
-    fakulte_adi = input("Dersin bağlı olduğu fakülte adını girin: ").strip()
-    bolum_adi = input("Dersin bağlı olduğu bölüm adını girin: ").strip()
-    ogretim_uyesi_adi = input("Dersin öğretim üyesinin adını girin: ").strip()
+        # Fakülte, Bölüm ve Öğretim Üyesi ID'lerini al
+        fakulte_adi = input("Dersin bağlı olduğu fakülte adını girin: ").strip()
+        bolum_adi = input("Dersin bağlı olduğu bölüm adını girin: ").strip()
+        ogretim_uyesi_adi = input("Dersin öğretim üyesinin adını girin: ").strip()
 
-    cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
-    fakulte = cursor.fetchone()
+        cursor.execute("SELECT id FROM Fakulte WHERE fakulte_adi = ?", (fakulte_adi,))
+        fakulte = cursor.fetchone()
 
-    if not fakulte:
-        print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
-        conn.close()
-        return
+        if not fakulte:
+            print(f"Hata: '{fakulte_adi}' fakültesi bulunamadı. Lütfen doğru fakülte adını girin.")
+            return
 
-    fakulte_id = fakulte[0]
-    cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ?", (bolum_adi,))
-    bolum = cursor.fetchone()
+        fakulte_id = fakulte[0]
+        cursor.execute("SELECT id FROM Bolumler WHERE bolum_adi = ?", (bolum_adi,))
+        bolum = cursor.fetchone()
 
-    if not bolum:
-        print(f"Hata: '{bolum_adi}' bölümü bulunamadı. Lütfen doğru bölüm adını girin.")
-        conn.close()
-        return
+        if not bolum:
+            print(f"Hata: '{bolum_adi}' bölümü bulunamadı. Lütfen doğru bölüm adını girin.")
+            return
 
-    bolum_id = bolum[0]
-    cursor.execute("SELECT id FROM OgretimGorevlileri WHERE ogretim_gorevlisi = ?", (ogretim_uyesi_adi,))
-    ogretim_uyesi = cursor.fetchone()
+        bolum_id = bolum[0]
+        cursor.execute("SELECT id FROM OgretimGorevlileri WHERE ogretim_gorevlisi = ?", (ogretim_uyesi_adi,))
+        ogretim_uyesi = cursor.fetchone()
 
-    if not ogretim_uyesi:
-        print(f"Hata: '{ogretim_uyesi_adi}' öğretim üyesi bulunamadı. Lütfen doğru öğretim üyesi adını girin.")
-        conn.close()
-        return
+        if not ogretim_uyesi:
+            print(f"Hata: '{ogretim_uyesi_adi}' öğretim üyesi bulunamadı. Lütfen doğru öğretim üyesi adını girin.")
+            return
 
-    ogretim_uyesi_id = ogretim_uyesi[0]
-    # Ders ekle
-    try:
-        cursor.execute("""
-            INSERT INTO Dersler (fakulte_id, bolum_id, sinif, ders_kodu, ders_adi, ogretim_uyesi_id, haftalik_saat, online, zorunlu_saat, statu)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-        fakulte_id, bolum_id, sinif, ders_kodu, ders_adi, ogretim_uyesi_id, haftalik_saat, online, zorunlu_saat, statu))
+        ogretim_uyesi_id = ogretim_uyesi[0]
+        change = None
+        # Ders ekle
+        try:
+            cursor.execute("""
+                INSERT INTO Dersler (fakulte_id, bolum_id, sinif, ders_kodu, ders_adi, ogretim_uyesi_id, haftalik_saat, online, zorunlu_saat, statu)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+            fakulte_id, bolum_id, sinif, ders_kodu, ders_adi, ogretim_uyesi_id, haftalik_saat, online, zorunlu_saat, statu))
 
-        conn.commit()
-        print(f"'{ders_adi}' dersi başarıyla eklendi!")
+            session.commit()
+            print(f"'{ders_adi}' dersi başarıyla eklendi!")
+            change = {"courses": {ders_adi}}
 
-    except pyodbc.Error as e:
-        print(f"Hata: Ders eklenirken bir problem oluştu: {e}")
+        except get_storage().Error as e:
+            session.rollback()
+            print(f"Hata: Ders eklenirken bir problem oluştu: {e}")
 
-    conn.close()
+    return change
 
 
 def delete_course():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    ders_kodu = input("Silmek istediğiniz dersin kodunu girin: ").strip()
+        ders_kodu = input("Silmek istediğiniz dersin kodunu girin: ").strip()
 
-    # Ders kodunu kullanarak derse ait kaydı sil
-    try:
-        cursor.execute("SELECT * FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
-        ders = cursor.fetchone()
+        change = None
+        # Ders kodunu kullanarak derse ait kaydı sil
+        try:
+            cursor.execute("SELECT ders_adi FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
+            ders = cursor.fetchone()
 
-        if not ders:
-            print(f"Hata: '{ders_kodu}' dersine ait kayıt bulunamadı. Lütfen doğru ders kodu girin.")
-            conn.close()
-            return
+            if not ders:
+                print(f"Hata: '{ders_kodu}' dersine ait kayıt bulunamadı. Lütfen doğru ders kodu girin.")
+                return
 
-        # Ders kaydını sil
-        cursor.execute("DELETE FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
-        conn.commit()
-        print(f"'{ders_kodu}' ders kaydı başarıyla silindi!")
+            # Ders kaydını sil
+            cursor.execute("DELETE FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
+            session.commit()
+            print(f"'{ders_kodu}' ders kaydı başarıyla silindi!")
+            change = {"courses": {ders[0]}}
 
-    except pyodbc.Error as e:
-        print(f"Hata: Ders silinirken bir problem oluştu: {e}")
+        except get_storage().Error as e:
+            session.rollback()
+            print(f"Hata: Ders silinirken bir problem oluştu: {e}")
 
-    conn.close()
+    return change
 
 
 def add_student_course():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    ogrenci_num = input("Öğrencinin numarasını girin: ").strip()
-    ders_kodu = input("Ders kodunu girin: ").strip()
+        ogrenci_num = input("Öğrencinin numarasını girin: ").strip()
+        ders_kodu = input("Ders kodunu girin: ").strip()
 
-    cursor.execute("SELECT id FROM Ogrenciler WHERE numara = ?", (ogrenci_num,))
-    ogrenci = cursor.fetchone()
+        cursor.execute("SELECT id FROM Ogrenciler WHERE numara = ?", (ogrenci_num,))
+        ogrenci = cursor.fetchone()
 
-    if not ogrenci:
-        print(f"Hata: '{ogrenci_num}' numaralı öğrenci bulunamadı. Lütfen doğru öğrenci numarası girin.")
-        conn.close()
-        return
+        if not ogrenci:
+            print(f"Hata: '{ogrenci_num}' numaralı öğrenci bulunamadı. Lütfen doğru öğrenci numarası girin.")
+            return
 
-    ogrenci_id = ogrenci[0]
-    # Ders koduna ait ders bilgilerini al
-    cursor.execute("SELECT id FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
-    ders = cursor.fetchone()
+        ogrenci_id = ogrenci[0]
+        # Ders koduna ait ders bilgilerini al
+        cursor.execute("SELECT id, ders_adi FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
+        ders = cursor.fetchone()
 
-    if not ders:
-        print(f"Hata: '{ders_kodu}' dersine ait kayıt bulunamadı. Lütfen doğru ders kodu girin.")
-        conn.close()
-        return
+        if not ders:
+            print(f"Hata: '{ders_kodu}' dersine ait kayıt bulunamadı. Lütfen doğru ders kodu girin.")
+            return
 
-    ders_id = ders[0]
-    # Öğrenci-ders ilişkisini ekle
-    try:
-        cursor.execute("""
-            INSERT INTO OgrenciDers (ogrenci_id, ogrenci_num, ders_id)
-            VALUES (?, ?, ?)
-        """, (ogrenci_id, ogrenci_num, ders_id))
+        ders_id = ders[0]
+        change = None
+        # Öğrenci-ders ilişkisini ekle
+        try:
+            cursor.execute("""
+                INSERT INTO OgrenciDers (ogrenci_id, ogrenci_num, ders_id)
+                VALUES (?, ?, ?)
+            """, (ogrenci_id, ogrenci_num, ders_id))
 
-        conn.commit()
-        print(f"Öğrenci '{ogrenci_num}' ile ders '{ders_kodu}' başarıyla ilişkilendirildi!")
+            session.commit()
+            print(f"Öğrenci '{ogrenci_num}' ile ders '{ders_kodu}' başarıyla ilişkilendirildi!")
+            change = {"enrollments": {ders[1]}}
 
-    except pyodbc.IntegrityError as e:
-        print(f"Hata: Öğrenci-ders ilişkisi eklenirken bir problem oluştu: {e}")
+        except get_storage().IntegrityError as e:
+            session.rollback()
+            print(f"Hata: Öğrenci-ders ilişkisi eklenirken bir problem oluştu: {e}")
 
-    conn.close()
+    return change
 
 
 def delete_student_course():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    with db_session() as session:
+        cursor = session.cursor()
 
-    ogrenci_num = input("Öğrencinin numarasını girin: ").strip()
-    ders_kodu = input("Ders kodunu girin: ").strip()
+        ogrenci_num = input("Öğrencinin numarasını girin: ").strip()
+        ders_kodu = input("Ders kodunu girin: ").strip()
 
-    # Öğrenci numarasına ait öğrenci bilgilerini al
-    cursor.execute("SELECT id FROM Ogrenciler WHERE numara = ?", (ogrenci_num,))
-    ogrenci = cursor.fetchone()
-
-    if not ogrenci:
-        print(f"Hata: '{ogrenci_num}' numaralı öğrenci bulunamadı. Lütfen doğru öğrenci numarası girin.")
-        conn.close()
-        return
-
-    ogrenci_id = ogrenci[0]
-    # Ders koduna ait ders bilgilerini al
-    cursor.execute("SELECT id FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
-    ders = cursor.fetchone()
+        # Öğrenci numarasına ait öğrenci bilgilerini al
+        cursor.execute("SELECT id FROM Ogrenciler WHERE numara = ?", (ogrenci_num,))
+        ogrenci = cursor.fetchone()
 
-    if not ders:
-        print(f"Hata: '{ders_kodu}' dersine ait kayıt bulunamadı. Lütfen doğru ders kodu girin.")
-        conn.close()
-        return
+        if not ogrenci:
+            print(f"Hata: '{ogrenci_num}' numaralı öğrenci bulunamadı. Lütfen doğru öğrenci numarası girin.")
+            return
 
-    ders_id = ders[0]
-    # Öğrenci-ders ilişkisinin var olup olmadığını kontrol et
-    cursor.execute("""
-        SELECT * FROM OgrenciDers 
-        WHERE ogrenci_id = ? AND ders_id = ?
-    """, (ogrenci_id, ders_id))
+        ogrenci_id = ogrenci[0]
+        # Ders koduna ait ders bilgilerini al
+        cursor.execute("SELECT id, ders_adi FROM Dersler WHERE ders_kodu = ?", (ders_kodu,))
+        ders = cursor.fetchone()
 
-    relation = cursor.fetchone()
-    if not relation:
-        print(f"Bu öğrenci ve ders arasında zaten bir ilişki bulunmamaktadır.")
-        conn.close()
-        return
+        if not ders:
+            print(f"Hata: '{ders_kodu}' dersine ait kayıt bulunamadı. Lütfen doğru ders kodu girin.")
+            return
 
-    # İlişkiyi sil
-    try:
+        ders_id = ders[0]
+        change = None
+        # Öğrenci-ders ilişkisinin var olup olmadığını kontrol et
         cursor.execute("""
-            DELETE FROM OgrenciDers 
+            SELECT * FROM OgrenciDers 
             WHERE ogrenci_id = ? AND ders_id = ?
         """, (ogrenci_id, ders_id))
 
-        conn.commit()
-        print(f"Öğrenci '{ogrenci_num}' ve ders '{ders_kodu}' arasındaki ilişki başarıyla silindi!")
+        relation = cursor.fetchone()
+        if not relation:
+            print(f"Bu öğrenci ve ders arasında zaten bir ilişki bulunmamaktadır.")
+            return
+
+        # İlişkiyi sil
+        try:
+            cursor.execute("""
+                DELETE FROM OgrenciDers 
+                WHERE ogrenci_id = ? AND ders_id = ?
+            """, (ogrenci_id, ders_id))
 
-    except pyodbc.Error as e:
-        print(f"Hata: Öğrenci-ders ilişkisi silinirken bir problem oluştu: {e}")
+            session.commit()
+            print(f"Öğrenci '{ogrenci_num}' ve ders '{ders_kodu}' arasındaki ilişki başarıyla silindi!")
+            change = {"enrollments": {ders[1]}}
 
-    conn.close()
+        except get_storage().Error as e:
+            session.rollback()
+            print(f"Hata: Öğrenci-ders ilişkisi silinirken bir problem oluştu: {e}")
 
+    return change
 
-# Excel oluşturma işlemleri
-wb = openpyxl.Workbook()
-ws = wb.active
-ws.title = "Ders Programı"
 
 days = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma"]
 time_slots = ["09:00-10:00", "10:00-11:00", "11:00-12:00",
               "12:00-13:00", "13:00-14:00", "14:00-15:00", "15:00-16:00",
               "16:00-17:00", "17:00-18:00", "18:00-19:00", "19:00-20:00", "20:00-21:00"]
-bm_class_headers = ["1. Sınıf", "2. Sınıf", "3. Sınıf", "4. Sınıf"]
-
-# Hücre genişliklerini ayarlama
-ws.column_dimensions["A"].width = 15
-ws.column_dimensions["B"].width = 15
-for col in range(3, 3 + len(bm_class_headers)):
-    ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 30
-
-thin_border = Border(
-    left=Side(style="thin"),
-    right=Side(style="thin"),
-    top=Side(style="thin"),
-    bottom=Side(style="thin"))
-
-# Başlıklar
-ws.merge_cells("A1:B1")
-ws["A1"] = "Bölüm"
-ws["A1"].font = Font(bold=True)
-ws["A1"].alignment = Alignment(horizontal="center", vertical="center")
-
-ws.merge_cells("A2:B2")
-ws["A2"] = "Gün/Saatler"
-ws["A2"].font = Font(bold=True)
-ws["A2"].alignment = Alignment(horizontal="center", vertical="center")
-
-ws.merge_cells("C1:F1")
-ws["C1"] = "Bilgisayar Mühendisliği"
-ws["C1"].font = Font(bold=True)
-ws["C1"].alignment = Alignment(horizontal="center", vertical="center")
-ws["C1"].border = thin_border
-ws["F1"].border = thin_border
-
-# Sınıf başlıklarını ekleme
-for idx, header in enumerate(bm_class_headers, start=3):
-    cell = ws.cell(row=2, column=idx, value=header)
-    cell.font = Font(bold=True)
-    cell.alignment = Alignment(horizontal="center")
-    cell.border = thin_border
-
-# Gün ve saatleri ekleme
-row_num = 3
-for day in days:
-    ws.merge_cells(start_row=row_num, start_column=1, end_row=row_num + len(time_slots) - 1, end_column=1)
-    cell = ws.cell(row=row_num, column=1, value=day)
-    cell.alignment = Alignment(horizontal="center", vertical="center")
-    cell.font = Font(bold=True)
-    cell.border = thin_border
-
-    for time_slot in time_slots:
-        cell = ws.cell(row=row_num, column=2, value=time_slot)
-        cell.alignment = Alignment(horizontal="center", vertical="center")
-        cell.font = Font(bold=True)
-        cell.border = thin_border
-        row_num += 1
 
-colors = ["FFDDC1", "D3E3FC", "FAF4B7", "D4E2D4"]
-for row in ws.iter_rows(min_row=3, max_row=row_num - 1, min_col=3, max_col=6):
-    for idx, cell in enumerate(row):
-        cell.fill = PatternFill(start_color=colors[idx], end_color=colors[idx], fill_type="solid")
-        cell.border = thin_border
 
-row_num += 2
-sw_class_headers = ["1. Sınıf", "2. Sınıf", "3. Sınıf"]
-ws.merge_cells(f"A{row_num}:B{row_num}")
-ws[f"A{row_num}"] = "Bölüm"
-ws[f"A{row_num}"].font = Font(bold=True)
-ws[f"A{row_num}"].alignment = Alignment(horizontal="center", vertical="center")
-
-ws.merge_cells(f"A{row_num + 1}:B{row_num + 1}")
-ws[f"A{row_num + 1}"] = "Gün/Saatler"
-ws[f"A{row_num + 1}"].font = Font(bold=True)
-ws[f"A{row_num + 1}"].alignment = Alignment(horizontal="center", vertical="center")
-
-ws.merge_cells(f"C{row_num}:E{row_num}")
-ws[f"C{row_num}"] = "Yazılım Mühendisliği"
-ws[f"C{row_num}"].font = Font(bold=True)
-ws[f"C{row_num}"].alignment = Alignment(horizontal="center", vertical="center")
-ws[f"C{row_num}"].border = thin_border
-
-top_border = Border(top=Side(style="thin"), right=Side(style="thin"))
-for col in range(1, 6):
-    ws.cell(row=60, column=col).border = top_border
-
-# Sınıf başlıklarını ekleme
-for idx, header in enumerate(sw_class_headers, start=3):
-    cell = ws.cell(row=row_num + 1, column=idx, value=header)
-    cell.font = Font(bold=True)
-    cell.alignment = Alignment(horizontal="center")
-    cell.border = thin_border
-
-# Gün ve saatleri ekleme
-row_num += 2
-for day in days:
-    ws.merge_cells(start_row=row_num, start_column=1, end_row=row_num + len(time_slots) - 1, end_column=1)
-    cell = ws.cell(row=row_num, column=1, value=day)
-    cell.alignment = Alignment(horizontal="center", vertical="center")
-    cell.font = Font(bold=True)
-    cell.border = thin_border
-
-    for time_slot in time_slots:
-        cell = ws.cell(row=row_num, column=2, value=time_slot)
-        cell.alignment = Alignment(horizontal="center")
-        cell.font = Font(bold=True)
-        cell.border = thin_border
-        row_num += 1
+# Programdaki bölümler: (bolum_id, bölüm adı, sınıf sayısı) listesi, bölüm adına göre sıralı.
+# Sınıf sayısı bölümün derslerindeki en büyük sınıftır; dersi olmayan bölümler programa girmez
+def get_departments(session=None):
+    with db_session(session) as session:
+        rows = session.execute("""
+            SELECT b.id, b.bolum_adi, MAX(d.sinif)
+            FROM Bolumler b
+            JOIN Dersler d ON d.bolum_id = b.id
+            GROUP BY b.id, b.bolum_adi
+        """).fetchall()
+
+    return sorted(((row[0], row[1], int(row[2])) for row in rows), key=lambda department: department[1])
+
+
+# Excel'deki program tablolarının yerleşimi: bölüm -> (günün ilk satırı, sınıf -> sütun).
+# Bölüm tabloları alt alta dizilir; her tablo iki başlık satırı, gün x saat satırı ve iki boş satır kaplar
+def build_schedule_layout(departments, time_slots=time_slots):
+    block_height = 2 + len(days) * len(time_slots) + 2
+    layout = {}
+    for position, (_, department, class_count) in enumerate(departments):
+        first_row = 3 + position * block_height
+        layout[department] = ({day: first_row + i * len(time_slots) for i, day in enumerate(days)},
+                              {class_year: 2 + class_year for class_year in range(1, class_count + 1)})
+    return layout
+
+
+# Ders programı; hücreler gün x saat x bölüm x sınıf boyutlu bir NumPy dizisinde tutulur.
+# Dizide hücre metninin kendisi yerine entries listesindeki sırası saklanır, boş hücreler EMPTY'dir.
+# Gün, saat ve bölüm adları sözlüklerle dizi indekslerine çevrilir, sınıf indeksi sınıf - 1'dir.
+# layout bölümlerin Excel yerleşimidir (build_schedule_layout), department_names bolum_id -> bölüm adı
+class ScheduleGrid:
+    EMPTY = -1
+
+    def __init__(self, days, time_slots, layout, class_count, department_names=None):
+        import numpy
+
+        self.np = numpy
+        self.days = list(days)
+        self.time_slots = list(time_slots)
+        self.layout = layout
+        self.departments = list(layout)
+        self.department_names = dict(department_names or {})
+        self.day_index = {day: i for i, day in enumerate(self.days)}
+        self.slot_index = {slot: i for i, slot in enumerate(self.time_slots)}
+        self.department_index = {department: i for i, department in enumerate(self.departments)}
+        self.cells = numpy.full((len(self.days), len(self.time_slots), len(self.departments), class_count),
+                                self.EMPTY, dtype=numpy.int32)
+        self.entries = []  # hücre no -> hücre metni
+        self.entry_ids = {}  # hücre metni -> hücre no
+        # Öğretim üyesi id -> dolu saatlerin maskesi (bit = gün * saat sayısı + saat, uygunluk maskeleriyle aynı)
+        self.instructor_busy = {}
+        # Ders adı -> dolu saatlerin maskesi
+        self.course_slots = {}
+        # ("instructor", id) / ("course", ad) -> bit -> o biti tutan yerleşim sayısı; ortak derslerin kopyaları
+        # aynı bitleri paylaştığı için kaldırmada yalnızca sayısı sıfıra inen bitler maskeden silinir
+        self.slot_counts = {}
+        # Ders çakışma grafiği bağlanırsa her dersin dolu saatleri grafikteki sırasıyla tutulur
+        self.conflicts = None
+        self.course_busy = None
+        # place ile yapılan yerleşimlerin kayıtları; iyileştirme aşaması dersleri bu kayıtlar üzerinden taşır
+        self.placements = []
+        # Derslik dizini bağlanırsa derslik gerektiren her ders bloğuna yerleşirken bir derslik ayrılır:
+        # (ders adı, gün, saatler) -> derslik id
+        self.rooms = None
+        self.catalog = None
+        self.reserved_rooms = {}
+        # Kalabalık derslerin şube planı (SectionPlan); onarımda aynı şubeler kullanılır
+        self.sections = None
+        # Derslik atamasında metni değiştirilen hücreler: (gün, saat, bölüm, sınıf) -> (atama öncesi metin, derslik)
+        self.labels = {}
+
+    def entry_id(self, text):
+        if text not in self.entry_ids:
+            self.entry_ids[text] = len(self.entries)
+            self.entries.append(text)
+        return self.entry_ids[text]
+
+    # Gün için verilen saat, bölüm ve sınıfların kesişimini seçen dizi görünümü ve indeksler
+    def _block(self, day, slots, departments, class_years):
+        return self.cells[self.day_index[day]], self.np.ix_(
+            [self.slot_index[slot] for slot in slots],
+            [self.department_index[department] for department in departments],
+            [class_year - 1 for class_year in class_years])
+
+    def get(self, day, slot, department, class_year):
+        entry = self.cells[self.day_index[day], self.slot_index[slot], self.department_index[department],
+                           class_year - 1]
+        return None if entry == self.EMPTY else self.entries[entry]
+
+    # Verilen saatlerin tamamında, verilen bölüm ve sınıfların hepsi boşsa True döner
+    def is_free(self, day, slots, departments, class_years):
+        cells, block = self._block(day, slots, departments, class_years)
+        return not (cells[block] != self.EMPTY).any()
+
+    # Bloğa metni yazar; instructor_id verilirse öğretim üyesi, course_name verilirse ders bu saatlerde dolu
+    # olarak işaretlenir. Yerleşim kaydını döndürür
+    def place(self, day, slots, departments, class_years, text, instructor_id=None, course_name=None):
+        cells, block = self._block(day, slots, departments, class_years)
+        cells[block] = self.entry_id(text)
+        placement = {"day": day, "slots": list(slots), "departments": list(departments),
+                     "class_years": list(class_years), "text": text, "instructor_id": instructor_id,
+                     "course_name": course_name, "room": None}
+        self.placements.append(placement)
+        self._mark(placement)
+        self.reserve_room(course_name, day, slots)
+        return placement
+
+    # Derslik atamasında tek hücrenin metnini değiştirir; yerleşim kayıtları değişmez, hücrenin atama öncesi metni
+    # ve dersliği durum dosyası için saklanır
+    def label(self, day, slot, department, class_year, text, room=None):
+        cell = (day, slot, department, class_year)
+        base = self.labels[cell][0] if cell in self.labels else self.get(day, slot, department, class_year)
+        self.labels[cell] = (base, room)
+        self.write_cell(day, slot, department, class_year, text)
+
+    # Hücreye yerleşim kaydı oluşturmadan metin yazar
+    def write_cell(self, day, slot, department, class_year, text):
+        self.cells[self.day_index[day], self.slot_index[slot], self.department_index[department],
+                   class_year - 1] = self.entry_id(text)
+
+    # Yerleşimi programdan kaldırır; öğretim üyesi ve ders maskelerinden başka yerleşimin tutmadığı bitler silinir
+    def remove(self, placement):
+        cells, block = self._block(placement["day"], placement["slots"], placement["departments"],
+                                   placement["class_years"])
+        cells[block] = self.EMPTY
+        self.placements.remove(placement)
+        self._release_room(placement)
+        self._unmark(placement)
+
+    def _mark(self, placement):
+        bits = self.slot_mask(placement["day"], placement["slots"])
+        instructor_id, course_name = placement["instructor_id"], placement["course_name"]
+        if instructor_id is not None:
+            self.instructor_busy[instructor_id] = self.instructor_busy.get(instructor_id, 0) | bits
+        if course_name is not None:
+            self.course_slots[course_name] = self.course_slots.get(course_name, 0) | bits
+            if self.conflicts is not None and course_name in self.conflicts.index:
+                self.course_busy[self.conflicts.index[course_name]] |= self.np.uint64(bits)
+        self._count(placement, bits, 1)
+
+    def _unmark(self, placement):
+        bits = self.slot_mask(placement["day"], placement["slots"])
+        instructor_freed, course_freed = self._count(placement, bits, -1)
+        instructor_id, course_name = placement["instructor_id"], placement["course_name"]
+        if instructor_id is not None:
+            self.instructor_busy[instructor_id] &= ~instructor_freed
+        if course_name is not None:
+            self.course_slots[course_name] &= ~course_freed
+            if self.conflicts is not None and course_name in self.conflicts.index:
+                self.course_busy[self.conflicts.index[course_name]] = self.np.uint64(self.course_slots[course_name])
+
+    # Yerleşimin öğretim üyesi ve ders bitlerinin sayılarını step kadar değiştirir; sayısı sıfıra inen
+    # bitlerin maskelerini (öğretim üyesi, ders) olarak döndürür
+    def _count(self, placement, bits, step):
+        freed = []
+        for key in (("instructor", placement["instructor_id"]), ("course", placement["course_name"])):
+            mask = 0
+            if key[1] is not None:
+                counts = self.slot_counts.setdefault(key, {})
+                remaining = bits
+                while remaining:
+                    bit = remaining & -remaining
+                    remaining ^= bit
+                    counts[bit] = counts.get(bit, 0) + step
+                    if not counts[bit]:
+                        del counts[bit]
+                        mask |= bit
+            freed.append(mask)
+        return freed
+
+    # Kayıtları boş maskelerden başlayarak sırayla yeniden işler; visit her kayıt işlenmeden önce çağrılır
+    def replay(self, visit):
+        placements = self.placements
+        self.placements, self.instructor_busy, self.course_slots, self.slot_counts = [], {}, {}, {}
+        if self.course_busy is not None:
+            self.course_busy[:] = 0
+        for placement in placements:
+            visit(placement)
+            self.placements.append(placement)
+            self._mark(placement)
+
+    def snapshot(self):
+        return (self.cells.copy(), list(self.placements), dict(self.instructor_busy), dict(self.course_slots),
+                {key: dict(counts) for key, counts in self.slot_counts.items()},
+                None if self.course_busy is None else self.course_busy.copy(), dict(self.reserved_rooms),
+                None if self.rooms is None else dict(self.rooms.busy))
+
+    def restore(self, state):
+        cells, placements, instructor_busy, course_slots, slot_counts, course_busy, reserved_rooms, room_busy = state
+        self.cells[...] = cells
+        self.placements, self.instructor_busy, self.course_slots = list(placements), dict(instructor_busy), \
+            dict(course_slots)
+        self.slot_counts = {key: dict(counts) for key, counts in slot_counts.items()}
+        if course_busy is not None:
+            self.course_busy[:] = course_busy
+        self.reserved_rooms = dict(reserved_rooms)
+        if room_busy is not None:
+            self.rooms.busy = dict(room_busy)
+
+    def attach_conflicts(self, conflicts):
+        self.conflicts = conflicts
+        self.course_busy = self.np.zeros(len(conflicts.names), dtype=self.np.uint64)
+        for course_name, bits in self.course_slots.items():
+            if course_name in conflicts.index:
+                self.course_busy[conflicts.index[course_name]] = self.np.uint64(bits)
+
+    # Derslik dizinini (RoomIndex) ve ders kataloğunu bağlar; mevcut yerleşimlere sırayla derslik ayrılır
+    def attach_rooms(self, rooms, catalog):
+        self.rooms, self.catalog = rooms, catalog
+        self.rooms.busy, self.reserved_rooms = {}, {}
+        for placement in self.placements:
+            self.reserve_room(placement["course_name"], placement["day"], placement["slots"], placement["room"])
+
+    # Dersin derslik ihtiyacı (statü, öğrenci sayısı); derslik dizini yoksa, ders katalogda yoksa veya online
+    # ise None
+    def _room_need(self, course_name):
+        if self.rooms is None or course_name is None:
+            return None
+        course_id = self.catalog.course_id(course_name)
+        if not course_id or self.catalog.is_online(course_id):
+            return None
+        return self.catalog.status(course_id), self.catalog.student_count(course_id)
+
+    # Maskedeki saatlerin tamamında boş kalan ve öğrencilere yeten bir derslik varsa (veya ders derslik
+    # gerektirmiyorsa) True döner
+    def has_room(self, course_name, bits):
+        need = self._room_need(course_name)
+        return need is None or self.rooms.find(need[0], need[1], bits) is not None
+
+    # Ders bloğuna en küçük uygun dersliği ayırır; ortak dersin diğer bölümleri aynı dersliği paylaşır. preferred
+    # (ör. kayıtlı programdaki derslik) hâlâ uygunsa o seçilir. Derslik id'sini (ayrılamazsa veya gerekmiyorsa
+    # None) döndürür
+    def reserve_room(self, course_name, day, slots, preferred=None):
+        key = (course_name, day, tuple(slots))
+        if key in self.reserved_rooms:
+            return self.reserved_rooms[key]
+        need = self._room_need(course_name)
+        if need is None:
+            return None
+        bits = self.slot_mask(day, slots)
+        classroom_id = preferred if self.rooms.fits(preferred, need[0], need[1], bits) else \
+            self.rooms.find(need[0], need[1], bits)
+        if classroom_id is not None:
+            self.rooms.occupy(classroom_id, bits)
+            self.reserved_rooms[key] = classroom_id
+        return classroom_id
+
+    # Bloğun son yerleşimi kaldırıldıysa dersliği serbest bırakılır
+    def _release_room(self, placement):
+        key = (placement["course_name"], placement["day"], tuple(placement["slots"]))
+        if key not in self.reserved_rooms or \
+                any((other["course_name"], other["day"], tuple(other["slots"])) == key for other in self.placements):
+            return
+        classroom_id = self.reserved_rooms.pop(key)
+        self.rooms.busy[classroom_id] = 0
+        for (_, day, slots), other_id in self.reserved_rooms.items():
+            if other_id == classroom_id:
+                self.rooms.occupy(classroom_id, self.slot_mask(day, slots))
+
+    # Dersi maskedeki saatlere koyarsak aynı saatte başka derse de kayıtlı olacak öğrenci sayısı
+    # (komşu derslerin ortak öğrenci sayılarının toplamı)
+    def clash(self, course_name, bits):
+        if self.conflicts is None or course_name not in self.conflicts.index:
+            return 0
+        neighbors, weights = self.conflicts.neighbors(course_name)
+        overlapping = (self.course_busy[neighbors] & self.np.uint64(bits)) != 0
+        return int(weights[overlapping].sum())
+
+    def slot_mask(self, day, slots):
+        base = self.day_index[day] * len(self.time_slots)
+        bits = 0
+        for slot in slots:
+            bits |= 1 << (base + self.slot_index[slot])
+        return bits
+
+    # Öğretim üyesinin maskedeki saatlerin hiçbirinde başka dersi yoksa True döner
+    def is_instructor_free(self, instructor_id, bits):
+        return not self.instructor_busy.get(instructor_id, 0) & bits
+
+    # Dolu hücreleri gün, saat, bölüm, sınıf sırasıyla (gün, saat indeksi, bölüm, sınıf, metin) olarak verir
+    def items(self):
+        for d, s, p, c in self.np.argwhere(self.cells != self.EMPTY):
+            yield self.days[d], int(s), self.departments[p], int(c) + 1, self.entries[self.cells[d, s, p, c]]
+
+
+# Tüm atama aşamalarının ortak kullandığı boş program
+def create_empty_schedule(time_slots, departments):
+    layout = build_schedule_layout(departments, time_slots)
+    class_count = max((max(columns) for _, columns in layout.values()), default=1)
+    return ScheduleGrid(days, time_slots, layout, class_count,
+                        {department_id: department for department_id, department, _ in departments})
+
+
+# Şablonda sütunu olmayan sınıflara yapılan atamaları programdan çıkarır (ör. bölümde olmayan 4. sınıf)
+def trim_schedule_to_layout(schedule):
+    for department, (_, columns) in schedule.layout.items():
+        department_index = schedule.department_index[department]
+        for class_index in range(schedule.cells.shape[3]):
+            if class_index + 1 not in columns:
+                schedule.cells[:, :, department_index, class_index] = ScheduleGrid.EMPTY
+    return schedule
 
-# Yazılım Mühendisliği için hücreleri renklendirme
-for row in ws.iter_rows(min_row=row_num - len(days) * len(time_slots), max_row=row_num - 1, min_col=3, max_col=5):
-    for idx, cell in enumerate(row):
-        cell.fill = PatternFill(start_color=colors[idx], end_color=colors[idx], fill_type="solid")
-        cell.border = thin_border
 
-# Excel dosyasını kaydet
-wb.save("Ders_Programi.xlsx")
-time_slots = ["09:00-10:00", "10:00-11:00", "11:00-12:00",
-              "12:00-13:00", "13:00-14:00", "14:00-15:00", "15:00-16:00",
-              "16:00-17:00", "17:00-18:00", "18:00-19:00", "19:00-20:00", "20:00-21:00"]
+# Boş ders programı şablonunu (başlıklar, gün/saat satırları ve renkler) oluşturur
+def build_schedule_template(layout, time_slots=time_slots):
+    import openpyxl
+    from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Ders Programı"
 
-# Online dersler
-def get_online_courses():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-    online_courses = []
-
-    # Yanlızca online dersleri çekme işlevi
-    cursor.execute("""
-        SELECT ders_adi, haftalik_saat, ogretim_uyesi_id, sinif, bolum_id, zorunlu_saat
-        FROM Dersler
-        WHERE online = 1  -- SADECE ONLINE DERSLERİ AL
-    """)
-
-    online_courses = cursor.fetchall()
-    conn.close()
-    return online_courses
-
-
-# Ortak dersleri belirleyip liste olarak döndür
-def get_common_courses():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-    common_courses = set()
-
-    cursor.execute("""
-        SELECT DISTINCT ders_adi, haftalik_saat, ogretim_uyesi_id, sinif
-        FROM Dersler
-        WHERE online = 0  -- Online dersleri hariç tut
-        AND ders_adi IN (
-            SELECT ders_adi FROM Dersler WHERE bolum_id IN (1, 2)
-            GROUP BY ders_adi HAVING COUNT(DISTINCT bolum_id) = 2
-        )
-    """)
+    class_count = max((len(columns) for _, columns in layout.values()), default=0)
 
-    for course in cursor.fetchall():
-        course_name, hours_per_week, instructor_id, class_year = course
-        common_courses.add((course_name, hours_per_week, instructor_id, class_year))
+    # Hücre genişliklerini ayarlama
+    ws.column_dimensions["A"].width = 15
+    ws.column_dimensions["B"].width = 15
+    for col in range(3, 3 + class_count):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 30
 
-    conn.close()
-    return list(common_courses)
+    thin_border = Border(
+        left=Side(style="thin"),
+        right=Side(style="thin"),
+        top=Side(style="thin"),
+        bottom=Side(style="thin"))
+
+    colors = ["FFDDC1", "D3E3FC", "FAF4B7", "D4E2D4"]
+
+    # Her bölümün tablosu yerleşimdeki satırlara alt alta yazılır
+    for department, (row_offsets, class_columns) in layout.items():
+        first_row = min(row_offsets.values())
+        header_row = first_row - 2
+        last_column = max(class_columns.values())
+
+        # Başlıklar
+        ws.merge_cells(start_row=header_row, start_column=1, end_row=header_row, end_column=2)
+        cell = ws.cell(row=header_row, column=1, value="Bölüm")
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+
+        ws.merge_cells(start_row=header_row + 1, start_column=1, end_row=header_row + 1, end_column=2)
+        cell = ws.cell(row=header_row + 1, column=1, value="Gün/Saatler")
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+
+        ws.merge_cells(start_row=header_row, start_column=3, end_row=header_row, end_column=last_column)
+        cell = ws.cell(row=header_row, column=3, value=department)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        cell.border = thin_border
+        ws.cell(row=header_row, column=last_column).border = thin_border
+
+        # Sınıf başlıklarını ekleme
+        for class_year, column in class_columns.items():
+            cell = ws.cell(row=header_row + 1, column=column, value=f"{class_year}. Sınıf")
+            cell.font = Font(bold=True)
+            cell.alignment = Alignment(horizontal="center")
+            cell.border = thin_border
+
+        # Gün ve saatleri ekleme
+        for day in days:
+            row_num = row_offsets[day]
+            ws.merge_cells(start_row=row_num, start_column=1, end_row=row_num + len(time_slots) - 1, end_column=1)
+            cell = ws.cell(row=row_num, column=1, value=day)
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.font = Font(bold=True)
+            cell.border = thin_border
+
+            for slot_index, time_slot in enumerate(time_slots):
+                cell = ws.cell(row=row_num + slot_index, column=2, value=time_slot)
+                cell.alignment = Alignment(horizontal="center", vertical="center")
+                cell.font = Font(bold=True)
+                cell.border = thin_border
+
+        # Sınıf sütunlarını renklendirme
+        for row in ws.iter_rows(min_row=first_row, max_row=first_row + len(days) * len(time_slots) - 1, min_col=3,
+                                max_col=last_column):
+            for idx, cell in enumerate(row):
+                cell.fill = PatternFill(start_color=colors[idx % len(colors)], end_color=colors[idx % len(colors)],
+                                        fill_type="solid")
+                cell.border = thin_border
+
+    return wb
+
+
+# Tamamlanan programı şablona tek seferde yazar
+def write_schedule_to_excel(schedule, filename="Ders_Programi.xlsx"):
+    from openpyxl.styles import Alignment
+
+    wb = build_schedule_template(schedule.layout, schedule.time_slots)
+    ws = wb.active
+
+    for day, slot_index, department, class_year, course_name in schedule.items():
+        row_offsets, class_columns = schedule.layout[department]
+        if class_year in class_columns:
+            cell = ws.cell(row=row_offsets[day] + slot_index, column=class_columns[class_year],
+                           value=f"{course_name}\n")
+            cell.alignment = Alignment(wrapText=True)
+
+    wb.save(filename)
+
+
+# Programa yerleştirilecek dersler; açgözlü aşamalar, çözücü, iyileştirme ve onarım bu tanımı kullanır.
+# Aynı isimli satırlar tek ders olarak birleştirilir: ders, satırların bölüm/sınıf hücrelerinin hepsine aynı saatte
+# yazılır (ortak dersler) ve haftalık saati satırların en büyüğüdür. Dersi, id sırasıyla uygunluğu tanımlı olan ilk
+# satırın öğretim üyesi verir (uygunluk verilmezse ilk satırınki). Her ders öğrenci sayısını ve zorunlu saatlerini
+# taşır; zorunlu_saat '0' ise dersin zorunlu saati yoktur
+def get_schedule_units(session=None, instructor_availability=None):
+    with db_session(session) as session:
+        rows = session.execute("""
+            SELECT d.id, d.ders_adi, d.haftalik_saat, d.ogretim_uyesi_id, d.sinif, b.bolum_adi,
+                   d.online, d.zorunlu_saat, d.statu, COUNT(od.ogrenci_id)
+            FROM Dersler d
+            LEFT JOIN Bolumler b ON b.id = d.bolum_id
+            LEFT JOIN OgrenciDers od ON od.ders_id = d.id
+            GROUP BY d.id, d.ders_adi, d.haftalik_saat, d.ogretim_uyesi_id, d.sinif, b.bolum_adi,
+                     d.online, d.zorunlu_saat, d.statu
+            ORDER BY d.id
+        """).fetchall()
+
+    units = {}
+    for course_id, course_name, hours, instructor_id, class_year, department, online, mandatory, status, students \
+            in rows:
+        if mandatory in ("", "0"):
+            mandatory = None
+        unit = units.get(course_name)
+        if unit is None:
+            unit = units[course_name] = {
+                "name": course_name, "course_id": course_id, "hours": int(hours), "instructor_id": instructor_id,
+                "online": bool(online) and int(online) == 1, "mandatory_time": mandatory or "",
+                "status": status or "NORMAL", "students": 0, "classes": [],
+            }
+        elif instructor_availability and not instructor_availability.get(unit["instructor_id"]) and \
+                instructor_availability.get(instructor_id):
+            unit["instructor_id"] = instructor_id
+        if (department, class_year) not in unit["classes"]:
+            unit["classes"].append((department, class_year))
+        unit["hours"] = max(unit["hours"], int(hours))
+        unit["students"] += students
+        if not unit["mandatory_time"] and mandatory:
+            unit["mandatory_time"] = mandatory
+
+    return list(units.values())
+
+
+# Dersleri açgözlü aşamalara ayırır: online dersler, birden fazla bölümde okutulan ortak dersler ve bölüme özel
+# dersler
+def split_schedule_units(units):
+    online_units, common_units, department_units = [], [], []
+    for unit in units:
+        if unit["online"]:
+            online_units.append(unit)
+        elif len({department for department, _ in unit["classes"]}) > 1:
+            common_units.append(unit)
+        else:
+            department_units.append(unit)
+    return online_units, common_units, department_units
 
 #Belirtilen başlangıç ve bitiş saatleri arasındaki tüm saat aralıklarını oluşturur.
 def expand_time_range(start_time, end_time):
@@ -1167,102 +2334,67 @@ def expand_time_range(start_time, end_time):
     return slots
 
 
-def get_instructor_availability():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+# Uygunluk ve doluluk maskelerinde her gün len(time_slots) bit kaplar: bit = gün * len(time_slots) + saat
+# Verilen günde start saatinden başlayan length saatlik bloğun maskesi
+def block_mask(day_index, start_index, length, slot_count=len(time_slots)):
+    return ((1 << length) - 1) << (day_index * slot_count + start_index)
+
+
+# Maskede gün içinde tamamen açık olan length saatlik blokların başlangıç saatlerini sırayla verir
+def free_blocks(mask, day_index, length, slot_count=len(time_slots)):
+    for start in range(slot_count - length + 1):
+        bits = block_mask(day_index, start, length, slot_count)
+        if mask & bits == bits:
+            yield start
+
+
+def get_instructor_availability(session=None, time_slots=time_slots):
     instructor_availability = {}
 
     # Öğretim üyelerinin uygun saatlerini çek
-    cursor.execute("""
-        SELECT id, ogretim_gorevlisi, pazartesi, sali, carsamba, persembe, cuma
-        FROM OgretimGorevlileri
-    """)
+    with db_session(session) as session:
+        rows = session.execute("""
+            SELECT id, ogretim_gorevlisi, pazartesi, sali, carsamba, persembe, cuma
+            FROM OgretimGorevlileri
+        """).fetchall()
 
-    rows = cursor.fetchall()
     if not rows:
         print(" Uyarı: Öğretim üyelerinin uygun saatleri veritabanından çekilemedi!")
         return None
 
-    days = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma"]
+    slot_count = len(time_slots)
+    slot_index = {slot: i for i, slot in enumerate(time_slots)}
+    slot_starts = {slot.split("-")[0]: i for i, slot in enumerate(time_slots)}
+    slot_ends = {slot.split("-")[1]: i for i, slot in enumerate(time_slots)}
 
+    # Her öğretim üyesinin haftalık uygunluğu tek bir bit maskesinde tutulur
     for row in rows:
         instructor_id = row[0]
-        instructor_name = row[1]  # Öğretim üyesi adı
-        instructor_availability[instructor_id] = {}
-
-        for i, day in enumerate(days, start=2):
-            available_hours = row[i]
-            if available_hours:
-                times = available_hours.split(", ")
-                expanded_slots = []
+        mask = 0
 
-                # Saat aralıklarını genişletme işlevi
-                for j in range(len(times) - 1):
-                    expanded_slots.extend(expand_time_range(times[j], times[j + 1]))
+        for day_index in range(len(days)):
+            available_hours = row[2 + day_index]
+            if not available_hours:
+                continue
 
-                instructor_availability[instructor_id][day] = expanded_slots
-            else:
-                instructor_availability[instructor_id][day] = []
+            times = [t.strip() for t in available_hours.split(", ")]
+            for j in range(len(times) - 1):
+                start = slot_starts.get(times[j])
+                end = slot_ends.get(times[j + 1])
+                if start is not None and end is not None:
+                    if end >= start:
+                        mask |= block_mask(day_index, start, end - start + 1, slot_count)
+                else:
+                    # Saat dilimlerine tam oturmayan aralıklar saat saat açılır, dilimlere denk gelenler alınır
+                    for slot in expand_time_range(times[j], times[j + 1]):
+                        if slot in slot_index:
+                            mask |= block_mask(day_index, slot_index[slot], 1, slot_count)
+
+        instructor_availability[instructor_id] = mask
 
-    conn.close()
     return instructor_availability
 
 
-def sort_instructors_by_availability(instructor_availability):
-    sorted_availability = {}
-    for instructor, days in instructor_availability.items():
-        sorted_days = sorted(days.items(), key=lambda x: len(x[1]), reverse=True)
-        sorted_availability[instructor] = {day: times for day, times in sorted_days}
-    return sorted_availability
-
-
-# Uygun saatleri biçimlendiren fonksiyon
-def convert_times_to_slots(instructor_availability, time_slots):
-    print("time_slots içeriği:", time_slots)
-
-    converted_availability = {}
-    for instructor, availability in instructor_availability.items():
-        converted_availability[instructor] = {}
-
-        for day, hours in availability.items():
-            converted_availability[instructor][day] = []
-
-            for i in range(len(hours) - 1):
-                start_time = hours[i]
-                end_time = hours[i + 1]
-
-                # Saat aralığı uygunsa time_slots'a ekle
-                for slot in time_slots:
-                    slot_start, slot_end = slot.split('-')
-                    if slot_start == start_time and slot_end == end_time:
-                        converted_availability[instructor][day].append(slot)
-
-    return converted_availability
-
-#Online ve ortak dersler dışında kalan bölüme özel dersleri veritabanından çeker.
-def get_department_courses():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-    department_courses = []
-
-    cursor.execute("""
-        SELECT DISTINCT ders_adi, haftalik_saat, ogretim_uyesi_id, sinif, bolum_id
-        FROM Dersler
-        WHERE online = 0  -- Online dersleri hariç tut
-        AND ders_adi NOT IN (
-            SELECT DISTINCT ders_adi FROM Dersler WHERE bolum_id IN (1, 2)
-            GROUP BY ders_adi HAVING COUNT(DISTINCT bolum_id) = 2
-        )  -- Ortak dersleri hariç tut
-    """)
-
-    for course in cursor.fetchall():
-        course_name, hours_per_week, instructor_id, class_year, department_id = course
-        department_courses.append((course_name, hours_per_week, instructor_id, class_year, department_id))
-
-    conn.close()
-    return department_courses
-
-
 # Veritabanından gelen 'zorunlu_saat' değerlerini uygun 'time_slots' formatına çevirir.
 def convert_mandatory_time(mandatory_time):
     slot_mapping = {
@@ -1294,688 +2426,1756 @@ def convert_mandatory_time(mandatory_time):
     return converted_slots
 
 
-def get_instructor_name(instructor_id):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+# Çoklu başlatma işçilerinde veritabanına gitmeden kullanılan öğretim üyesi adları (id -> ad)
+instructor_names = {}
 
-    cursor.execute("""
-        SELECT ogretim_gorevlisi FROM OgretimGorevlileri WHERE id = ?
-    """, (instructor_id,))
-    row = cursor.fetchone()
-    conn.close()
 
-    return row[0] if row else "Bilinmeyen Öğretim Üyesi"
+def get_instructor_name(instructor_id, session=None):
+    if instructor_id in instructor_names:
+        return instructor_names[instructor_id]
 
+    with db_session(session) as session:
+        row = session.execute("""
+            SELECT ogretim_gorevlisi FROM OgretimGorevlileri WHERE id = ?
+        """, (instructor_id,)).fetchone()
 
-def assign_courses_to_schedule(online_courses, time_slots):
-    wb = openpyxl.load_workbook("Ders_Programi.xlsx")
-    ws = wb.active
+    # Hücre metni bu adla bittiği için sondaki boşluklar atılır
+    return row[0].strip() if row else "Bilinmeyen Öğretim Üyesi"
 
-    days = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma"]
-    # Boş program tablosu oluştur
-    schedule = {
-        day: {slot: {"Yazılım Mühendisliği": {1: None, 2: None, 3: None},
-                     "Bilgisayar Mühendisliği": {1: None, 2: None, 3: None, 4: None}}
-              for slot in time_slots}
-        for day in days
-    }
 
-    # Dersin kaç saat atandığını takip eden sözlük işlevi
-    assigned_hours_per_course = {course[0]: 0 for course in online_courses}
+def load_instructor_names(session=None):
+    with db_session(session) as session:
+        rows = session.execute("SELECT id, ogretim_gorevlisi FROM OgretimGorevlileri").fetchall()
+    return {row[0]: row[1].strip() for row in rows if row[1] is not None}
 
-    # Öncelikle en fazla saat gerektiren dersleri sıralayan işlev (Büyükten küçüğe)
-    online_courses.sort(key=lambda x: x[1], reverse=True)
+# Online derslerin hücre metni; derslik atanmayan bu hücreler Excel'e bu metinle yazılır
+def online_cell_text(course_name, instructor_name):
+    return f"{course_name}\n{instructor_name} (Online)"
 
-    for course in online_courses:
-        course_name, hours_per_week, instructor_id, class_year, department_id, mandatory_time = course
-        instructor_name = get_instructor_name(instructor_id)
 
-        # Eğer ders zaten atanmış ve haftalık saat dolmuşsa atamayı geç
-        if assigned_hours_per_course[course_name] >= hours_per_week:
+# order verilirse dersler varsayılan sıralama yerine bu anahtar işleviyle sıralanır (tüm aşamalarda aynı)
+def assign_courses_to_schedule(schedule, online_units, time_slots, session=None, order=None):
+    # Öncelikle en fazla saat gerektiren dersleri sıralayan işlev (Büyükten küçüğe)
+    online_units = sorted(online_units, key=order or (lambda unit: -unit["hours"]))
+
+    # Online derslerin hücre metnine "(Online)" notu eklenir, derslik atamasında bu dersler atlanır
+    for unit in online_units:
+        course_name, hours_per_week, instructor_id = unit["name"], unit["hours"], unit["instructor_id"]
+        text = online_cell_text(course_name, get_instructor_name(instructor_id, session))
+
+        # Saat dersin ilk hücresine göre seçilir, ders aynı saatte dersi alan diğer bölüm/sınıflara da boşsa yazılır
+        cells = [(department, class_year) for department, class_year in unit["classes"]
+                 if department in schedule.department_index]
+        if not cells:
+            print(f"{course_name} dersinin bölümleri programda yok, atlanıyor.")
             continue
+        (department, class_year), shared_cells = cells[0], cells[1:]
+        assigned_hours = 0
 
-        assigned_hours = assigned_hours_per_course[course_name]
-        assigned_slots = []
-
-        # Dersin ait olduğu bölüm belirlenir
-        department = "Bilgisayar Mühendisliği" if department_id == 2 else "Yazılım Mühendisliği"
-
-        # Eğer ders her iki bölümde de aynı sınıfta okutuluyorsa bunu işaretle
-        is_shared = any(c[0] == course_name and c[3] == class_year and c[4] != department_id for c in online_courses)
-
-        # Zorunlu saatleri uygun formata çevir
-        valid_mandatory_slots = convert_mandatory_time(mandatory_time)
+        def place(selected_day, slot):
+            schedule.place(selected_day, [slot], [department], [class_year], text, instructor_id, course_name)
+            for other_department, other_class in shared_cells:
+                if schedule.get(selected_day, slot, other_department, other_class) is None:
+                    schedule.place(selected_day, [slot], [other_department], [other_class], text, instructor_id,
+                                   course_name)
 
         # Öncelikle zorunlu saatleri yerleştir
+        valid_mandatory_slots = convert_mandatory_time(unit["mandatory_time"]) if unit["mandatory_time"] else []
         for selected_day in days:
             for slot in valid_mandatory_slots:
                 if assigned_hours >= hours_per_week:
                     break
 
-                if schedule[selected_day][slot][department].get(class_year) is None:
-                    schedule[selected_day][slot][department][class_year] = f"{course_name}\n{instructor_name}"
+                if schedule.get(selected_day, slot, department, class_year) is None:
+                    place(selected_day, slot)
                     assigned_hours += 1
-                    assigned_hours_per_course[course_name] = assigned_hours
-                    assigned_slots.append(f"{selected_day}, {slot}, {class_year}. sınıf - {department}")
 
-                    if is_shared:
-                        other_department = "Bilgisayar Mühendisliği" if department == "Yazılım Mühendisliği" else "Yazılım Mühendisliği"
-                        if schedule[selected_day][slot][other_department].get(class_year) is None:
-                            schedule[selected_day][slot][other_department][
-                                class_year] = f"{course_name}\n{instructor_name}"
+        # Eğer hala boş saatler varsa kalanları yerleştir; önce öğrenci çakışması sınırı aşmayan saatler,
+        # ardından sınır gözetilmeden kalan boş saatler denenir
+        for tolerance in (MAX_STUDENT_CLASH, None):
+            for selected_day in days:
+                for slot in time_slots:
+                    if assigned_hours >= hours_per_week:
+                        break
 
-        # Eğer hala boş saatler varsa kalanları yerleştir
-        for selected_day in days:
-            for slot in time_slots:
-                if assigned_hours >= hours_per_week:
-                    break
+                    if schedule.get(selected_day, slot, department, class_year) is not None:
+                        continue
+                    if tolerance is not None and \
+                            schedule.clash(course_name, schedule.slot_mask(selected_day, [slot])) > tolerance:
+                        continue
 
-                if schedule[selected_day][slot][department].get(class_year) is None:
-                    schedule[selected_day][slot][department][class_year] = course_name
+                    place(selected_day, slot)
                     assigned_hours += 1
-                    assigned_hours_per_course[course_name] = assigned_hours
-                    assigned_slots.append(f"{selected_day}, {slot}, {class_year}. sınıf - {department}")
-
-                    if is_shared:
-                        other_department = "Bilgisayar Mühendisliği" if department == "Yazılım Mühendisliği" else "Yazılım Mühendisliği"
-                        if schedule[selected_day][slot][other_department].get(class_year) is None:
-                            schedule[selected_day][slot][other_department][
-                                class_year] = f"{course_name}\n{instructor_name}(Online)"
-
-    # 4. Sınıfa 3. Sınıfın Derslerini Kopyala
-    for day, slots in schedule.items():
-        for slot, departments in slots.items():
-            if departments["Bilgisayar Mühendisliği"][4] is None and departments["Bilgisayar Mühendisliği"][
-                3] is not None:
-                departments["Bilgisayar Mühendisliği"][4] = departments["Bilgisayar Mühendisliği"][3]
-
-    # Debug için terminalde schedule'ı yazdır
-    '''print("\n Debug İçin: Atama Sonrası Schedule Kontrolü\n")
-    for day, slots in schedule.items():
-        print(f" {day}:")
-        for time_slot, classes in slots.items():
-            for department, class_data in classes.items():
-                for class_year, course in class_data.items():
-                    if course:
-                        print(f"   {time_slot} | {class_year}. sınıf - {department} -> {course}")'''
-
-    wb.save("Ders_Programi.xlsx")
-
-    # Dersleri excel'e yaz
-    row_offsets = {
-        "Pazartesi": 3,
-        "Salı": 15,
-        "Çarşamba": 27,
-        "Perşembe": 39,
-        "Cuma": 51
-    }
 
-    sw_row_offsets = {
-        "Pazartesi": 67,
-        "Salı": 79,
-        "Çarşamba": 91,
-        "Perşembe": 103,
-        "Cuma": 115
-    }
-
-    class_columns_bm = {1: 3, 2: 4, 3: 5, 4: 6}  # Bilgisayar Mühendisliği için sınıf sütunları
-    class_columns_sw = {1: 3, 2: 4, 3: 5}  # Yazılım Mühendisliği için sınıf sütunları
+    return trim_schedule_to_layout(schedule)
+
+
+# Dersi, dersi alan tüm bölüm/sınıf hücrelerinde aynı saatlere tek blok olarak yerleştirir: öğretim üyesinin uygun
+# ve boş olduğu, hücrelerin boş kaldığı ve derslik bulunan ilk blok; öğrenci çakışması MAX_STUDENT_CLASH'ı aşmayan
+# blok yoksa en az çakışan blok seçilir. Ders yerleşirse True döner
+def place_unit_block(schedule, unit, instructor_availability, time_slots, session=None):
+    course_name, hours_per_week, instructor_id = unit["name"], unit["hours"], unit["instructor_id"]
+
+    if instructor_id not in instructor_availability:
+        print(f"Öğretim Üyesi ID {instructor_id} için uygunluk bilgisi bulunamadı. {course_name} atlanıyor.")
+        return False
+
+    # Dersi alan bölümler ve her bölümde dersi alan sınıflar
+    related_cells = {}
+    for department, class_year in unit["classes"]:
+        if department in schedule.department_index and 1 <= class_year <= schedule.cells.shape[3]:
+            related_cells.setdefault(department, []).append(class_year)
+    if not related_cells:
+        print(f"{course_name} dersinin bölümleri programda yok, atlanıyor.")
+        return False
+
+    best_block = None
+    fallback = None  # (çakışan öğrenci sayısı, gün, saatler)
+    for day_index, selected_day in enumerate(days):
+        # Öğretim üyesinin uygun olduğu blokların içinden boş olanların bulunması
+        for start in free_blocks(instructor_availability[instructor_id], day_index, hours_per_week,
+                                 len(time_slots)):
+            bits = block_mask(day_index, start, hours_per_week, len(time_slots))
+            block_slots = time_slots[start:start + hours_per_week]
+
+            # Öğretim üyesinin bu saatlerde tüm bölüm ve aşamalardaki dersleri id ile kontrol edilir;
+            # blok süresince boş ve yeterli büyüklükte derslik kalmayan bloklar baştan elenir
+            if schedule.is_instructor_free(instructor_id, bits) and \
+                    all(schedule.is_free(selected_day, block_slots, [department], classes)
+                        for department, classes in related_cells.items()) and \
+                    schedule.has_room(course_name, bits):
+                clash = schedule.clash(course_name, bits)
+                if clash <= MAX_STUDENT_CLASH:
+                    best_block = (selected_day, block_slots)
+                    break  # Uygun ilk blok bulunduğunda döngüden çıkılır
+                if fallback is None or clash < fallback[0]:
+                    fallback = (clash, selected_day, block_slots)
 
-    for day, slots in schedule.items():
-        for slot, classes in slots.items():
-            try:
-                slot_index = time_slots.index(slot)
-            except ValueError:
-                continue  # Eğer zaman dilimi bulunamazsa atla
-
-            # Bilgisayar Mühendisliği'ni yaz
-            row_num_bm = row_offsets[day] + slot_index
-            for class_year, course_name in classes["Bilgisayar Mühendisliği"].items():
-                if course_name and class_year in class_columns_bm:
-                    col = class_columns_bm[class_year]
-                    ws.cell(row=row_num_bm, column=col, value=f"{course_name}\n(Online)")
-                    ws.cell(row=row_num_bm, column=col).alignment = Alignment(wrapText=True)
-
-            # Yazılım Mühendisliği'ni yaz
-            row_num_sw = sw_row_offsets[day] + slot_index
-            for class_year, course_name in classes["Yazılım Mühendisliği"].items():
-                if course_name and class_year in class_columns_sw:
-                    col = class_columns_sw[class_year]
-                    ws.cell(row=row_num_sw, column=col, value=f"{course_name}\n(Online)")
-                    ws.cell(row=row_num_sw, column=col).alignment = Alignment(wrapText=True)
-
-    wb.save("Ders_Programi.xlsx")
-
-
-def assign_common_courses(common_courses, instructor_availability, time_slots):
-    wb = openpyxl.load_workbook("Ders_Programi.xlsx")
-    ws = wb.active
-    days = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma"]
-
-    # Mevcut ders programını çek
-    schedule = {
-        day: {slot: {"Yazılım Mühendisliği": {1: None, 2: None, 3: None},
-                     "Bilgisayar Mühendisliği": {1: None, 2: None, 3: None, 4: None}}
-              for slot in time_slots}
-        for day in days
-    }
+    # Öğrenci çakışması sınırın altında kalan blok yoksa en az çakışan blok kullanılır
+    if best_block is None and fallback is not None:
+        best_block = fallback[1:]
+    if best_block is None:
+        return False
 
-    # Mevcut excelden dersleri al ve schedule'a kaydet
-    for day, row_offset in zip(days, [3, 15, 27, 39, 51]):
-        for slot_index, slot in enumerate(time_slots):
-            row_bm = row_offset + slot_index
-            row_sw = row_offset + 64 + slot_index
+    selected_day, block_slots = best_block
+    text = f"{course_name}\n{get_instructor_name(instructor_id, session)}"
+    for department, classes in related_cells.items():
+        schedule.place(selected_day, block_slots, [department], classes, text, instructor_id, course_name)
+    return True
 
-            for class_year in range(1, 5):
-                bm_col = {1: 3, 2: 4, 3: 5, 4: 6}.get(class_year, None)
-                sw_col = {1: 3, 2: 4, 3: 5}.get(class_year, None)
 
-                if bm_col:
-                    existing_bm_course = ws.cell(row=row_bm, column=bm_col).value
-                    if existing_bm_course:
-                        schedule[day][slot]["Bilgisayar Mühendisliği"][class_year] = existing_bm_course
+def assign_common_courses(schedule, common_units, instructor_availability, time_slots, session=None, order=None):
+    # Ortak dersleri öncelik sırasına göre ekleme (alt sınıfların dersleri ve uzun dersler önce)
+    common_units = sorted(common_units, key=order or (
+        lambda unit: (min(class_year for _, class_year in unit["classes"]), -unit["hours"])))
 
-                if sw_col:
-                    existing_sw_course = ws.cell(row=row_sw, column=sw_col).value
-                    if existing_sw_course:
-                        schedule[day][slot]["Yazılım Mühendisliği"][class_year] = existing_sw_course
+    # Ortak ders, dersi okutan her bölümde dersi alan sınıfların hücrelerine aynı saatte yazılır
+    for unit in common_units:
+        place_unit_block(schedule, unit, instructor_availability, time_slots, session)
 
-    # Öğretim üyesinin uygun saatlerinin belirlenmesi
-    instructor_schedule = {instructor: {day: [] for day in days} for instructor in instructor_availability}
+    return trim_schedule_to_layout(schedule)
 
-    # Sözlük ile derslerin kaç saat atandığını kontrol etme
-    assigned_hours_per_course = {course[0]: 0 for course in common_courses}
 
-    # Ortak dersleri öncelik sırasına göre ekleme
-    common_courses.sort(key=lambda x: (x[3], -x[1]))
+#Bölüme özel dersleri uygun boş saatlere yerleştirir ve programa ekler.
+def assign_department_courses(schedule, department_units, instructor_availability, time_slots, session=None,
+                              order=None):
+    # Bölüm derslerini öncelik sırasına göre sırala (Saat sayısına göre büyükten küçüğe)
+    department_units = sorted(department_units, key=order or (lambda unit: -unit["hours"]))
+
+    for unit in department_units:
+        place_unit_block(schedule, unit, instructor_availability, time_slots, session)
 
-    for course in common_courses:
-        course_name, hours_per_week, instructor_id, class_year = course
-        instructor_name = get_instructor_name(instructor_id)
+    return trim_schedule_to_layout(schedule)
 
-        if instructor_id not in instructor_availability:
-            print(f" Öğretim Üyesi ID {instructor_id} için uygunluk bilgisi bulunamadı. {course_name} atlanıyor.")
+
+MAX_STUDENT_CLASH = int(os.environ.get("DERS_PROGRAMI_MAX_CLASH", "0"))
+
+
+def configure_conflicts(max_clash=None):
+    global MAX_STUDENT_CLASH
+    if max_clash is not None:
+        MAX_STUDENT_CLASH = max_clash
+
+
+# Ortak öğrencisi olan dersler arasındaki ağırlıklı çakışma grafiği (ağırlık = iki derse birden kayıtlı öğrenci).
+# Komşuluklar CSR biçiminde tutulur: names[i] dersinin komşuları indices[indptr[i]:indptr[i + 1]],
+# ortak öğrenci sayıları aynı aralıktaki weights değerleridir
+class ConflictGraph:
+    def __init__(self, names, rows, cols, weights):
+        import numpy
+
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+        # Kenarlar iki yönlü yazılıp satıra göre sıralanır
+        rows, cols = numpy.concatenate([rows, cols]), numpy.concatenate([cols, rows])
+        weights = numpy.concatenate([weights, weights])
+        order = numpy.lexsort((cols, rows))
+        self.indices = cols[order].astype(numpy.int32)
+        self.weights = weights[order].astype(numpy.int32)
+        self.indptr = numpy.zeros(len(self.names) + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=len(self.names)), out=self.indptr[1:])
+
+    def neighbors(self, course_name):
+        i = self.index[course_name]
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.weights[start:end]
+
+    def weight(self, course_name, other_name):
+        if course_name not in self.index or other_name not in self.index:
+            return 0
+        neighbors, weights = self.neighbors(course_name)
+        position = neighbors.searchsorted(self.index[other_name])
+        if position < len(neighbors) and neighbors[position] == self.index[other_name]:
+            return int(weights[position])
+        return 0
+
+    # Ağırlığı min_weight ve üzeri olan kenarlar (ders, ders, ağırlık), her kenar bir kez
+    def edges(self, min_weight=1):
+        for i, name in enumerate(self.names):
+            for j, weight in zip(*self.neighbors(name)):
+                if i < j and weight >= min_weight:
+                    yield name, self.names[j], int(weight)
+
+
+# Ders çakışma grafiğini OgrenciDers üzerinde tek bir gruplanmış öz-birleştirme sorgusuyla oluşturur.
+# Programlama ders adı üzerinden yürüdüğü için aynı isimli dersler tek düğümde birleştirilir
+def build_conflict_graph(session=None):
+    import numpy
+
+    with db_session(session) as session:
+        courses = session.execute("SELECT id, ders_adi FROM Dersler ORDER BY id").fetchall()
+        pairs = session.execute("""
+            SELECT a.ders_id, b.ders_id, COUNT(*)
+            FROM OgrenciDers a
+            JOIN OgrenciDers b ON b.ogrenci_id = a.ogrenci_id AND b.ders_id > a.ders_id
+            GROUP BY a.ders_id, b.ders_id
+        """).fetchall()
+
+    names = sorted({name for _, name in courses})
+    name_index = {name: i for i, name in enumerate(names)}
+    course_ids = numpy.array([course_id for course_id, _ in courses], dtype=numpy.int64)
+    course_names = numpy.array([name_index[name] for _, name in courses], dtype=numpy.int64)
+
+    pairs = numpy.array(pairs, dtype=numpy.int64).reshape(-1, 3)
+    known = numpy.isin(pairs[:, 0], course_ids) & numpy.isin(pairs[:, 1], course_ids)
+    pairs = pairs[known]
+    order = course_ids.argsort()
+    a = course_names[order][course_ids[order].searchsorted(pairs[:, 0])]
+    b = course_names[order][course_ids[order].searchsorted(pairs[:, 1])]
+
+    # Ders kimliği çiftlerini ad çiftlerine indirger, aynı ada düşen çiftlerin ağırlıklarını toplar
+    distinct = a != b
+    low, high, weights = numpy.minimum(a, b)[distinct], numpy.maximum(a, b)[distinct], pairs[distinct, 2]
+    keys, inverse = numpy.unique(low * len(names) + high, return_inverse=True)
+    weights = numpy.bincount(inverse.ravel(), weights=weights, minlength=len(keys)).astype(numpy.int64)
+
+    return ConflictGraph(names, keys // len(names), keys % len(names), weights)
+
+
+SOLVER_TIME_LIMIT = float(os.environ.get("DERS_PROGRAMI_SOLVER_TIME_LIMIT", "30"))
+SOLVER_WORKERS = int(os.environ.get("DERS_PROGRAMI_SOLVER_WORKERS", "8"))
+
+
+def configure_solver(time_limit=None, workers=None):
+    global SOLVER_TIME_LIMIT, SOLVER_WORKERS
+    if time_limit is not None:
+        SOLVER_TIME_LIMIT = time_limit
+    if workers is not None:
+        SOLVER_WORKERS = workers
+
+
+# Tüm dersleri tek bir kısıt modeli olarak CP-SAT çözücüsüyle yerleştirir (açgözlü aşamaların alternatifi).
+# Karar değişkenleri ders x gün x başlangıç saatidir; her ders seçilen günde haftalık saati kadar ardışık
+# yer kaplar. Kısıtlar: öğretim üyesi uygunluğu (online dersler hariç), sınıf ve öğretim üyesi çakışmaması,
+# zorunlu saatler ve her saatte aynı statüdeki yeterli kapasiteli derslik sayısı. Hedef, yerleşen ders
+# saatini en çoklamak; eşitlikte dersleri günün erken saatlerine almaktır. Çakışma grafiği verilirse ortak
+# öğrencisi MAX_STUDENT_CLASH'ı aşan ders çiftlerinin aynı saate düşmesi ortak öğrenci sayısı kadar cezalandırılır
+def assign_courses_with_solver(schedule, units, instructor_availability, time_slots, classrooms,
+                               time_limit=None, workers=None, conflicts=None, session=None):
+    try:
+        from ortools.sat.python import cp_model
+    except ImportError:
+        raise ImportError("CP-SAT motoru için OR-Tools gerekli: pip install ortools")
+
+    slot_count = len(time_slots)
+    model = cp_model.CpModel()
+    starts = {}  # (ders no, gün, başlangıç) -> değişken
+    placed = []
+
+    for u, unit in enumerate(units):
+        hours = unit["hours"]
+        cells = [(department, class_year) for department, class_year in unit["classes"]
+                 if department in schedule.department_index and 1 <= class_year <= schedule.cells.shape[3]]
+        unit["cells"] = cells
+        if not cells or hours < 1 or hours > slot_count:
+            print(f"{unit['name']} programdaki bölüm/sınıflara veya saat aralığına uymuyor, atlanıyor.")
             continue
 
-        if assigned_hours_per_course[course_name] >= hours_per_week:
+        if unit["online"]:
+            availability = (1 << (slot_count * len(days))) - 1
+        elif unit["instructor_id"] in instructor_availability:
+            availability = instructor_availability[unit["instructor_id"]]
+        else:
+            print(f"Öğretim Üyesi ID {unit['instructor_id']} için uygunluk bilgisi bulunamadı. "
+                  f"{unit['name']} atlanıyor.")
             continue
 
-        assigned_hours = 0
-        assigned_slots = []
-
-        # Ortak dersi alan sınıfların bulunması
-        related_classes = [c[3] for c in common_courses if c[0] == course_name]
-
-        best_block = None
-        for selected_day in days:
-            if selected_day not in instructor_availability[instructor_id]:
-                continue
-
-            available_slots = instructor_availability[instructor_id][selected_day]
-            # Boş olan saaatlerin bulunması
-            for i in range(len(available_slots) - (hours_per_week - 1)):
-                block_slots = available_slots[i:i + hours_per_week]
-
-                is_valid = all([
-                    slot in time_slots for slot in block_slots
-                ]) and all([
-                    slot not in instructor_schedule[instructor_id][selected_day] for slot in block_slots
-                ]) and all([
-                    all(schedule[selected_day][slot]["Bilgisayar Mühendisliği"].get(cls) is None and
-                        schedule[selected_day][slot]["Yazılım Mühendisliği"].get(cls) is None
-                        for cls in related_classes)
-                    for slot in block_slots
-                ])
-
-                if is_valid:
-                    best_block = (selected_day, block_slots)
-                    break  # Uygun ilk blok bulunduğunda döngüden çıkılır
-
-        # Eğer en iyi blok bulunduysa ders atanır
-        if best_block:
-            selected_day, block_slots = best_block
-
-            for slot in block_slots:
-                for cls in related_classes:
-                    schedule[selected_day][slot]["Bilgisayar Mühendisliği"][cls] = f"{course_name}\n{instructor_name}"
-                    schedule[selected_day][slot]["Yazılım Mühendisliği"][cls] = f"{course_name}\n{instructor_name}"
+        pinned = None
+        if unit["mandatory_time"]:
+            pinned = {time_slots.index(slot) for slot in convert_mandatory_time(unit["mandatory_time"])
+                      if slot in time_slots}
+
+        # Dersin başlangıç seçenekleri değişkenlerle aynı geçişte toplanır
+        options = []
+        for day_index in range(len(days)):
+            for start in free_blocks(availability, day_index, hours, slot_count):
+                if pinned is not None and not set(range(start, start + hours)) <= pinned:
+                    continue
+                starts[u, day_index, start] = model.NewBoolVar(f"ders{u}_g{day_index}_s{start}")
+                options.append(starts[u, day_index, start])
+
+        if not options:
+            reason = "öğretim üyesinin tanımlı uygun saati yok" if not availability else \
+                "uygun saatlerde/zorunlu saatlerde yeterli ardışık blok yok"
+            print(f"{unit['name']} atlanıyor: {reason}.")
+            continue
+        is_placed = model.NewBoolVar(f"ders{u}_yerlesti")
+        model.Add(sum(options) == is_placed)
+        placed.append((u, is_placed))
+
+    # Dersin verilen gün ve saati kaplamasına yol açan başlangıç değişkenleri
+    def covering(unit_index, day_index, slot_index):
+        first = max(0, slot_index - units[unit_index]["hours"] + 1)
+        return [starts[unit_index, day_index, start] for start in range(first, slot_index + 1)
+                if (unit_index, day_index, start) in starts]
+
+    placeable = [u for u, _ in placed]
+    cell_units = {}
+    instructor_units = {}
+    for u in placeable:
+        for cell in units[u]["cells"]:
+            cell_units.setdefault(cell, []).append(u)
+        if units[u]["instructor_id"] is not None:
+            instructor_units.setdefault(units[u]["instructor_id"], []).append(u)
+
+    # Derslik sayısı kısıtı: statü başına, her öğrenci eşiği için aynı saatte en fazla o eşiği karşılayan
+    # derslik sayısı kadar ders olabilir (eşikler iç içe olduğundan bu, derslik eşleşmesinin var olmasını sağlar)
+    capacities = {}
+    for classroom in classrooms:
+        capacities.setdefault(classroom["status"], []).append(classroom["capacity"])
+    room_limits = []  # (derslik sayısı, eşiği aşan dersler)
+    for status, status_capacities in capacities.items():
+        status_units = [u for u in placeable if not units[u]["online"] and units[u]["status"] == status]
+        for threshold in sorted({units[u]["students"] for u in status_units}):
+            rooms = sum(1 for capacity in status_capacities if capacity >= threshold)
+            room_limits.append((rooms, [u for u in status_units if units[u]["students"] >= threshold]))
+    for status in {units[u]["status"] for u in placeable if not units[u]["online"]} - set(capacities):
+        room_limits.append((0, [u for u in placeable if not units[u]["online"] and units[u]["status"] == status]))
+
+    for day_index in range(len(days)):
+        for slot_index in range(slot_count):
+            for group in list(cell_units.values()) + list(instructor_units.values()):
+                terms = [var for u in group for var in covering(u, day_index, slot_index)]
+                if len(terms) > 1:
+                    model.Add(sum(terms) <= 1)
+
+            for rooms, group in room_limits:
+                terms = [var for u in group for var in covering(u, day_index, slot_index)]
+                if len(terms) > rooms:
+                    model.Add(sum(terms) <= rooms)
+
+    clash_penalties = []  # (ortak öğrenci sayısı, çakışma değişkeni)
+    if conflicts is not None:
+        name_units = {}
+        for u in placeable:
+            name_units.setdefault(units[u]["name"], []).append(u)
+        for name, other_name, weight in conflicts.edges(MAX_STUDENT_CLASH + 1):
+            for u in name_units.get(name, []):
+                for v in name_units.get(other_name, []):
+                    clashes = model.NewBoolVar(f"cakisma{u}_{v}")
+                    for day_index in range(len(days)):
+                        for slot_index in range(slot_count):
+                            u_terms, v_terms = covering(u, day_index, slot_index), covering(v, day_index, slot_index)
+                            if u_terms and v_terms:
+                                model.Add(sum(u_terms) + sum(v_terms) <= 1 + clashes)
+                    clash_penalties.append((weight, clashes))
+
+    model.Maximize(sum(1000 * units[u]["hours"] * var for u, var in placed) -
+                   sum(start * var for (_, _, start), var in starts.items()) -
+                   sum(weight * var for weight, var in clash_penalties))
+
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = SOLVER_TIME_LIMIT if time_limit is None else time_limit
+    solver.parameters.num_search_workers = SOLVER_WORKERS if workers is None else workers
+    status = solver.Solve(model)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        print(f"Hata: Çözücü süre içinde geçerli bir program bulamadı ({solver.StatusName(status)}).")
+        return schedule
+
+    placed_units = set()
+    for (u, day_index, start), var in starts.items():
+        if not solver.Value(var):
+            continue
+        unit = units[u]
+        placed_units.add(u)
+        instructor_name = get_instructor_name(unit["instructor_id"], session)
+        text = online_cell_text(unit["name"], instructor_name) if unit["online"] else \
+            f"{unit['name']}\n{instructor_name}"
+        departments = sorted({department for department, _ in unit["cells"]}, key=schedule.department_index.get)
+        for department in departments:
+            class_years = [class_year for cell_department, class_year in unit["cells"] if cell_department == department]
+            schedule.place(days[day_index], time_slots[start:start + unit["hours"]], [department], class_years, text,
+                           unit["instructor_id"], unit["name"])
+
+    print(f"Çözücü: {solver.StatusName(status)}, {len(placed_units)}/{len(units)} ders yerleşti "
+          f"({solver.WallTime():.2f} sn).")
+    if clash_penalties:
+        clashing = sum(weight for weight, var in clash_penalties if solver.Value(var))
+        print(f"Çözücü: aynı saate düşen derslerde toplam {clashing} öğrenci çakışması.")
+    for u, unit in enumerate(units):
+        if u not in placed_units:
+            classes = ", ".join(f"{department} {class_year}. sınıf" for department, class_year in unit["classes"])
+            print(f"  Yerleştirilemedi: {unit['name']} ({classes})")
+
+    return trim_schedule_to_layout(schedule)
+
+# İyileştirme amacının terimleri. Her terim, yerleşim programda yokken onu eklemenin maliyet artışını verir;
+# böylece bir hamlenin etkisi yalnızca taşınan yerleşimlerin dokunduğu hücrelerden hesaplanır
+LATE_SLOT_START = "19:00"
+
+
+# Yerleşen ders saatleri (dersin henüz dolu olmayan saatleri kadar eksi)
+def unplaced_hours_cost(schedule, placement):
+    if placement["course_name"] is None:
+        return 0
+    bits = schedule.slot_mask(placement["day"], placement["slots"])
+    return -bin(bits & ~schedule.course_slots.get(placement["course_name"], 0)).count("1")
+
+
+# Yerleşmesi gereken toplam ders saati. Yerleşen saatler course_slots'ta ders adıyla sayıldığı için toplam da ders
+# adı başına bir kez alınır; aynı adla birden fazla kayıt gelirse ders yerleşim aşamalarındaki gibi tek ders sayılır
+def required_hours(units):
+    hours = {}
+    for unit in units:
+        hours[unit["name"]] = max(hours.get(unit["name"], 0), unit["hours"])
+    return sum(hours.values())
+
+
+# Aynı saatte ortak öğrencisi olan başka bir derse denk gelen öğrenci sayısı
+def student_clash_cost(schedule, placement):
+    if placement["course_name"] is None:
+        return 0
+    return schedule.clash(placement["course_name"], schedule.slot_mask(placement["day"], placement["slots"]))
+
+
+# Gün içindeki ilk ve son dersi arasında öğretim üyesinin boş kalan saatleri
+def day_gaps(bits):
+    if not bits:
+        return 0
+    first = (bits & -bits).bit_length() - 1
+    return bits.bit_length() - first - bin(bits).count("1")
+
+
+def instructor_gap_cost(schedule, placement):
+    if placement["instructor_id"] is None:
+        return 0
+    slot_count = len(schedule.time_slots)
+    shift = schedule.day_index[placement["day"]] * slot_count
+    busy = (schedule.instructor_busy.get(placement["instructor_id"], 0) >> shift) & ((1 << slot_count) - 1)
+    bits = schedule.slot_mask(placement["day"], placement["slots"]) >> shift
+    return day_gaps(busy | bits) - day_gaps(busy)
+
+
+# Akşam (LATE_SLOT_START ve sonrası) saatlerine düşen ders saatleri
+def late_slot_cost(schedule, placement):
+    return sum(1 for slot in placement["slots"] if slot >= LATE_SLOT_START)
+
+
+# terim adı -> (maliyet işlevi, dersler listesinden terimin sabit başlangıç değeri veya None)
+OBJECTIVE_TERMS = {
+    "unplaced": (unplaced_hours_cost, required_hours),
+    "clash": (student_clash_cost, None),
+    "gaps": (instructor_gap_cost, None),
+    "late": (late_slot_cost, None),
+}
+
+
+# "unplaced=100,clash=10" biçimindeki amaç tanımını terim -> ağırlık sözlüğüne çevirir
+def parse_objective(text):
+    weights = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OBJECTIVE_TERMS:
+            raise ValueError(f"Bilinmeyen amaç terimi: {name} (seçenekler: {', '.join(OBJECTIVE_TERMS)})")
+        weights[name] = float(weight) if weight.strip() else 1.0
+    return weights
+
+
+OPTIMIZE_BUDGET = float(os.environ.get("DERS_PROGRAMI_OPTIMIZE_SECONDS", "0"))
+OPTIMIZE_OBJECTIVE = parse_objective(os.environ.get("DERS_PROGRAMI_OBJECTIVE", "unplaced=100,clash=10,gaps=1,late=2"))
+OPTIMIZE_START_TEMPERATURE = 20.0
+OPTIMIZE_END_TEMPERATURE = 0.05
+
+
+def configure_optimizer(budget=None, objective=None):
+    global OPTIMIZE_BUDGET, OPTIMIZE_OBJECTIVE
+    if budget is not None:
+        OPTIMIZE_BUDGET = budget
+    if objective is not None:
+        OPTIMIZE_OBJECTIVE = objective
+
+
+# Amaç terimlerinin programdaki toplam değerleri; kayıtlar baştan işlenerek her yerleşimin maliyeti toplanır
+def evaluate_schedule(schedule, units, weights):
+    totals = {}
+    for name in weights:
+        base = OBJECTIVE_TERMS[name][1]
+        totals[name] = base(units) if base else 0
+
+    def visit(placement):
+        for name in weights:
+            totals[name] += OBJECTIVE_TERMS[name][0](schedule, placement)
+
+    schedule.replay(visit)
+    return totals
+
+
+# Dersin programdaki bölüm/sınıf hücrelerine bölüm başına birer yerleşim şablonu (gün ve saatler hariç);
+# şablonda olmayan sınıflar (ör. bölümde okutulmayan bir sınıf) atlanır
+def unit_templates(schedule, unit, session=None):
+    cells = [(department, class_year) for department, class_year in unit["classes"]
+             if department in schedule.layout and class_year in schedule.layout[department][1]]
+    instructor_name = get_instructor_name(unit["instructor_id"], session)
+    text = online_cell_text(unit["name"], instructor_name) if unit["online"] else f"{unit['name']}\n{instructor_name}"
+    departments = sorted({department for department, _ in cells}, key=schedule.department_index.get)
+    return [{"departments": [department], "text": text, "instructor_id": unit["instructor_id"],
+             "course_name": unit["name"],
+             "class_years": [class_year for cell_department, class_year in cells if cell_department == department]}
+            for department in departments]
+
+
+# Öğretim üyesinin uygun olduğu başlangıç saatleri; online dersler uygunluğa bağlı değildir.
+# pinned verilirse blok tamamen bu saat indekslerinin içinde kalmalıdır (zorunlu saatler)
+def block_starts(instructor_id, online, instructor_availability, day_index, length, slot_count, pinned=None):
+    if online:
+        starts = range(slot_count - length + 1)
+    elif instructor_id in instructor_availability:
+        starts = free_blocks(instructor_availability[instructor_id], day_index, length, slot_count)
+    else:
+        return []
+    return [start for start in starts if pinned is None or set(range(start, start + length)) <= pinned]
+
+
+# Aynı gün ve saatlerdeki yerleşimlerin tüm hücreleri boşsa, öğretim üyesi o saatlerde boştaysa ve ders için
+# boş derslik kalıyorsa True döner
+def placements_fit(schedule, placements):
+    bits = schedule.slot_mask(placements[0]["day"], placements[0]["slots"])
+    if placements[0]["instructor_id"] is not None and \
+            not schedule.is_instructor_free(placements[0]["instructor_id"], bits):
+        return False
+    if not schedule.has_room(placements[0]["course_name"], bits):
+        return False
+    return all(schedule.is_free(placement["day"], placement["slots"], placement["departments"],
+                                placement["class_years"]) for placement in placements)
+
+
+# Biten programı verilen süre boyunca benzetimli tavlama ile iyileştirir. Hamleler, bir dersin bloğunu
+# (ortak derslerde tüm bölümlerdeki kopyalarıyla birlikte) başka bir güne/saate taşımak ve hiç yerleşmemiş bir
+# dersi boş bir bloğa eklemektir. Zorunlu saatli dersler yerinde kalır. Amaç, terim ağırlıklarıyla toplanan
+# maliyetin en azlanmasıdır; süre sonunda bulunan en iyi program döner
+def optimize_schedule(schedule, instructor_availability, time_slots, units=None, budget=None, objective=None,
+                      seed=None, session=None):
+    budget = OPTIMIZE_BUDGET if budget is None else budget
+    weights = OPTIMIZE_OBJECTIVE if objective is None else objective
+    units = units or []
+    rng = random.Random(seed)
+    slot_count = len(time_slots)
+
+    def cost(placement):
+        return sum(weight * OBJECTIVE_TERMS[name][0](schedule, placement) for name, weight in weights.items())
+
+    def put(placement):
+        return schedule.place(placement["day"], placement["slots"], placement["departments"],
+                              placement["class_years"], placement["text"], placement["instructor_id"],
+                              placement["course_name"])
+
+    # Yerleşimleri sırayla ekler; her biri programa girmeden önceki maliyet artışları toplanır
+    def add_all(placements):
+        delta, added = 0, []
+        for placement in placements:
+            delta += cost(placement)
+            added.append(put(placement))
+        return delta, added
+
+    def remove_all(placements):
+        delta = 0
+        for placement in reversed(placements):
+            schedule.remove(placement)
+            delta -= cost(placement)
+        return delta
+
+    pinned = {unit["name"] for unit in units if unit["mandatory_time"]}
+    groups = {}
+    for placement in schedule.placements:
+        if placement["course_name"] is None or placement["instructor_id"] is None or \
+                placement["course_name"] in pinned:
+            continue
+        key = (placement["course_name"], placement["instructor_id"], placement["day"], tuple(placement["slots"]))
+        groups.setdefault(key, []).append(placement)
+    groups = list(groups.values())
+
+    # Hiç yerleşmemiş dersler programa eklenebilir
+    pending = []
+    for unit in units:
+        templates = unit_templates(schedule, unit, session)
+        if schedule.course_slots.get(unit["name"]) or unit["name"] in pinned or not templates or \
+                not 1 <= unit["hours"] <= slot_count:
+            continue
+        pending.append((unit, templates))
+
+    initial = evaluate_schedule(schedule, units, weights)
+    current = best = sum(weights[name] * value for name, value in initial.items())
+    best_state = schedule.snapshot()
+    print(f"İyileştirme başlıyor: amaç {current:.1f} "
+          f"({', '.join(f'{name} {value:g}' for name, value in initial.items())}), süre {budget:g} sn.")
+
+    started = time.monotonic()
+    next_report = 1
+    tried = accepted = 0
+    while groups or pending:
+        elapsed = time.monotonic() - started
+        if elapsed >= budget:
+            break
+        if elapsed >= next_report:
+            print(f"  {elapsed:5.1f} sn: amaç {current:.1f} (en iyi {best:.1f}), "
+                  f"{accepted}/{tried} hamle kabul edildi")
+            next_report += 1
+        temperature = OPTIMIZE_START_TEMPERATURE * \
+            (OPTIMIZE_END_TEMPERATURE / OPTIMIZE_START_TEMPERATURE) ** (elapsed / budget)
+
+        inserting = pending and (not groups or rng.random() < 0.2)
+        if inserting:
+            index = rng.randrange(len(pending))
+            unit, templates = pending[index]
+            instructor_id, online, length = unit["instructor_id"], unit["online"], unit["hours"]
+        else:
+            index = rng.randrange(len(groups))
+            group = groups[index]
+            instructor_id, length = group[0]["instructor_id"], len(group[0]["slots"])
+            online = "(Online)" in group[0]["text"]
+            templates = group
+
+        day_index = rng.randrange(len(days))
+        starts = block_starts(instructor_id, online, instructor_availability, day_index, length, slot_count)
+        if not starts:
+            continue
+        start = rng.choice(starts)
+        moved = [dict(template, day=days[day_index], slots=time_slots[start:start + length])
+                 for template in templates]
+        tried += 1
+
+        delta = 0 if inserting else remove_all(group)
+        if not placements_fit(schedule, moved):
+            if not inserting:
+                groups[index] = add_all(group)[1]
+            continue
+        change, added = add_all(moved)
+        delta += change
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            accepted += 1
+            current += delta
+            if inserting:
+                pending.pop(index)
+                groups.append(added)
+            else:
+                groups[index] = added
+            if current < best - 1e-9:
+                best = current
+                best_state = schedule.snapshot()
+        else:
+            remove_all(added)
+            if not inserting:
+                groups[index] = add_all(group)[1]
 
-                instructor_schedule[instructor_id][selected_day].append(slot)
-                assigned_hours += 1
-                assigned_hours_per_course[course_name] = assigned_hours
-                assigned_slots.append(f"{selected_day}, {slot}, {related_classes} sınıfları - Ortak Ders")
+    if current > best:
+        schedule.restore(best_state)
 
-    for day, row_offset in zip(days, [3, 15, 27, 39, 51]):
-        for slot_index, slot in enumerate(time_slots):
-            row_bm = row_offset + slot_index
-            row_sw = row_offset + 64 + slot_index
+    final = evaluate_schedule(schedule, units, weights)
+    print(f"İyileştirme bitti: amaç {current:.1f} -> en iyi {best:.1f} "
+          f"({', '.join(f'{name} {initial[name]:g}->{value:g}' for name, value in final.items())}), "
+          f"{accepted}/{tried} hamle kabul edildi.")
 
-            for class_year in range(1, 5):
-                bm_col = {1: 3, 2: 4, 3: 5, 4: 6}.get(class_year, None)
-                sw_col = {1: 3, 2: 4, 3: 5}.get(class_year, None)
+    return trim_schedule_to_layout(schedule)
 
-                if bm_col and schedule[day][slot]["Bilgisayar Mühendisliği"][class_year]:
-                    course_name = schedule[day][slot]["Bilgisayar Mühendisliği"][class_year]
-                    ws.cell(row=row_bm, column=bm_col, value=f"{course_name}\n")
-                    ws.cell(row=row_bm, column=bm_col).alignment = Alignment(wrapText=True)
 
-                if sw_col and schedule[day][slot]["Yazılım Mühendisliği"][class_year]:
-                    course_name = schedule[day][slot]["Yazılım Mühendisliği"][class_year]
-                    ws.cell(row=row_sw, column=sw_col, value=f"{course_name}\n")
-                    ws.cell(row=row_sw, column=sw_col).alignment = Alignment(wrapText=True)
+REPAIR_NEIGHBOURHOOD = int(os.environ.get("DERS_PROGRAMI_REPAIR_NEIGHBOURHOOD", "4"))
+SCHEDULE_STATE_FILE = os.environ.get("DERS_PROGRAMI_STATE", "Ders_Programi.json")
+STATE_PLACEMENT_FIELDS = ("day", "slots", "departments", "class_years", "text", "instructor_id", "course_name", "room")
 
-    wb.save("Ders_Programi.xlsx")
 
+# Derslik atamasından sonraki program onarım için JSON olarak diske yazılır: yerleşim kayıtları (derslik atamasından
+# önceki metinleri ve derslikleriyle) ve şube planı. Excel'deki her hücre metni bu kayıtlardan ve dersliklerden
+# oluşur
+def save_schedule_state(schedule, filename=None):
+    import json
 
-#Bölüme özel dersleri uygun boş saatlere yerleştirir ve excel'e kaydeder.
-def assign_department_courses(department_courses, instructor_availability, time_slots):
-    wb = openpyxl.load_workbook("Ders_Programi.xlsx")
-    ws = wb.active
+    placements = []
+    for placement in schedule.placements:
+        cells = [(placement["day"], slot, department, class_year) for slot in placement["slots"]
+                 for department in placement["departments"] for class_year in placement["class_years"]]
+        rooms = [schedule.labels[cell][1] for cell in cells if cell in schedule.labels]
+        placements.append(dict({field: placement[field] for field in STATE_PLACEMENT_FIELDS},
+                               room=rooms[0] if rooms else placement["room"]))
 
-    days = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma"]
+    state = {"time_slots": schedule.time_slots, "placements": placements,
+             "sections": schedule.sections.to_data() if schedule.sections else None}
+    with open(filename or SCHEDULE_STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
 
-    # Mevcut ders programını çek (Online ve ortak derslerin olduğu program)
-    schedule = {
-        day: {slot: {"Yazılım Mühendisliği": {1: None, 2: None, 3: None},
-                     "Bilgisayar Mühendisliği": {1: None, 2: None, 3: None, 4: None}}
-              for slot in time_slots}
-        for day in days
-    }
 
-    # Mevcut excelden dersleri al ve schedule'a kaydet
-    for day, row_offset in zip(days, [3, 15, 27, 39, 51]):
-        for slot_index, slot in enumerate(time_slots):
-            row_bm = row_offset + slot_index
-            row_sw = row_offset + 64 + slot_index
-
-            for class_year in range(1, 5):
-                bm_col = {1: 3, 2: 4, 3: 5, 4: 6}.get(class_year, None)
-                sw_col = {1: 3, 2: 4, 3: 5}.get(class_year, None)
-
-                if bm_col:
-                    existing_bm_course = ws.cell(row=row_bm, column=bm_col).value
-                    if existing_bm_course:
-                        schedule[day][slot]["Bilgisayar Mühendisliği"][class_year] = existing_bm_course
-
-                if sw_col:
-                    existing_sw_course = ws.cell(row=row_sw, column=sw_col).value
-                    if existing_sw_course:
-                        schedule[day][slot]["Yazılım Mühendisliği"][class_year] = existing_sw_course
-
-    # Öğretim üyelerinin uygun saatlerini alır
-    instructor_schedule = {instructor: {day: [] for day in days} for instructor in instructor_availability}
-
-    # Belirtilen öğretim üyesinin bu saat diliminde başka sınıfta dersi olup olmadığını kontrol eder.
-    def is_instructor_available(instructor_name, selected_day, slot):
-        for other_department in ["Bilgisayar Mühendisliği", "Yazılım Mühendisliği"]:
-            for other_class in range(1, 5):
-                assigned_course = schedule[selected_day][slot][other_department].get(other_class)
-                if assigned_course and instructor_name in assigned_course:  
-                    return False  # Eğitmen bu saatte uygun değil
-        return True  # Eğitmen bu saatte uygun
+# Kayıtlı programı güncel bölümlerle kurulan boş programa place ile yeniden yerleştirir. Artık programda olmayan
+# bölüm/sınıflara ait hücreler atlanır; dosya yoksa veya okunamazsa None döner
+def load_schedule_state(filename=None, session=None):
+    import json
 
-    # Bölüm derslerini öncelik sırasına göre sırala (Saat sayısına göre büyükten küçüğe)
-    department_courses.sort(key=lambda x: x[1], reverse=True)
-
-    for course in department_courses:
-        course_name, hours_per_week, instructor_id, class_year, department_id = course
-        instructor_name = get_instructor_name(instructor_id)
+    filename = filename or SCHEDULE_STATE_FILE
+    if not os.path.exists(filename):
+        return None
+    try:
+        with open(filename, encoding="utf-8") as f:
+            state = json.load(f)
+    except ValueError:
+        print(f"{filename} okunamadı.")
+        return None
 
-        if instructor_id not in instructor_availability:
-            print(f"Öğretim Üyesi ID {instructor_id} için uygunluk bilgisi bulunamadı. {course_name} atlanıyor.")
+    schedule = create_empty_schedule(state["time_slots"], get_departments(session))
+    class_count = schedule.cells.shape[3]
+    for placement in state["placements"]:
+        departments = [department for department in placement["departments"]
+                       if department in schedule.department_index]
+        class_years = [class_year for class_year in placement["class_years"] if 1 <= class_year <= class_count]
+        if departments and class_years:
+            record = schedule.place(placement["day"], placement["slots"], departments, class_years,
+                                    placement["text"], placement["instructor_id"], placement["course_name"])
+            record["room"] = placement["room"]
+    if state.get("sections"):
+        schedule.sections = section_plan_from_data(state["sections"])
+    return trim_schedule_to_layout(schedule)
+
+
+# Şablonlar için gün ve saat bloğu arar: öğrenci çakışması MAX_STUDENT_CLASH'ı aşmayan ilk blok, yoksa en az
+# çakışan blok. starts(gün no) o gün denenecek başlangıç saatlerini verir. Bulunan yerleşimler döner (yoksa None)
+def find_block(schedule, templates, length, starts, time_slots):
+    fallback = None
+    for day_index, day in enumerate(days):
+        for start in starts(day_index):
+            moved = [dict(template, day=day, slots=time_slots[start:start + length]) for template in templates]
+            if not placements_fit(schedule, moved):
+                continue
+            clash = schedule.clash(templates[0]["course_name"], schedule.slot_mask(day, moved[0]["slots"]))
+            if clash <= MAX_STUDENT_CLASH:
+                return moved
+            if fallback is None or clash < fallback[0]:
+                fallback = (clash, moved)
+    return fallback[1] if fallback else None
+
+
+# Değişiklik kümesinden etkilenen dersleri programdan çıkarıp yeniden yerleştirir, diğer dersler yerinde kalır.
+# changes: {"courses": ders adları, "instructors": öğretim üyesi id'leri, "enrollments": öğrenci listesi
+# değişen ders adları}. Boş blok bulunamayan bir ders için, uygun bloklarını kapatan en fazla
+# REPAIR_NEIGHBOURHOOD ders geçici olarak çıkarılır; ders yerleşip çıkarılanların hepsi başka bir bloğa
+# sığarsa bu komşuluk değişikliği tutulur, aksi halde geri alınır
+def repair_schedule(schedule, changes, instructor_availability, time_slots, units=None, session=None):
+    started = time.monotonic()
+    # Dersler, programı oluşturan aşamalarla aynı gruplama ve öğretim üyesi seçimiyle alınır
+    units = get_schedule_units(session, instructor_availability) if units is None else units
+    slot_count = len(time_slots)
+    instructors = set(changes.get("instructors", ()))
+    affected = set(changes.get("courses", ())) | set(changes.get("enrollments", ()))
+    affected |= {placement["course_name"] for placement in schedule.placements
+                 if placement["instructor_id"] in instructors and placement["course_name"] is not None}
+    affected |= {unit["name"] for unit in units if unit["instructor_id"] in instructors}
+    before = schedule.cells.copy()
+
+    removed = [placement for placement in schedule.placements if placement["course_name"] in affected]
+    # Ders hâlâ eski bloğuna sığıyorsa ilk orası denenir ki program gereksiz yere değişmesin
+    previous = {}
+    for placement in removed:
+        previous.setdefault(placement["course_name"], (placement["day"], time_slots.index(placement["slots"][0])))
+    for placement in removed:
+        schedule.remove(placement)
+
+    def unit_pins(unit):
+        if not unit["mandatory_time"]:
+            return None
+        return {time_slots.index(slot) for slot in convert_mandatory_time(unit["mandatory_time"])
+                if slot in time_slots}
+
+    pinned = {unit["name"] for unit in units if unit["mandatory_time"]}
+
+    # Yerleşim grubunun (ortak derste tüm bölümlerdeki kopyaları) kendi öğretim üyesine göre başka bloğa taşınması
+    def relocate(group):
+        instructor_id, online = group[0]["instructor_id"], "(Online)" in group[0]["text"]
+        length = len(group[0]["slots"])
+        moved = find_block(schedule, group, length,
+                           lambda day_index: block_starts(instructor_id, online, instructor_availability, day_index,
+                                                          length, slot_count), time_slots)
+        return moved and [schedule.place(placement["day"], placement["slots"], placement["departments"],
+                                         placement["class_years"], placement["text"], placement["instructor_id"],
+                                         placement["course_name"]) for placement in moved]
+
+    # Ders için verilen blokla çakışan (aynı hücre veya aynı öğretim üyesi) taşınabilir yerleşim grupları
+    def blockers(moved):
+        bits = schedule.slot_mask(moved[0]["day"], moved[0]["slots"])
+        cells = {(department, class_year) for placement in moved
+                 for department in placement["departments"] for class_year in placement["class_years"]}
+        groups = {}
+        for placement in schedule.placements:
+            if placement["day"] != moved[0]["day"] or not schedule.slot_mask(placement["day"],
+                                                                            placement["slots"]) & bits:
+                continue
+            same_instructor = placement["instructor_id"] is not None and \
+                placement["instructor_id"] == moved[0]["instructor_id"]
+            same_cell = any((department, class_year) in cells for department in placement["departments"]
+                            for class_year in placement["class_years"])
+            if not same_instructor and not same_cell:
+                continue
+            if placement["course_name"] is None or placement["course_name"] in pinned:
+                return None
+            key = (placement["course_name"], placement["instructor_id"], tuple(placement["slots"]))
+            groups.setdefault(key, []).append(placement)
+        return list(groups.values())
+
+    placed, unplaced = [], []
+    for unit in sorted((unit for unit in units if unit["name"] in affected), key=lambda unit: -unit["hours"]):
+        templates = unit_templates(schedule, unit, session)
+        length = unit["hours"]
+        if not templates or not 1 <= length <= slot_count:
+            unplaced.append(unit["name"])
             continue
-
-        assigned_hours = 0
-        assigned_slots = []
-        department = "Bilgisayar Mühendisliği" if department_id == 2 else "Yazılım Mühendisliği"
-
-        best_block = None
-        for selected_day in days:
-            available_slots = instructor_availability.get(instructor_id, {}).get(selected_day, [])
-
-            for i in range(len(available_slots) - (hours_per_week - 1)):
-                block_slots = available_slots[i:i + hours_per_week]
-                is_valid = all([
-                    slot in time_slots for slot in block_slots
-                ]) and all([
-                    is_instructor_available(instructor_name, selected_day, slot) for slot in block_slots
-                ]) and all([
-                    schedule[selected_day][slot][department].get(class_year) is None for slot in block_slots
-                ])
-
-                if is_valid:
-                    best_block = (selected_day, block_slots)
+        pins = unit_pins(unit)
+
+        def starts(day_index):
+            return block_starts(unit["instructor_id"], unit["online"], instructor_availability, day_index, length,
+                                slot_count, pins)
+
+        moved = None
+        if unit["name"] in previous:
+            day, start = previous[unit["name"]]
+            if start in starts(days.index(day)):
+                block = [dict(template, day=day, slots=time_slots[start:start + length]) for template in templates]
+                if placements_fit(schedule, block) and \
+                        schedule.clash(unit["name"], schedule.slot_mask(day, block[0]["slots"])) <= MAX_STUDENT_CLASH:
+                    moved = block
+        if moved is None:
+            moved = find_block(schedule, templates, length, starts, time_slots)
+        if moved is None:
+            # Komşuluk: dersin uygun bloklarından en az grubu çıkarmayı gerektirenler sırayla denenir
+            candidates = []
+            for day_index, day in enumerate(days):
+                for start in starts(day_index):
+                    block = [dict(template, day=day, slots=time_slots[start:start + length])
+                             for template in templates]
+                    groups = blockers(block)
+                    if groups is not None and len(groups) <= REPAIR_NEIGHBOURHOOD:
+                        candidates.append((len(groups), day_index, start, block, groups))
+            for _, _, _, block, groups in sorted(candidates, key=lambda candidate: candidate[:3]):
+                state = schedule.snapshot()
+                for group in groups:
+                    for placement in group:
+                        schedule.remove(placement)
+                if not placements_fit(schedule, block):
+                    schedule.restore(state)
+                    continue
+                for placement in block:
+                    schedule.place(placement["day"], placement["slots"], placement["departments"],
+                                   placement["class_years"], placement["text"], placement["instructor_id"],
+                                   placement["course_name"])
+                if all(relocate(group) for group in groups):
+                    moved = block
                     break
+                schedule.restore(state)
+        elif moved:
+            for placement in moved:
+                schedule.place(placement["day"], placement["slots"], placement["departments"],
+                               placement["class_years"], placement["text"], placement["instructor_id"],
+                               placement["course_name"])
+
+        if moved:
+            placed.append(unit["name"])
+        else:
+            unplaced.append(unit["name"])
+
+    schedule = trim_schedule_to_layout(schedule)
+    changed = int((schedule.cells != before).sum())
+    print(f"Onarım: {len(removed)} yerleşim çıkarıldı, {len(placed)}/{len(placed) + len(unplaced)} ders yeniden "
+          f"yerleşti, {changed} hücre değişti "
+          f"({(time.monotonic() - started) * 1000:.1f} ms).")
+    for course_name in unplaced:
+        print(f"  Yerleştirilemedi: {course_name}")
+    return schedule
 
-        if best_block:
-            selected_day, block_slots = best_block
-            for slot in block_slots:
-                schedule[selected_day][slot][department][class_year] = f"{course_name}\n{instructor_name}"
-                instructor_schedule[instructor_id][selected_day].append(slot)
-                assigned_hours += 1
-                assigned_slots.append(f"{selected_day}, {slot}, {class_year}. sınıf - {department}")
-
-    for day, row_offset in zip(days, [3, 15, 27, 39, 51]):
-        for slot_index, slot in enumerate(time_slots):
-            row_bm = row_offset + slot_index
-            row_sw = row_offset + 64 + slot_index
-
-            for class_year in range(1, 5):
-                bm_col = {1: 3, 2: 4, 3: 5, 4: 6}.get(class_year, None)
-                sw_col = {1: 3, 2: 4, 3: 5}.get(class_year, None)
 
-                if bm_col and schedule[day][slot]["Bilgisayar Mühendisliği"][class_year]:
-                    course_name = schedule[day][slot]["Bilgisayar Mühendisliği"][class_year]
-                    ws.cell(row=row_bm, column=bm_col, value=f"{course_name}\n")
-                    ws.cell(row=row_bm, column=bm_col).alignment = Alignment(wrapText=True)
+# Kayıtlı programı değişiklik kümesine göre onarıp Excel'e yazar; kayıtlı program yoksa programı baştan oluşturur
+def update_schedule(changes):
+    with db_session() as session:
+        schedule = load_schedule_state(session=session)
+    if schedule is None:
+        print(f"{SCHEDULE_STATE_FILE} bulunamadı, ders programı baştan oluşturuluyor.")
+        main()
+        return
 
-                if sw_col and schedule[day][slot]["Yazılım Mühendisliği"][class_year]:
-                    course_name = schedule[day][slot]["Yazılım Mühendisliği"][class_year]
-                    ws.cell(row=row_sw, column=sw_col, value=f"{course_name}\n")
-                    ws.cell(row=row_sw, column=sw_col).alignment = Alignment(wrapText=True)
+    # Şube planı kayıtlı programdan alınır; şubeli bir ders değiştiyse tüm şubeleri onarılır
+    sections = schedule.sections or SectionPlan()
+    changes = dict(changes)
+    for key in ("courses", "enrollments"):
+        names = set(changes.get(key, ()))
+        changes[key] = names | {section for name in names for section in sections.sections.get(name, [])}
+
+    with db_session() as session:
+        instructor_availability = get_instructor_availability(session, schedule.time_slots)
+        if changes.get("enrollments") or schedule.conflicts is None:
+            schedule.attach_conflicts(sections.expand_conflicts(build_conflict_graph(session)))
+        # Derslikler ve dersler menüden değişmiş olabilir; ayrılan derslikler güncel verilerle yeniden hesaplanır
+        schedule.attach_rooms(RoomIndex(get_classrooms(session)), sections.expand_catalog(load_course_catalog(session)))
+
+        print("\n📌 Program Değişikliklere Göre Onarılıyor.")
+        schedule = repair_schedule(schedule, changes, instructor_availability, schedule.time_slots,
+                                   sections.expand_units(get_schedule_units(session, instructor_availability)),
+                                   session=session)
+
+        print("📌 Derslikler Atanıyor.")
+        schedule = assign_classrooms(schedule, schedule.time_slots, session)
+
+    if sections.sections:
+        assign_section_students(schedule, sections)
+        write_sections_to_excel(sections)
+    save_schedule_state(schedule)
 
-    wb.save("Ders_Programi.xlsx")
+    print("\n✅ Ders Programı Excel'e Kaydediliyor.")
+    write_schedule_to_excel(schedule)
 
 
 # Derslikler
-def get_classrooms():
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT derslik_id, kapasite, statu FROM Derslikler
-    """)
+def get_classrooms(session=None):
+    with db_session(session) as session:
+        rows = session.execute("""
+            SELECT derslik_id, kapasite, statu FROM Derslikler
+        """).fetchall()
 
     classrooms = []
-    for row in cursor.fetchall():
+    for row in rows:
         classrooms.append({
             "id": row[0],
             "capacity": row[1],
             "status": row[2]
         })
 
-    conn.close()
     return classrooms
 
 
-# Dersi alan öğrenci sayısı
-def get_student_count_for_course(course_id):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT COUNT(*) FROM OgrenciDers WHERE ders_id = ?
-    """, (course_id,))
-
-    row = cursor.fetchone()
-    conn.close()
+# Derslik dizini: her statü (LAB/NORMAL) için kapasiteye göre sıralı derslikler ve her dersliğin haftalık doluluk
+# maskesi (bit = gün * saat sayısı + saat). Eşit kapasitede get_classrooms sırası korunur
+class RoomIndex:
+    def __init__(self, classrooms):
+        self.rooms = {}  # statü -> kapasiteye göre sıralı derslikler
+        for classroom in classrooms:
+            self.rooms.setdefault(classroom["status"], []).append(classroom)
+        self.capacities = {}  # statü -> rooms ile aynı sıradaki kapasiteler (ikili arama için)
+        for status, rooms in self.rooms.items():
+            rooms.sort(key=lambda x: x["capacity"])
+            self.capacities[status] = [classroom["capacity"] for classroom in rooms]
+        self.busy = {}  # derslik id -> dolu saatlerin maskesi
+
+    # Kapasitesi öğrenci sayısına yeten ilk dersliğin sırası; yeten derslik yoksa len(rooms)
+    def _first_fitting(self, status, student_count):
+        return bisect.bisect_left(self.capacities.get(status, []), student_count)
+
+    def has_room(self, status, student_count):
+        return self._first_fitting(status, student_count) < len(self.rooms.get(status, []))
+
+    # Maskedeki saatlerin hepsinde boş olan, öğrencilere yeten en küçük dersliğin id'si (yoksa None)
+    def find(self, status, student_count, bits):
+        rooms = self.rooms.get(status, [])
+        for position in range(self._first_fitting(status, student_count), len(rooms)):
+            if not self.busy.get(rooms[position]["id"], 0) & bits:
+                return rooms[position]["id"]
+        return None
 
-    return row[0] if row else 0
+    # Derslik statüye uyuyor, öğrencilere yetiyor ve maskedeki saatlerde boşsa True döner
+    def fits(self, classroom_id, status, student_count, bits):
+        for classroom in self.rooms.get(status, []):
+            if classroom["id"] == classroom_id:
+                return classroom["capacity"] >= student_count and not self.busy.get(classroom_id, 0) & bits
+        return False
+
+    def occupy(self, classroom_id, bits):
+        self.busy[classroom_id] = self.busy.get(classroom_id, 0) | bits
+
+
+# Derslik ataması için ders bilgileri (id, online, haftalık saat, statü, öğrenci sayısı) bellekte tutulur.
+# Ders adıyla aramalarda (course_id) aynı adı taşıyan kayıtlardan en küçük id'li olan kullanılır
+class CourseCatalog:
+    def __init__(self, rows):
+        self.courses = {}  # ders id -> bilgiler
+        self.ids = {}  # ders adı -> ders id
+        for course_id, course_name, online, hours, status, students in rows:
+            self.courses[course_id] = {"name": course_name, "online": online, "duration": hours,
+                                       "status": status, "students": students}
+            self.ids.setdefault(course_name, course_id)
+
+    def course_id(self, course_name):
+        return self.ids.get(course_name)
+
+    def is_online(self, course_id):
+        return int(self.courses[course_id]["online"]) == 1
+
+    def duration(self, course_id):
+        return int(self.courses[course_id]["duration"])
+
+    def status(self, course_id):
+        return self.courses[course_id]["status"]
+
+    def student_count(self, course_id):
+        return self.courses[course_id]["students"]
+
+
+# Ders kataloğunu Dersler ve ders başına OgrenciDers sayılarından tek sorguyla yükler
+def load_course_catalog(session=None):
+    with db_session(session) as session:
+        rows = session.execute("""
+            SELECT d.id, d.ders_adi, d.online, d.haftalik_saat, d.statu, COALESCE(e.ogrenci_sayisi, 0)
+            FROM Dersler d
+            LEFT JOIN (
+                SELECT ders_id, COUNT(*) AS ogrenci_sayisi FROM OgrenciDers GROUP BY ders_id
+            ) e ON e.ders_id = d.id
+            ORDER BY d.id
+        """).fetchall()
+
+    return CourseCatalog(rows)
+
+
+# Öğrenci sayısı aynı statüdeki en büyük dersliği aşan (online olmayan) dersler şubelere bölünür. Her şube ayrı bir
+# ders gibi kendi saatine yerleştirilir ve kendi dersliğini alır; dersin öğretim üyesi tüm şubelere girer
+SECTION_NAME = "{course_name} - {number}. Şube"
+SECTIONS_FILE = os.environ.get("DERS_PROGRAMI_SECTIONS_FILE", "Ders_Subeleri.xlsx")
+
+
+# Şube planı. Programa yerleştirilecek dersler, katalog ve çakışma grafiği bu plana göre genişletilir
+class SectionPlan:
+    def __init__(self, sections=None, members=None, student_courses=None, numbers=None):
+        self.sections = sections or {}  # ders adı -> şube adları
+        self.members = members or {}  # şube adı -> öğrenci id'leri
+        self.student_courses = student_courses or {}  # şubeli dersi alan öğrenci id -> aldığı ders adları
+        self.numbers = numbers or {}  # öğrenci id -> öğrenci numarası
+        self.course_of = {section: course_name for course_name, names in self.sections.items() for section in names}
+
+    # Durum dosyası için JSON'a yazılabilir biçim (öğrenci id anahtarlı eşlemeler çift listesi olarak)
+    def to_data(self):
+        return {"sections": self.sections,
+                "members": {section: sorted(students) for section, students in self.members.items()},
+                "student_courses": [[student_id, sorted(courses)]
+                                    for student_id, courses in self.student_courses.items()],
+                "numbers": [[student_id, number] for student_id, number in self.numbers.items()]}
+
+    # Öğrencinin şubeli dersteki şubesi
+    def section_of(self, student_id, course_name):
+        for section in self.sections[course_name]:
+            if student_id in self.members[section]:
+                return section
+        return None
 
+    # Öğrencinin programdaki dersleri; şubeli derslerin yerine öğrencinin şubesi yazılır
+    def student_units(self, student_id):
+        return [self.section_of(student_id, course_name) if course_name in self.sections else course_name
+                for course_name in self.student_courses[student_id]]
+
+    def expand_units(self, units):
+        expanded = []
+        for unit in units:
+            if unit["name"] in self.sections:
+                expanded.extend(dict(unit, name=section, students=len(self.members[section]),
+                                     classes=list(unit["classes"])) for section in self.sections[unit["name"]])
+            else:
+                expanded.append(unit)
+        return expanded
+
+    # Şubeler katalogda ders adı anahtarıyla, öğrenci sayısı şubenin öğrenci sayısı olarak yer alır
+    def expand_catalog(self, catalog):
+        for section, course_name in self.course_of.items():
+            course_id = catalog.course_id(course_name)
+            catalog.courses[section] = dict(catalog.courses[course_id], name=section,
+                                            students=len(self.members[section]))
+            catalog.ids[section] = section
+        return catalog
+
+    # Şubeli derslerin düğümleri yerine şube düğümleri konur; şube kenarları şube öğrencilerinin diğer
+    # derslerinden (ve diğer şubelerinden) sayılır
+    def expand_conflicts(self, conflicts):
+        import numpy
+
+        if not self.sections:
+            return conflicts
+        weights = {}
+        for name, other, weight in conflicts.edges():
+            if name not in self.sections and other not in self.sections:
+                weights[(name, other)] = weight
+        for student_id in self.student_courses:
+            units = sorted(self.student_units(student_id))
+            for i, name in enumerate(units):
+                for other in units[i + 1:]:
+                    if name in self.course_of or other in self.course_of:
+                        weights[(name, other)] = weights.get((name, other), 0) + 1
+
+        names = sorted((set(conflicts.names) - set(self.sections)) | set(self.course_of))
+        index = {name: i for i, name in enumerate(names)}
+        edges = [(index[name], index[other], weight) for (name, other), weight in weights.items()
+                 if name in index and other in index]
+        edges = numpy.array(edges, dtype=numpy.int64).reshape(-1, 3)
+        return ConflictGraph(names, edges[:, 0], edges[:, 1], edges[:, 2])
+
+
+def section_plan_from_data(data):
+    return SectionPlan(data["sections"], {section: set(students) for section, students in data["members"].items()},
+                       {student_id: set(courses) for student_id, courses in data["student_courses"]},
+                       {student_id: number for student_id, number in data["numbers"]})
+
+
+# Kapasitesi yetmeyen dersleri tek geçişte bulup şubelere böler. Şube sayısı en büyük uygun dersliğe göre
+# hesaplanır ve öğrenciler şubelere eşit sayıda dağıtılır. Diğer derslerinin çoğu aynı şubede olan öğrenciler
+# bir araya gelsin diye, diğer dersi çok olan öğrenci önce ve diğer derslerini en çok paylaştığı dolmamış şubeye
+# yazılır; böylece her şube daha az dersle çakışır
+def plan_sections(session=None, classrooms=None, catalog=None):
+    catalog = catalog or load_course_catalog(session)
+    largest = {}  # statü -> en büyük derslik kapasitesi
+    for classroom in get_classrooms(session) if classrooms is None else classrooms:
+        largest[classroom["status"]] = max(largest.get(classroom["status"], 0), classroom["capacity"])
+
+    with db_session(session) as session:
+        counts = session.execute("""
+            SELECT d.ders_adi, COUNT(DISTINCT od.ogrenci_id)
+            FROM OgrenciDers od
+            JOIN Dersler d ON d.id = od.ders_id
+            GROUP BY d.ders_adi
+        """).fetchall()
+
+        oversized = {}  # ders adı -> şube sayısı
+        for course_name, students in counts:
+            course_id = catalog.course_id(course_name)
+            if not course_id or catalog.is_online(course_id):
+                continue
+            capacity = largest.get(catalog.status(course_id))
+            if capacity and students > capacity:
+                oversized[course_name] = -(-students // capacity)
+                print(f"{course_name}: {students} öğrenci, en büyük {catalog.status(course_id)} derslik {capacity} "
+                      f"kişilik; {oversized[course_name]} şubeye bölünüyor.")
+        if not oversized:
+            return SectionPlan()
+
+        # Şubeli dersleri alan öğrencilerin tüm dersleri tek sorguyla okunur
+        rows = session.execute(f"""
+            SELECT od.ogrenci_id, o.numara, d.ders_adi
+            FROM OgrenciDers od
+            JOIN Dersler d ON d.id = od.ders_id
+            LEFT JOIN Ogrenciler o ON o.id = od.ogrenci_id
+            WHERE od.ogrenci_id IN (
+                SELECT s.ogrenci_id FROM OgrenciDers s JOIN Dersler sd ON sd.id = s.ders_id
+                WHERE sd.ders_adi IN ({", ".join("?" * len(oversized))})
+            )
+        """, tuple(oversized)).fetchall()
+
+    student_courses, numbers = {}, {}
+    for student_id, number, course_name in rows:
+        student_courses.setdefault(student_id, set()).add(course_name)
+        numbers[student_id] = number
+
+    sections, members = {}, {}
+    for course_name, count in oversized.items():
+        students = sorted(student_id for student_id, courses in student_courses.items() if course_name in courses)
+        names = [SECTION_NAME.format(course_name=course_name, number=number) for number in range(1, count + 1)]
+        size = -(-len(students) // count)
+        groups = [[] for _ in names]
+        shared = [{} for _ in names]  # şubedeki öğrencilerin diğer dersleri -> öğrenci sayısı
+        for student_id in sorted(students, key=lambda s: (-len(student_courses[s]), s)):
+            others = student_courses[student_id] - {course_name}
+            best = max((i for i in range(count) if len(groups[i]) < size),
+                       key=lambda i: (sum(shared[i].get(other, 0) for other in others), -len(groups[i]), -i))
+            groups[best].append(student_id)
+            for other in others:
+                shared[best][other] = shared[best].get(other, 0) + 1
+        sections[course_name] = names
+        members.update((name, set(group)) for name, group in zip(names, groups))
+
+    return SectionPlan(sections, members, student_courses, numbers)
+
+
+# Program bittikten sonra şubeli derslerin öğrencileri, diğer dersleriyle aynı saate en az düşecekleri şubeye
+# yeniden dağıtılır; şube mevcutları (ayrılan derslikler bunlara göre seçildi) değişmez. Öğrenciler en iyi ve
+# en kötü şubesi arasındaki farkı en büyük olandan başlayarak en iyi boş yeri olan şubeye yazılır. Yerleşmemiş
+# şube, çakışmadan daha pahalı sayılır ve çakışma toplamına katılmaz
+def assign_section_students(schedule, plan):
+    unplaced = len(schedule.days) * len(schedule.time_slots) + 1
+
+    def clashes(student_id, course_name, section):
+        bits = schedule.course_slots.get(section, 0)
+        if not bits:
+            return unplaced
+        others = 0
+        for name in plan.student_units(student_id):
+            if plan.course_of.get(name) != course_name:
+                others |= schedule.course_slots.get(name, 0)
+        return bin(bits & others).count("1")
+
+    before = after = waiting = 0
+    for course_name, names in plan.sections.items():
+        seats = [len(plan.members[name]) for name in names]
+        students = sorted(student_id for name in names for student_id in plan.members[name])
+        costs = {student_id: [clashes(student_id, course_name, name) for name in names] for student_id in students}
+        before += sum(cost for cost in (costs[student_id][names.index(plan.section_of(student_id, course_name))]
+                                        for student_id in students) if cost != unplaced)
+
+        groups = [set() for _ in names]
+        for student_id in sorted(students, key=lambda s: (min(costs[s]) - max(costs[s]), s)):
+            best = min((i for i in range(len(names)) if len(groups[i]) < seats[i]),
+                       key=lambda i: (costs[student_id][i], i))
+            groups[best].add(student_id)
+            if costs[student_id][best] == unplaced:
+                waiting += 1
+            else:
+                after += costs[student_id][best]
+        plan.members.update(zip(names, groups))
 
-# Dersler
-def get_course_id(course_name):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+    print(f"Şube öğrencileri dağıtıldı: çakışan ders saati {before} -> {after}"
+          + (f", yerleşmemiş şubelerde {waiting} öğrenci." if waiting else "."))
+    return plan
 
-    cursor.execute("""
-        SELECT id FROM Dersler WHERE ders_adi = ?
-    """, (course_name,))
 
-    row = cursor.fetchone()
-    conn.close()
+# Şube listelerini (ders, şube, öğrenci id, numara) Excel'e yazar
+def write_sections_to_excel(plan, filename=None):
+    import openpyxl
 
-    return row[0] if row else None
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Şubeler"
+    ws.append(["Ders", "Şube", "Öğrenci ID", "Öğrenci Numarası"])
+    for course_name, names in plan.sections.items():
+        for section in names:
+            for student_id in sorted(plan.members[section]):
+                ws.append([course_name, section, student_id, plan.numbers.get(student_id)])
+    wb.save(filename or SECTIONS_FILE)
+
+
+# Derslik ataması; ders bilgileri yalnızca katalogdan okunur (verilmezse bir kez yüklenir)
+def assign_classrooms_to_courses(schedule, time_slots, session=None, catalog=None):
+    rooms = RoomIndex(get_classrooms(session))
+    catalog = catalog or load_course_catalog(session)
+    course_classroom_map = {}  # Her dersin ilk atanan dersliğini tutar
 
+    # Dolu hücreler gün, saat, bölüm ve sınıf sırasıyla dolaşılır
+    for day, slot_index, department, class_year, course_info in list(schedule.items()):
+        slot = time_slots[slot_index]
 
-# Online dersler
-def get_online_status(course_id):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+        lines = course_info.split("\n")
+        course_name = lines[0]
+        instructor_name = lines[1] if len(lines) > 1 else "Bilinmeyen Eğitmen"
 
-    cursor.execute("SELECT online FROM Dersler WHERE id = ?", (course_id,))
-    row = cursor.fetchone()
-    conn.close()
+        # Dersin ID'si
+        course_id = catalog.course_id(course_name)
+        if not course_id:
+            print(f"⚠️ {course_name} için ders bulunamadı, ancak derslik ataması devam ediyor.")
+            continue
 
-    return int(row[0])
+        # Ders online mı kontrolü; hücre metni yerleşimde online_cell_text ile yazılmıştır
+        if catalog.is_online(course_id):
+            continue
 
+        # Dersin kaç saat olduğu bilgisi; derslik bu saatten itibaren gün sonunu aşmayan süre boyunca dolu sayılır
+        duration = catalog.duration(course_id)
+        bits = block_mask(schedule.day_index[day], slot_index, max(0, min(duration, len(time_slots) - slot_index)),
+                          len(time_slots))
 
-# Kayıtlı excel dosyası
-def read_courses_from_excel(filename="Ders_Programi.xlsx"):
-    wb = openpyxl.load_workbook(filename)
-    ws = wb.active
-    schedule = {}
+        if course_name in course_classroom_map:
+            classroom_id = course_classroom_map[course_name]
+        else:
+            course_status = catalog.status(course_id)
+            student_count = catalog.student_count(course_id)  #Dersin öğrenci sayısı
 
-    days = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma"]
-    row_offsets = {"Pazartesi": 3, "Salı": 15, "Çarşamba": 27, "Perşembe": 39, "Cuma": 51}
-    sw_row_offsets = {"Pazartesi": 67, "Salı": 79, "Çarşamba": 91, "Perşembe": 103, "Cuma": 115}
+            # Ders için uygun kapasitede ve statüde derslik var mı
+            if not rooms.has_room(course_status, student_count):
+                print(f"{course_name} için uygun derslik bulunamadı!")
+                continue
 
-    class_columns_bm = {1: 3, 2: 4, 3: 5, 4: 6}
-    class_columns_sw = {1: 3, 2: 4, 3: 5}
+            # Dersin süresi boyunca boş olan en küçük uygun dersliği seç
+            classroom_id = rooms.find(course_status, student_count, bits)
+            if classroom_id is None:
+                continue
+            course_classroom_map[course_name] = classroom_id
 
-    for day in days:
-        schedule[day] = {}
-        for slot in time_slots:
-            schedule[day][slot] = {
-                "Bilgisayar Mühendisliği": {1: None, 2: None, 3: None, 4: None},
-                "Yazılım Mühendisliği": {1: None, 2: None, 3: None}
-            }
+        # Dersliğin bu gün ve saatlerde dolu olduğunu kaydet
+        rooms.occupy(classroom_id, bits)
 
-            slot_index = time_slots.index(slot)
-            row_bm = row_offsets[day] + slot_index
-            row_sw = sw_row_offsets[day] + slot_index
+        # Programda dersi güncelle ve dersliği ekle
+        schedule.label(day, slot, department, class_year, f"{course_name}\n{instructor_name} ({classroom_id})",
+                       classroom_id)
 
-            for class_year in range(1, 5):
-                bm_col = class_columns_bm.get(class_year, None)
-                if bm_col:
-                    cell_value = ws.cell(row=row_bm, column=bm_col).value
-                    if cell_value:
-                        schedule[day][slot]["Bilgisayar Mühendisliği"][class_year] = cell_value.strip()
+    return schedule
 
-            for class_year in range(1, 4):
-                sw_col = class_columns_sw.get(class_year, None)
-                if sw_col:
-                    cell_value = ws.cell(row=row_sw, column=sw_col).value
-                    if cell_value:
-                        schedule[day][slot]["Yazılım Mühendisliği"][class_year] = cell_value.strip()
 
-    return schedule
+# Derslik atama motorları: "greedy" dolu hücreleri sırayla dolaşıp her derse ilk anda boş olan en küçük dersliği verir,
+# "matching" aynı saatte başlayan blokları derslik seçimi için birlikte eşleştirir
+ROOM_ENGINES = ("greedy", "matching")
+ROOM_ENGINE = os.environ.get("DERS_PROGRAMI_ROOM_ENGINE", "greedy")
 
 
-# Ders statülerini belirleme
-def get_course_status(course_id):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+def configure_rooms(engine=None):
+    global ROOM_ENGINE
+    if engine is not None:
+        ROOM_ENGINE = engine
 
-    cursor.execute("""
-        SELECT statu FROM Dersler WHERE id = ?
-    """, (course_id,))
 
-    row = cursor.fetchone()
-    conn.close()
+# Dikdörtgen maliyet matrisinde (satır sayısı <= sütun sayısı) her satıra ayrı bir sütun veren en düşük maliyetli
+# atama; her satırın sütununu döndürür. SciPy varsa linear_sum_assignment, yoksa NumPy ile yazılmış Macar
+# algoritması kullanılır
+def min_cost_assignment(cost):
+    import numpy
 
-    return row[0] if row else "NORMAL"
+    cost = numpy.asarray(cost, dtype=float)
+    try:
+        from scipy.optimize import linear_sum_assignment
+    except ImportError:
+        pass
+    else:
+        rows, columns = linear_sum_assignment(cost)
+        assignment = [None] * cost.shape[0]
+        for row, column in zip(rows, columns):
+            assignment[row] = int(column)
+        return assignment
+
+    n, m = cost.shape
+    u = numpy.zeros(n + 1)  # satır potansiyelleri
+    v = numpy.zeros(m + 1)  # sütun potansiyelleri
+    p = numpy.zeros(m + 1, dtype=int)  # sütuna atanan satır (1'den başlar, 0: boş)
+    way = numpy.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = numpy.full(m + 1, numpy.inf)
+        used = numpy.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            reduced = numpy.full(m + 1, numpy.inf)
+            reduced[1:] = cost[i0 - 1] - u[i0] - v[1:]
+            better = ~used & (reduced < minv)
+            minv[better] = reduced[better]
+            way[better] = j0
+            j1 = int(numpy.argmin(numpy.where(used, numpy.inf, minv)))
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = [None] * n
+    for column in range(1, m + 1):
+        if p[column]:
+            assignment[p[column] - 1] = column - 1
+    return assignment
+
+
+# Eşleştirmeli derslik ataması. Aynı gün art arda saatlerde aynı adla duran hücreler bir blok sayılır (ortak derslerin
+# bölümleri aynı bloğu paylaşır) ve blok süresince tek derslikte kalır. Günler saat sırasıyla taranır; aynı saatte
+# başlayan bloklar, blok boyunca boş, statüsü uyan ve öğrencilere yeten dersliklerle boşa kalan koltuk sayısını en
+# aza indirecek biçimde eşleştirilir. Önce en çok bloğa derslik verilir; eşit maliyette dersin önceki dersliği seçilir
+def assign_classrooms_by_matching(schedule, time_slots, session=None, catalog=None):
+    import numpy
+
+    classrooms = get_classrooms(session)
+    catalog = catalog or load_course_catalog(session)
+    slot_count = len(time_slots)
+
+    statuses = {}
+    room_ids = [classroom["id"] for classroom in classrooms]
+    room_capacity = numpy.array([classroom["capacity"] for classroom in classrooms], dtype=numpy.int64)
+    room_status = numpy.array([statuses.setdefault(classroom["status"], len(statuses)) for classroom in classrooms],
+                              dtype=numpy.int64)
+    # Maskeler 64 bite sığıyorsa doluluk karşılaştırmaları tek NumPy işlemiyle yapılır
+    mask_type = numpy.uint64 if len(schedule.days) * slot_count <= 64 else object
+    room_busy = numpy.zeros(len(classrooms), dtype=mask_type)
+
+    # (gün, ders adı) -> saat -> hücreler
+    course_cells = {}
+    for day, slot_index, department, class_year, course_info in list(schedule.items()):
+        lines = course_info.split("\n")
+        course_name = lines[0]
+        instructor_name = lines[1] if len(lines) > 1 else "Bilinmeyen Eğitmen"
+        course_cells.setdefault((day, course_name), {}).setdefault(slot_index, []).append(
+            (department, class_year, instructor_name))
+
+    # Bloklar: (gün, başlangıç) -> [(ders adı, ders id, saatler)]
+    blocks = {}
+    missing = set()
+    for (day, course_name), slot_cells in course_cells.items():
+        course_id = catalog.course_id(course_name)
+        if not course_id:
+            if course_name not in missing:
+                missing.add(course_name)
+                print(f"⚠️ {course_name} için ders bulunamadı, ancak derslik ataması devam ediyor.")
+            continue
 
+        if catalog.is_online(course_id):
+            continue
 
-# Haftalık toplam ders saati
-def get_course_duration(course_id):
-    conn = get_connection(database='DersProgramiDB')
-    cursor = conn.cursor()
+        run = []
+        for slot_index in sorted(slot_cells):
+            if run and slot_index != run[-1] + 1:
+                blocks.setdefault((day, run[0]), []).append((course_name, course_id, run))
+                run = []
+            run.append(slot_index)
+        blocks.setdefault((day, run[0]), []).append((course_name, course_id, run))
+
+    course_rooms = {}  # ders adı -> son verilen derslik sırası
+    for day, start in sorted(blocks, key=lambda key: (schedule.day_index[key[0]], key[1])):
+        group = blocks[(day, start)]
+        n = len(group)
+        students = numpy.array([catalog.student_count(course_id) for _, course_id, _ in group], dtype=numpy.int64)
+        status = numpy.array([statuses.get(catalog.status(course_id), -1) for _, course_id, _ in group],
+                             dtype=numpy.int64)
+        bits = numpy.array([block_mask(schedule.day_index[day], run[0], len(run), slot_count)
+                            for _, _, run in group], dtype=mask_type)
+
+        fits = ((room_capacity[None, :] >= students[:, None]) & (room_status[None, :] == status[:, None])
+                & ((room_busy[None, :] & bits[:, None]) == 0))
+        previous = numpy.array([course_rooms.get(course_name, -1) for course_name, _, _ in group])
+        changed = (numpy.arange(len(classrooms))[None, :] != previous[:, None]).astype(numpy.int64)
+
+        # Bir koltuk bile dersliği korumaktan, bir blok daha yerleşmek de tüm koltuklardan ağır basar
+        scale = n + 1
+        waste = (room_capacity[None, :] - students[:, None]) * scale + changed
+        unassigned = n * (int(room_capacity.max(initial=0)) * scale + 1) + 1
+        forbidden = unassigned * (n + 1)
+        cost = numpy.full((n, len(classrooms) + n), forbidden, dtype=numpy.int64)
+        cost[:, :len(classrooms)] = numpy.where(fits, waste, forbidden)
+        cost[numpy.arange(n), len(classrooms) + numpy.arange(n)] = unassigned
+
+        for (course_name, course_id, run), room, mask in zip(group, min_cost_assignment(cost), bits):
+            if room >= len(classrooms):
+                print(f"{course_name} için {day} {time_slots[run[0]]} saatinde uygun derslik bulunamadı!")
+                continue
+            room_busy[room] |= mask
+            course_rooms[course_name] = room
+            for slot_index in run:
+                for department, class_year, instructor_name in course_cells[(day, course_name)][slot_index]:
+                    schedule.label(day, time_slots[slot_index], department, class_year,
+                                   f"{course_name}\n{instructor_name} ({room_ids[room]})", room_ids[room])
 
-    cursor.execute("SELECT haftalik_saat FROM Dersler WHERE id = ?", (course_id,))
-    row = cursor.fetchone()
-    conn.close()
+    return schedule
 
-    return int(row[0])
 
+# Yerleştirme sırasında ayrılan derslikleri hücrelere yazar; ayrılmış dersliği olmayan hücreye (ör. çözücünün
+# blok boyunca aynı dersliğe sığdıramadığı saat) yalnızca o saat için derslik aranır
+def assign_reserved_classrooms(schedule, time_slots):
+    reserved = {}  # (ders adı, gün, saat) -> derslik id
+    for (course_name, day, slots), classroom_id in schedule.reserved_rooms.items():
+        for slot in slots:
+            reserved[(course_name, day, slot)] = classroom_id
 
-# Derslik ataması
-def assign_classrooms_to_courses(schedule, time_slots):
-    classrooms = get_classrooms()
-    course_classroom_map = {}  # Her dersin ilk atanan dersliğini tutar
-    occupied_classrooms = {}  # Hangi dersliklerin dolu olduğunu tutar
-    course_duration_map = {}  # Hangi dersin kaç saat sürdüğünü tutar
-
-    for day, slots in schedule.items():
-        for slot_index, slot in enumerate(time_slots):
-            for department, classes in schedule[day][slot].items():
-                for class_year, course_info in classes.items():
-                    if not course_info:
-                        continue
+    for day, slot_index, department, class_year, course_info in list(schedule.items()):
+        slot = time_slots[slot_index]
 
-                    lines = course_info.split("\n")
-                    course_name = lines[0]
-                    instructor_name = lines[1] if len(lines) > 1 else "Bilinmeyen Eğitmen"
+        lines = course_info.split("\n")
+        course_name = lines[0]
+        instructor_name = lines[1] if len(lines) > 1 else "Bilinmeyen Eğitmen"
 
-                    # Dersin ID'si
-                    course_id = get_course_id(course_name)
-                    if not course_id:
-                        print(f"⚠️ {course_name} için ders bulunamadı, ancak derslik ataması devam ediyor.")
-                        continue
+        course_id = schedule.catalog.course_id(course_name)
+        if not course_id:
+            print(f"⚠️ {course_name} için ders bulunamadı, ancak derslik ataması devam ediyor.")
+            continue
 
-                    # Ders online mı kontrolü
-                    online_status = get_online_status(course_id)
-                    if int(online_status) == 1:
-                        schedule[day][slot][department][class_year] = f"{course_name}\n{instructor_name} (Online)"
-                        continue
+        if schedule.catalog.is_online(course_id):
+            continue
 
-                    # Dersin kaç saat olduğu bilgisi
-                    if course_name not in course_duration_map:
-                        course_duration_map[course_name] = get_course_duration(course_id)
-                    duration = course_duration_map[course_name]
+        classroom_id = reserved.get((course_name, day, slot))
+        if classroom_id is None:
+            classroom_id = schedule.reserve_room(course_name, day, [slot])
+        if classroom_id is None:
+            print(f"{course_name} için uygun derslik bulunamadı!")
+            continue
 
-                    if course_name in course_classroom_map:
-                        classroom_id = course_classroom_map[course_name]
-                    else:
-                        course_status = get_course_status(course_id)
-                        student_count = get_student_count_for_course(course_id)  #Dersin öğrenci sayısı
-
-                        # Ders için uygun kapasitedeki derslikleri filtreleme
-                        suitable_classrooms = sorted(
-                            [c for c in classrooms if c["capacity"] >= student_count and c["status"] == course_status],
-                            key=lambda x: x["capacity"])
-
-                        if not suitable_classrooms:
-                            print(f"{course_name} için uygun derslik bulunamadı!")
-                            continue
-
-                        # İlk uygun ve müsait dersliği seç
-                        classroom_id = None
-                        for classroom in suitable_classrooms:
-                            # Eğer bu derslik başka bir dersin saatleri içinde doluysa geç
-                            is_available = True
-                            for i in range(duration):  # Dersin süresi boyunca kontrol et
-                                future_slot = time_slots[slot_index + i] if slot_index + i < len(time_slots) else None
-                                if future_slot and (day, future_slot) in occupied_classrooms and classroom["id"] in \
-                                        occupied_classrooms[(day, future_slot)]:
-                                    is_available = False
-                                    break
-
-                            if is_available:
-                                classroom_id = classroom["id"]
-                                course_classroom_map[course_name] = classroom_id
-                                break
-                        else:
-                            continue
-
-                    # Dersliğin bu gün ve saatte dolu olduğunu kaydet
-                    for i in range(duration):
-                        future_slot = time_slots[slot_index + i] if slot_index + i < len(time_slots) else None
-                        if future_slot:
-                            if (day, future_slot) not in occupied_classrooms:
-                                occupied_classrooms[(day, future_slot)] = set()
-                            occupied_classrooms[(day, future_slot)].add(classroom_id)
-
-                    # Programda dersi güncelle ve dersliği ekle
-                    schedule[day][slot][department][class_year] = f"{course_name}\n{instructor_name} ({classroom_id})"
+        schedule.label(day, slot, department, class_year, f"{course_name}\n{instructor_name} ({classroom_id})",
+                       classroom_id)
 
     return schedule
 
 
-def main():
-    print("\n📌 Dersler veritabanından çekiliyor.")
-    online_courses = get_online_courses()   #Online dersler veritabanından çekiliyor
-    common_courses = get_common_courses()  #Ortak dersler veritabanından çekiliyor
-    department_courses = get_department_courses() #Bölüme özel dersler veritabanından çekiliyor
+# Seçilen motorla derslik ataması. Programa derslik dizini bağlıysa dersliklere yerleştirme sırasında karar
+# verilmiştir ve ayrılan derslikler yazılır; matching her zaman tüm derslikleri yeniden eşleştirir
+def assign_classrooms(schedule, time_slots, session=None, engine=None):
+    engine = engine or ROOM_ENGINE
+    if engine == "matching":
+        return assign_classrooms_by_matching(schedule, time_slots, session, schedule.catalog)
+    if schedule.rooms is not None:
+        return assign_reserved_classrooms(schedule, time_slots)
+    return assign_classrooms_to_courses(schedule, time_slots, session, schedule.catalog)
 
-    print("📌 Öğretim üyelerinin uygunluk durumu alınıyor.")
-    instructor_availability = get_instructor_availability()
-    if instructor_availability is None:
-        print("Hata: Öğretim üyesi uygunluk verisi çekilemedi. Veritabanını kontrol et!")
-        exit(1)
 
-    time_slots = [
-        "09:00-10:00", "10:00-11:00", "11:00-12:00",
-        "12:00-13:00", "13:00-14:00", "14:00-15:00", "15:00-16:00",
-        "16:00-17:00", "17:00-18:00", "18:00-19:00", "19:00-20:00", "20:00-21:00"
-    ]
+# Açgözlü motor: online, ortak ve bölüme özel dersleri sırayla ilk uygun bloğa yerleştirir. Dersler aşamalara
+# burada ayrılır; böylece amaç değeri, yerleştirilen ders listesinin aynısıyla hesaplanabilir
+def assign_courses_greedy(schedule, units, instructor_availability, time_slots, session=None, order=None):
+    online_units, common_units, department_units = split_schedule_units(units)
 
-    print("📌 Ders programı oluşturuluyor ve Excel'e kaydediliyor.")
-
-    print("\n📌 Dersler Atanıyor.")
     # Online Dersleri Atama İşlevi
-    if online_courses:
-        assign_courses_to_schedule(online_courses, time_slots)
+    if online_units:
+        schedule = assign_courses_to_schedule(schedule, online_units, time_slots, session, order)
     else:
         print("Atanacak online ders bulunamadı!")
 
     # Ortak Dersleri Atama İşlevi
-    if common_courses:
-        assign_common_courses(common_courses, instructor_availability, time_slots)
+    if common_units:
+        schedule = assign_common_courses(schedule, common_units, instructor_availability, time_slots, session, order)
     else:
         print("Atanacak ortak ders bulunamadı!")
 
     # Bölüme Özel Dersleri Atama İşlevi
-    if department_courses:
-        assign_department_courses(department_courses, instructor_availability, time_slots)
+    if department_units:
+        schedule = assign_department_courses(schedule, department_units, instructor_availability, time_slots, session,
+                                             order)
     else:
         print("Atanacak bölüme özel ders bulunamadı!")
 
-    # Kaydedilen Excel'den Dersleri Okuma İşlevi
-    schedule = read_courses_from_excel()
-
-    # Derslik Ataması Yapma İşlevi
-    print("📌 Derslikler Atanıyor.")
-    schedule = assign_classrooms_to_courses(schedule, time_slots)
-
-    # Güncellenmiş Programı Excel'e Kaydet
-    print("\n✅ Ders Programı Excel'e Kaydediliyor.")
-    wb = openpyxl.load_workbook("Ders_Programi.xlsx")
-    ws = wb.active
-
-    days = ["Pazartesi", "Salı", "Çarşamba", "Perşembe", "Cuma"]
-    row_offsets = {"Pazartesi": 3, "Salı": 15, "Çarşamba": 27, "Perşembe": 39, "Cuma": 51}
-    sw_row_offsets = {"Pazartesi": 67, "Salı": 79, "Çarşamba": 91, "Perşembe": 103, "Cuma": 115}
+    return schedule
 
-    class_columns_bm = {1: 3, 2: 4, 3: 5, 4: 6}
-    class_columns_sw = {1: 3, 2: 4, 3: 5}
 
-    for day, slots in schedule.items():
-        for slot, classes in slots.items():
+# Çoklu başlatmada denenen ders sıralamaları. default mevcut sıralamadır; diğerlerinde eşitlikler tohuma bağlı
+# rastgele sırayla bozulur:
+#   constrained: uygun saati en az olan öğretim üyesinin dersleri önce
+#   enrollment: öğrencisi en çok olan dersler önce
+#   hours: haftalık saati en çok olan dersler önce
+#   random: tamamen rastgele
+COURSE_ORDERS = ("default", "constrained", "enrollment", "hours", "random")
+SEEDED_COURSE_ORDERS = COURSE_ORDERS[1:]
+
+MULTISTART_RUNS = int(os.environ.get("DERS_PROGRAMI_STARTS", "1"))
+MULTISTART_WORKERS = int(os.environ.get("DERS_PROGRAMI_START_WORKERS", str(os.cpu_count() or 1)))
+MULTISTART_SEED = int(os.environ.get("DERS_PROGRAMI_SEED", "0"))
+COURSE_ORDER = os.environ.get("DERS_PROGRAMI_ORDER", "default")
+
+
+def configure_multistart(runs=None, workers=None, seed=None, order=None):
+    global MULTISTART_RUNS, MULTISTART_WORKERS, MULTISTART_SEED, COURSE_ORDER
+    if runs is not None:
+        MULTISTART_RUNS = runs
+    if workers is not None:
+        MULTISTART_WORKERS = workers
+    if seed is not None:
+        MULTISTART_SEED = seed
+    if order is not None:
+        COURSE_ORDER = order
+
+
+# Açgözlü aşamalar için sıralama anahtarı; default için None (aşamaların kendi sıralaması) döner.
+# Eşitlik bozan sayı ders ve tohumdan türetildiği için aynı strateji ve tohum her süreçte aynı sırayı verir
+def make_course_order(strategy, seed, instructor_availability, enrollments):
+    if strategy == "default":
+        return None
+    if strategy not in COURSE_ORDERS:
+        raise ValueError(f"Bilinmeyen ders sıralaması: {strategy}")
+
+    def key(unit):
+        course_name, hours_per_week, instructor_id = unit["name"], unit["hours"], unit["instructor_id"]
+        if strategy == "constrained":
+            primary = (bin(instructor_availability.get(instructor_id, 0)).count("1"), -hours_per_week)
+        elif strategy == "enrollment":
+            primary = (-enrollments.get(course_name, 0), -hours_per_week)
+        elif strategy == "hours":
+            primary = (-hours_per_week,)
+        else:
+            primary = ()
+        return primary + (random.Random(f"{seed}:{course_name}").random(),)
+
+    return key
+
+
+# Ders adı -> derse kayıtlı öğrenci sayısı
+def course_enrollments(units):
+    enrollments = {}
+    for unit in units:
+        enrollments[unit["name"]] = enrollments.get(unit["name"], 0) + unit["students"]
+    return enrollments
+
+
+# Çoklu başlatma işçisinin süreç boyunca kullandığı salt okunur veriler
+_multistart_data = None
+
+
+def _init_multistart_worker(data):
+    global _multistart_data
+    _multistart_data = data
+    instructor_names.update(data["names"])
+    configure_conflicts(data["max_clash"])
+
+
+# Tek bir başlangıcı (strateji, tohum) işçide çalıştırıp programın amaç değerini döndürür
+def _run_multistart(start):
+    import io
+    from contextlib import redirect_stdout
+
+    strategy, seed = start
+    data = _multistart_data
+    started = time.monotonic()
+    with redirect_stdout(io.StringIO()):
+        schedule = create_empty_schedule(data["time_slots"], data["departments"])
+        schedule.attach_conflicts(data["conflicts"])
+        schedule.attach_rooms(RoomIndex(data["classrooms"]), data["catalog"])
+        order = make_course_order(strategy, seed, data["availability"], data["enrollments"])
+        schedule = assign_courses_greedy(schedule, data["units"], data["availability"], data["time_slots"],
+                                         order=order)
+        totals = evaluate_schedule(schedule, data["units"], data["weights"])
+    score = sum(data["weights"][name] * value for name, value in totals.items())
+    return strategy, seed, score, totals, time.monotonic() - started
+
+
+# Açgözlü motoru farklı ders sıralamalarıyla süreç havuzunda runs kez çalıştırır ve amaç değeri en düşük olan
+# başlangıcın (strateji, tohum) ikilisini döndürür. Tohumdan bağımsız olan default yalnızca ilk başlangıçta
+# denenir; sonraki i. başlangıç SEEDED_COURSE_ORDERS[(i - 1) % 4] stratejisini ve seed + i tohumunu kullanır.
+# Aynı ikili --order/--seed ile tek başına çalıştırılarak sonuç yeniden üretilebilir.
+# Yüklenen veriler işçilere bir kez, başlatılırken aktarılır
+def run_multistart(instructor_availability, time_slots, units, conflicts, runs=None, workers=None, seed=None,
+                   session=None, catalog=None, classrooms=None):
+    from concurrent.futures import ProcessPoolExecutor
+
+    runs = MULTISTART_RUNS if runs is None else runs
+    workers = MULTISTART_WORKERS if workers is None else workers
+    seed = MULTISTART_SEED if seed is None else seed
+
+    data = {
+        "availability": instructor_availability, "time_slots": list(time_slots), "units": units,
+        "departments": get_departments(session),
+        "conflicts": conflicts, "enrollments": course_enrollments(units), "names": load_instructor_names(session),
+        "weights": OPTIMIZE_OBJECTIVE, "max_clash": MAX_STUDENT_CLASH,
+        "classrooms": classrooms or get_classrooms(session), "catalog": catalog or load_course_catalog(session),
+    }
+    starts = [("default", seed)] + [(SEEDED_COURSE_ORDERS[(i - 1) % len(SEEDED_COURSE_ORDERS)], seed + i)
+                                    for i in range(1, runs)]
+    workers = max(1, min(workers, runs))
+
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_multistart_worker, initargs=(data,)) as pool:
+        results = list(pool.map(_run_multistart, starts, chunksize=max(1, runs // (workers * 4))))
+
+    print(f"{'Sıralama':<12} {'Deneme':>7} {'En iyi amaç':>12} {'Ort. süre (sn)':>15}")
+    for strategy in COURSE_ORDERS:
+        strategy_results = [result for result in results if result[0] == strategy]
+        if strategy_results:
+            print(f"{strategy:<12} {len(strategy_results):>7} {min(r[2] for r in strategy_results):>12.1f} "
+                  f"{sum(r[4] for r in strategy_results) / len(strategy_results):>15.3f}")
+
+    # Eşit amaçta önceki başlangıç (ilk olarak default) seçilir
+    strategy, best_seed, score, totals, _ = min(results, key=lambda result: result[2])
+    print(f"En iyi başlangıç: --order {strategy} --seed {best_seed}, amaç {score:.1f} "
+          f"({', '.join(f'{name} {value:g}' for name, value in totals.items())}); "
+          f"{runs} başlangıç, {workers} süreç, {time.monotonic() - started:.2f} sn.")
+    return strategy, best_seed
+
+
+SCHEDULE_ENGINE = os.environ.get("DERS_PROGRAMI_ENGINE", "greedy")
+
+
+# engine: "greedy" sırayla online, ortak ve bölüm derslerini yerleştiren aşamaları,
+# "cpsat" tüm dersleri tek modelde yerleştiren çözücüyü kullanır
+def main(engine=None):
+    engine = engine or SCHEDULE_ENGINE
+    # Programlama boyunca tüm sorgular havuzdan alınan tek oturumu kullanır
+    with db_session() as session:
+        print("\n📌 Öğretim üyelerinin uygunluk durumu alınıyor.")
+        instructor_availability = get_instructor_availability(session)
+        if instructor_availability is None:
+            print("Hata: Öğretim üyesi uygunluk verisi çekilemedi. Veritabanını kontrol et!")
+            sys.exit(1)
+
+        print("📌 Dersler veritabanından çekiliyor.")
+        # Açgözlü motor ve çözücü aynı ders tanımını kullanır
+        units = get_schedule_units(session, instructor_availability)
+
+        # Derslikler bir kez okunur; şube planı, derslik ayırma, çözücü ve çoklu başlatma aynı listeyi kullanır
+        classrooms = get_classrooms(session)
+
+        # Öğrencileri en büyük dersliğe sığmayan dersler şubelere bölünür, şubeler ayrı dersler gibi yerleştirilir
+        catalog = load_course_catalog(session)
+        sections = plan_sections(session, classrooms, catalog)
+        units = sections.expand_units(units)
+        catalog = sections.expand_catalog(catalog)
+
+        print("📌 Ders programı oluşturuluyor ve Excel'e kaydediliyor.")
+
+        print("\n📌 Dersler Atanıyor.")
+        # Tüm aşamalar aynı program üzerinde çalışır, Excel yalnızca en sonda yazılır
+        schedule = create_empty_schedule(time_slots, get_departments(session))
+
+        # Ortak öğrencisi olan dersler aynı saate düşmesin diye çakışma grafiği programa bağlanır
+        conflicts = sections.expand_conflicts(build_conflict_graph(session))
+        schedule.attach_conflicts(conflicts)
+        # Derslik bulunamayacak bloklar yerleştirme sırasında elenir, dersliği yerleşen her bloğa ayrılır
+        schedule.attach_rooms(RoomIndex(classrooms), catalog)
+        schedule.sections = sections
+
+        if engine == "cpsat":
             try:
-                slot_index = time_slots.index(slot)
-            except ValueError:
-                continue
-
-            row_num_bm = row_offsets[day] + slot_index
-            row_num_sw = sw_row_offsets[day] + slot_index
+                schedule = assign_courses_with_solver(schedule, units, instructor_availability, time_slots, classrooms,
+                                                      conflicts=conflicts, session=session)
+            except ImportError as e:
+                print(f"Hata: {e}")
+                sys.exit(1)
+        else:
+            strategy, seed = COURSE_ORDER, MULTISTART_SEED
+            if MULTISTART_RUNS > 1:
+                print(f"📌 {MULTISTART_RUNS} farklı ders sıralaması deneniyor.")
+                strategy, seed = run_multistart(instructor_availability, time_slots, units, conflicts,
+                                                session=session, catalog=catalog, classrooms=classrooms)
+            # En iyi başlangıç aynı sıralama ve tohumla bu süreçte yeniden çalıştırılır
+            order = make_course_order(strategy, seed, instructor_availability, course_enrollments(units))
+            schedule = assign_courses_greedy(schedule, units, instructor_availability, time_slots, session, order)
+
+        if OPTIMIZE_BUDGET > 0:
+            print("📌 Program İyileştiriliyor.")
+            schedule = optimize_schedule(schedule, instructor_availability, time_slots, units, seed=MULTISTART_SEED,
+                                         session=session)
+
+        # Derslik Ataması Yapma İşlevi
+        print("📌 Derslikler Atanıyor.")
+        schedule = assign_classrooms(schedule, time_slots, session)
+
+    if sections.sections:
+        print("📌 Şube Öğrencileri Atanıyor.")
+        assign_section_students(schedule, sections)
+        write_sections_to_excel(sections)
+
+    # Derslikleriyle birlikte program, değişikliklerde onarım için saklanır
+    save_schedule_state(schedule)
 
-            # Bilgisayar Mühendisliği'ni yaz
-            for class_year, course_name in classes["Bilgisayar Mühendisliği"].items():
-                if course_name and class_year in class_columns_bm:
-                    ws.cell(row=row_num_bm, column=class_columns_bm[class_year], value=f"{course_name}\n")
-                    ws.cell(row=row_num_bm, column=class_columns_bm[class_year]).alignment = Alignment(wrapText=True)
+    # Güncellenmiş Programı Excel'e Kaydet
+    print("\n✅ Ders Programı Excel'e Kaydediliyor.")
+    write_schedule_to_excel(schedule)
 
-            # Yazılım Mühendisliği'ni yaz
-            for class_year, course_name in classes["Yazılım Mühendisliği"].items():
-                if course_name and class_year in class_columns_sw:
-                    ws.cell(row=row_num_sw, column=class_columns_sw[class_year], value=f"{course_name}\n")
-                    ws.cell(row=row_num_sw, column=class_columns_sw[class_year]).alignment = Alignment(wrapText=True)
 
-    wb.save("Ders_Programi.xlsx")
+# Menüde yapılan değişikliklerin kümesine yeni değişikliği ekler
+def merge_changes(changes, change):
+    for key, values in (change or {}).items():
+        changes.setdefault(key, set()).update(values)
 
 
 def menu():
+    # Programı onarmak için biriken değişiklikler (ders adları, öğretim üyesi id'leri, öğrenci listesi değişen dersler)
+    changes = {}
     while True:
         print("\nİşlemi Seçiniz")
         print("Fakülte İşlemleri:")
@@ -1999,9 +4199,11 @@ def menu():
         print("\nÖğrenci-Ders İşlemleri:")
         print("13. Öğrenci-Ders Ekle")
         print("14. Öğrenci-Ders Sil")
+        print("\nProgram İşlemleri:")
+        print("16. Ders Programını Değişikliklere Göre Güncelle")
         print("\n15. Çıkış")
 
-        choice = input("Enter your choice (1-15): ").strip()
+        choice = input("Enter your choice (1-16): ").strip()
 
         if choice == '1':
             add_faculty()
@@ -2014,7 +4216,7 @@ def menu():
         elif choice == '5':
             add_instructor()
         elif choice == '6':
-            delete_instructor()
+            merge_changes(changes, delete_instructor())
         elif choice == '7':
             add_student()
         elif choice == '8':
@@ -2024,18 +4226,111 @@ def menu():
         elif choice == '10':
             delete_classroom()
         elif choice == '11':
-            add_course()
+            merge_changes(changes, add_course())
         elif choice == '12':
-            delete_course()
+            merge_changes(changes, delete_course())
         elif choice == '13':
-            add_student_course()
+            merge_changes(changes, add_student_course())
         elif choice == '14':
-            delete_student_course()
+            merge_changes(changes, delete_student_course())
         elif choice == '15':
             print("Exiting the program.")
             break
+        elif choice == '16':
+            if changes:
+                update_schedule(changes)
+                changes = {}
+            else:
+                print("Programı etkileyen bir değişiklik yapılmadı.")
         else:
-            print("Invalid choice. Please enter a number between 1 and 15.")
+            print("Invalid choice. Please enter a number between 1 and 16.")
+
+
+# Komut satırı giriş noktası; her alt komut yalnızca kendi işini yapar
+def cli(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Haftalık ders programı oluşturma aracı")
+    parser.add_argument("--backend", choices=["mssql", "sqlite"],
+                        help="Veritabanı motoru (varsayılan: DERS_PROGRAMI_DB ortam değişkeni veya mssql)")
+    parser.add_argument("--sqlite-path", help="SQLite veritabanı dosyası (varsayılan: DersProgramiDB.sqlite3)")
+    parser.add_argument("--server", help="SQL Server sunucu adı")
+    parser.add_argument("--pool-size", type=int, help="Bağlantı havuzundaki en fazla bağlantı sayısı")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("init-db", help="Veritabanını ve tabloları oluşturur")
+    import_parser = subparsers.add_parser("import", help="Excel dosyalarını veritabanına aktarır")
+    import_parser.add_argument("--force", action="store_true",
+                               help="Değişmemiş dosya ve satırları da yeniden aktarır")
+    import_parser.add_argument("--batch-size", type=int,
+                               help="Kaç satırda bir commit edileceği (varsayılan: 5000, 0: aşama sonunda)")
+    import_parser.add_argument("--atomic", action="store_true",
+                               help="Her aşamayı tek işlemde aktarır, hata olursa aşamanın tamamı geri alınır")
+    import_parser.add_argument("--workers", type=int,
+                               help="Paralel çalışan ayrıştırma/aktarma iş parçacığı sayısı (varsayılan: 4)")
+    schedule_parser = subparsers.add_parser("schedule", help="Ders programını oluşturup Ders_Programi.xlsx'e kaydeder")
+    schedule_parser.add_argument("--engine", choices=["greedy", "cpsat"],
+                                 help="Yerleştirme motoru (varsayılan: greedy; cpsat için OR-Tools gerekir)")
+    schedule_parser.add_argument("--time-limit", type=float, help="Çözücü için süre sınırı, saniye (varsayılan: 30)")
+    schedule_parser.add_argument("--solver-workers", type=int, help="Çözücünün kullanacağı iş parçacığı sayısı")
+    schedule_parser.add_argument("--max-clash", type=int,
+                                 help="Aynı saate düşen iki dersin izin verilen ortak öğrenci sayısı (varsayılan: 0)")
+    schedule_parser.add_argument("--optimize", type=float, metavar="SANIYE",
+                                 help="Yerleştirmeden sonra programı bu kadar süre iyileştirir (varsayılan: 0, kapalı)")
+    schedule_parser.add_argument("--objective", type=parse_objective,
+                                 help="İyileştirme amacı, terim=ağırlık listesi "
+                                      "(varsayılan: unplaced=100,clash=10,gaps=1,late=2)")
+    schedule_parser.add_argument("--starts", type=int,
+                                 help="Açgözlü motoru bu kadar farklı ders sıralamasıyla paralel çalıştırıp en iyisini "
+                                      "seçer (varsayılan: 1)")
+    schedule_parser.add_argument("--start-workers", type=int,
+                                 help="Çoklu başlatmada kullanılacak süreç sayısı (varsayılan: çekirdek sayısı)")
+    schedule_parser.add_argument("--order", choices=COURSE_ORDERS,
+                                 help="Tek çalıştırmada kullanılacak ders sıralaması (varsayılan: default)")
+    schedule_parser.add_argument("--seed", type=int,
+                                 help="Sıralamalardaki eşitlik bozma, çoklu başlatma ve iyileştirme için tohum "
+                                      "(varsayılan: 0)")
+    schedule_parser.add_argument("--rooms", choices=ROOM_ENGINES,
+                                 help="Derslik atama motoru (varsayılan: greedy; matching aynı saatte başlayan "
+                                      "dersleri birlikte eşleştirir)")
+    repair_parser = subparsers.add_parser("repair", help="Kayıtlı programda yalnızca değişen dersleri yeniden "
+                                                         "yerleştirip Ders_Programi.xlsx'i günceller")
+    repair_parser.add_argument("--course", action="append", default=[], help="Eklenen/değişen/silinen ders adı")
+    repair_parser.add_argument("--instructor", action="append", type=int, default=[],
+                               help="Uygunluğu değişen veya silinen öğretim üyesi id'si")
+    repair_parser.add_argument("--enrollment", action="append", default=[], help="Öğrenci listesi değişen ders adı")
+    repair_parser.add_argument("--rooms", choices=ROOM_ENGINES, help="Derslik atama motoru (varsayılan: greedy)")
+    subparsers.add_parser("menu", help="Kayıt ekleme/silme menüsünü açar")
+    args = parser.parse_args(argv)
+    configure_storage(args.backend, sqlite_path=args.sqlite_path, server=args.server)
+    configure_pool(size=args.pool_size)
+
+    if args.command == "init-db":
+        create_database()
+        create_tables()
+    elif args.command == "import":
+        configure_import(batch_size=args.batch_size, atomic=args.atomic or None)
+        run_imports(force=args.force, workers=args.workers)
+    elif args.command == "schedule":
+        configure_solver(time_limit=args.time_limit, workers=args.solver_workers)
+        configure_conflicts(max_clash=args.max_clash)
+        configure_optimizer(budget=args.optimize, objective=args.objective)
+        configure_multistart(runs=args.starts, workers=args.start_workers, seed=args.seed, order=args.order)
+        configure_rooms(engine=args.rooms)
+        main(engine=args.engine)
+    elif args.command == "repair":
+        configure_rooms(engine=args.rooms)
+        update_schedule({"courses": set(args.course), "instructors": set(args.instructor),
+                         "enrollments": set(args.enrollment)})
+    elif args.command == "menu":
+        menu()
+    else:
+        # Alt komut verilmezse tüm adımlar eskisi gibi sırayla çalışır
+        create_database()
+        create_tables()
+        run_imports()
+        menu()
+        main()
+
 
-menu()
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    cli()
\ No newline at end of file
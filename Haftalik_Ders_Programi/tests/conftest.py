@@ -0,0 +1,37 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+import main  # noqa: E402
+
+WORKBOOKS = ["Ogrenciler.xlsx", "OgretimUyeleri.xlsx", "Derslikler.xlsx", "Dersler.xlsx", "Ogrenci_Ders.xlsx"]
+
+
+# Örnek Excel dosyalarını geçici dizine kopyalar ve testi bu dizinde çalıştırır
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    for name in WORKBOOKS:
+        shutil.copy(os.path.join(PROJECT_DIR, name), tmp_path / name)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+# Geçici dizinde tabloları oluşturulmuş boş bir SQLite veritabanı
+@pytest.fixture
+def storage(workdir):
+    storage = main.configure_storage("sqlite", sqlite_path=str(workdir / "DersProgramiDB.sqlite3"))
+    main.create_tables()
+    yield storage
+    main.close_pools()
+
+
+# Örnek dosyaların tamamı aktarılmış veritabanı
+@pytest.fixture
+def database(storage):
+    main.run_imports()
+    return storage
@@ -0,0 +1,31 @@
+import main
+
+
+def fetch(query, params=()):
+    with main.db_session() as session:
+        return session.execute(query, params).fetchall()
+
+
+# Dersler.xlsx'te adı sonunda boşlukla yazılan öğretim üyesi, OgretimUyeleri.xlsx'teki kayıtla eşleşmeli
+def test_trailing_space_instructor_resolves_to_existing_row(database):
+    names = [name for _, name in fetch("SELECT id, ogretim_gorevlisi FROM OgretimGorevlileri")]
+    assert len(names) == len({name.strip() for name in names})
+    assert "Dr. Öğr. Üyesi Mehmet KARA " not in names
+
+    rows = fetch("""
+        SELECT o.pazartesi FROM Dersler d JOIN OgretimGorevlileri o ON o.id = d.ogretim_uyesi_id
+        WHERE d.ders_kodu = ?
+    """, ("BLM317",))
+    assert rows and all(availability is not None for availability, in rows)
+
+
+# Aynı dosyalar tekrar aktarıldığında (zorla yeniden aktarımda da) hiçbir tabloda satır eklenmemeli
+def test_reimport_is_idempotent(database):
+    tables = ["Fakulte", "Bolumler", "OgretimGorevlileri", "Ogrenciler", "Dersler", "OgrenciDers", "Derslikler"]
+    snapshot = {table: sorted(map(tuple, fetch(f"SELECT * FROM {table}"))) for table in tables}
+
+    main.run_imports()
+    assert {table: sorted(map(tuple, fetch(f"SELECT * FROM {table}"))) for table in tables} == snapshot
+
+    main.run_imports(force=True)
+    assert {table: sorted(map(tuple, fetch(f"SELECT * FROM {table}"))) for table in tables} == snapshot
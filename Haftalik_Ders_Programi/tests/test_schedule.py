@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import main
+
+
+# Kayıtlı programdaki yerleşimlerin (gün, saat) hücrelerini ve öğretim üyelerini dolaşıp çakışmaları döndürür
+def double_bookings(schedule):
+    cells, instructors, clashes = {}, {}, []
+    for placement in schedule.placements:
+        for slot in placement["slots"]:
+            for department in placement["departments"]:
+                for class_year in placement["class_years"]:
+                    cell = (placement["day"], slot, department, class_year)
+                    if cell in cells:
+                        clashes.append(cell)
+                    cells[cell] = placement["course_name"]
+            # Ortak ders her bölüm için ayrı yerleşimdir; aynı öğretim üyesinin farklı bir dersi çakışmadır
+            if placement["instructor_id"] is not None:
+                key = (placement["day"], slot, placement["instructor_id"])
+                if instructors.setdefault(key, placement["course_name"]) != placement["course_name"]:
+                    clashes.append(key)
+    return clashes
+
+
+# Her dersin yerleşmeyen saatleri, yerleşimlerin kapladığı (gün, saat) ikililerinden sayılır
+def missing_hours(schedule, units):
+    placed = {}
+    for placement in schedule.placements:
+        placed.setdefault(placement["course_name"], set()).update(
+            (placement["day"], slot) for slot in placement["slots"])
+    return sum(max(0, unit["hours"] - len(placed.get(unit["name"], ()))) for unit in units)
+
+
+# Yerleşimleri sıradan bağımsız karşılaştırmak için
+def canonical(placements):
+    return sorted(json.dumps(placement, sort_keys=True) for placement in placements)
+
+
+def schedule_units():
+    with main.db_session() as session:
+        return main.get_schedule_units(session, main.get_instructor_availability(session))
+
+
+@pytest.mark.parametrize("engine", ["greedy", "cpsat"])
+def test_schedule_has_no_double_bookings(database, engine):
+    if engine == "cpsat":
+        pytest.importorskip("ortools")
+    main.main(engine)
+
+    schedule = main.load_schedule_state()
+    assert schedule.placements
+    assert double_bookings(schedule) == []
+
+
+# Kayıtlı program aynı yerleşimlerle geri yüklenmeli; değişmeyen bir dersin onarımı programı değiştirmemeli
+def test_state_round_trip_and_repair(database):
+    main.main("greedy")
+    with open(main.SCHEDULE_STATE_FILE, encoding="utf-8") as f:
+        saved = json.load(f)["placements"]
+
+    schedule = main.load_schedule_state()
+    restored = [{field: placement[field] for field in main.STATE_PLACEMENT_FIELDS}
+                for placement in schedule.placements]
+    assert restored == saved
+
+    main.update_schedule({"courses": {"YAPAY ZEKA"}})
+    with open(main.SCHEDULE_STATE_FILE, encoding="utf-8") as f:
+        repaired = json.load(f)["placements"]
+    assert canonical(repaired) == canonical(saved)
+
+
+# İyileştirmenin yerleşmeyen saat terimi, programda gerçekten eksik kalan ders saatine eşit olmalı
+def test_optimizer_counts_unplaced_hours(database):
+    main.main("greedy")
+    schedule = main.load_schedule_state()
+    units = schedule_units()
+    with main.db_session() as session:
+        availability = main.get_instructor_availability(session, schedule.time_slots)
+        schedule.attach_conflicts(main.build_conflict_graph(session))
+        schedule = main.optimize_schedule(schedule, availability, schedule.time_slots, units, budget=0.5, seed=1,
+                                          session=session)
+
+    expected = missing_hours(schedule, units)
+    assert expected > 0
+    assert main.evaluate_schedule(schedule, units, {"unplaced": 1})["unplaced"] == expected